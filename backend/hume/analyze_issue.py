@@ -1,72 +1,131 @@
 import modal
 import os
 import json
+import sys
+import time
+import asyncio
+from pathlib import Path
 from typing import Optional, Dict, Any
 
+# backend/shared holds modules used by both the analyzer and detector services
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.circuit_breaker import BreakerConfig, CircuitBreaker, CircuitOpenError
+from shared.geo import Gazetteer
+from shared.llm_json import ExtractionError, StreamingJSONExtractor
+from shared.tracing import METRICS_CONTENT_TYPE, REGISTRY, TimingMiddleware, record, span
+from shared.volume_sync import volume_sync
+from batch_jobs import (
+    AnthropicBatchBackend,
+    ConcurrentBackend,
+    InlineDispatcher,
+    LocalBackend,
+    ModalDispatcher,
+    batch_status,
+    make_analyze_batch_handler,
+    route_issue_locally
+)
+from issue_index import IssueIndex
+from job_queue import JobQueue, JobWorker, RetryableError
+from clients import (
+    HUME_CREDENTIALS,
+    TWILIO_CREDENTIALS,
+    get_twilio_client,
+    log_missing_credentials,
+    missing_credentials,
+    run_blocking
+)
+
 # Create Modal image with all required packages
 image = modal.Image.debian_slim().pip_install([
     "anthropic",  # Pin to a specific version
     "fastapi", 
     "python-multipart",
     "twilio"  # Add Twilio for Hume AI integration
-])
+]).add_local_python_source("batch_jobs", "clients", "fake_twilio", "issue_index", "job_queue", "shared")
+
+# Batch analysis settings for /analyze/batch
+BATCH_BACKEND = os.environ.get("ANALYZE_BATCH_BACKEND", "concurrent")
+BATCH_CONCURRENCY = int(os.environ.get("ANALYZE_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.environ.get("ANALYZE_BATCH_MAX_ITEMS", "1000"))
+# Chunks run in spawned analyze_batch_chunk calls ("modal") or as tasks in the api process ("local")
+BATCH_DISPATCH = os.environ.get("ANALYZE_BATCH_DISPATCH", "modal")
+BATCH_CHUNK_SIZE = int(os.environ.get("ANALYZE_BATCH_CHUNK_SIZE", "50"))
+BATCH_POLL_INTERVAL = float(os.environ.get("ANALYZE_BATCH_POLL_INTERVAL", "10"))
+
+# Durable queue behind /analyze-and-call, kept on a volume so jobs survive restarts.
+# The SQLite files are only consistent with one writer, so the api function runs in a single container.
+jobs_volume = modal.Volume.from_name("issue-analyzer-jobs", create_if_missing=True)
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", "/data/jobs.db")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+
+# Spatial index of analyzed issues and the offline gazetteer (name,lat,lon CSV) used to place them
+ISSUE_DB_PATH = os.environ.get("ISSUE_DB_PATH", "/data/issues.db")
+GAZETTEER_PATH = os.environ.get("GAZETTEER_PATH", "/data/nyc_gazetteer.csv")
+# Issues already reported this close to a new one are returned with it, for deduplication
+DEDUP_RADIUS_M = float(os.environ.get("DEDUP_RADIUS_M", "50"))
+
+# Fields every recommendation returned by Claude must carry
+RECOMMENDATION_SCHEMA = {
+    "selectedOrganization": str,
+    "organizationId": (int, str, type(None)),
+    "justification": str,
+    "callScript": str
+}
+
+ANALYSIS_MODEL = "claude-3-haiku-20240307"
+
+async def probe_claude() -> None:
+    """Smallest possible request, to tell when Claude is reachable again; real calls then decide whether to close"""
+    import anthropic
+
+    client = anthropic.AsyncAnthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+    await client.messages.create(
+        model=ANALYSIS_MODEL,
+        max_tokens=1,
+        messages=[{"role": "user", "content": "ping"}]
+    )
+
+# While Claude is slow or failing, issues are routed by keyword (batch_jobs.route_issue_locally) instead.
+# Haiku streams roughly 100-150 tokens/s: a typical answer takes a few seconds, while a full
+# 4095-token one can take 30-40s, so the budget only trips on sustained slowness and the timeout
+# does not cut off long but healthy answers.
+LLM_BREAKER = CircuitBreaker(
+    "issue_llm",
+    BreakerConfig.from_env("ISSUE_LLM_", latency_budget=30.0, timeout=60.0),
+    probe=probe_claude
+)
+# Batch chunks have their own breaker, so a large batch can't push interactive /analyze into
+# keyword routing, and batch items only degrade when Claude is failing outright
+BATCH_LLM_BREAKER = CircuitBreaker(
+    "issue_batch_llm",
+    BreakerConfig.from_env("ISSUE_BATCH_LLM_", latency_budget=60.0, timeout=120.0),
+    probe=probe_claude
+)
 
 # Create Modal app
 app = modal.App("nyc-issue-analyzer-with-hume")
 
-class IssueAnalyzer:
-    def __init__(self):
-        # Check for Anthropic API key
-        self.api_key = os.environ.get("ANTHROPIC_API_KEY")
-        if not self.api_key:
-            print("Warning: ANTHROPIC_API_KEY not found in environment variables")
-            
-        # Check for Twilio credentials
-        self.twilio_account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
-        self.twilio_auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
-        self.twilio_phone_number = os.environ.get("TWILIO_PHONE_NUMBER")
-        
-        # Check for Hume AI credentials
-        self.hume_config_id = os.environ.get("HUME_CONFIG_ID")
-        self.hume_api_key = os.environ.get("HUME_API_KEY")
-            
-    @modal.method()
-    async def analyze_issue(
-        self,
-        title: str,
-        description: str,
-        severity: str,
-        tags: str,
-        location: str,
-        photo_info: Optional[str] = None
-    ) -> Dict[str, Any]:
-        """
-        Analyze an issue using Claude to determine which NYC city organization should handle it
-        and generate a call script for Hume AI.
-        """
-        try:
-            # Import here inside the method to avoid any Modal environment issues
-            import anthropic
-            
-            if not self.api_key:
-                return {
-                    "error": "ANTHROPIC_API_KEY not configured",
-                    "recommendation": {
-                        "selectedOrganization": "NYC 311 Service",
-                        "organizationId": 1,
-                        "justification": "Default recommendation due to missing API key",
-                        "callScript": f"Hello, I'd like to report an issue: {title}. The issue is located at: {location}."
-                    }
-                }
-                
-            # Initialize Anthropic client 
-            client = anthropic.Anthropic(
-            api_key=self.api_key,
-            # Remove any auto-configured proxies
-            )
-            
-            # Prepare the prompt with real values
-            prompt = f"""You are an AI assistant for New York City's issue reporting system. Your task is to analyze reported issues, determine which city organization should handle them (if any), and create a brief call script for use with Hume AI.
+def default_recommendation(title: str, location: str, justification: str) -> Dict[str, Any]:
+    """Fallback recommendation that routes the issue to NYC 311"""
+    return {
+        "selectedOrganization": "NYC 311 Service",
+        "organizationId": 1,
+        "justification": justification,
+        "callScript": f"Hello, I'd like to report an issue: {title}. The issue is located at: {location}."
+    }
+
+def build_analysis_prompt(
+    title: str,
+    description: str,
+    severity: str,
+    tags: str,
+    location: str,
+    photo_info: Optional[str] = None
+) -> str:
+    """Build the Claude prompt that picks an organization and drafts a call script"""
+    return f"""You are an AI assistant for New York City's issue reporting system. Your task is to analyze reported issues, determine which city organization should handle them (if any), and create a brief call script for use with Hume AI.
 
 First, review the list of city organizations and their responsibilities:
 
@@ -199,11 +258,98 @@ After your analysis, present your recommendation in a JSON format with the follo
 }}
 
 Ensure that your JSON response clearly distinguishes between cases where an organization is recommended and cases where no reporting is deemed necessary. The call script should be a concise set of talking points or questions based on the issue evaluation and recommendation."""
+
+def new_recommendation_extractor() -> StreamingJSONExtractor:
+    """Extractor that skips the <issue_analysis> reasoning and validates the recommendation"""
+    return StreamingJSONExtractor(schema=RECOMMENDATION_SCHEMA, skip_tags=("issue_analysis",))
+
+def build_analysis_result(
+    extractor: StreamingJSONExtractor,
+    response_text: str,
+    title: str,
+    location: str
+) -> Dict[str, Any]:
+    """Assemble the analysis response from an extractor that has seen Claude's output"""
+    try:
+        recommendation = extractor.result()
+    except ExtractionError as e:
+        print(f"Error parsing JSON recommendation: {e}")
+        recommendation = default_recommendation(title, location, "Default due to parsing error")
+    
+    return {
+        "analysis": extractor.tag_text("issue_analysis"),
+        "recommendation": recommendation,
+        "raw_response": response_text
+    }
+
+def parse_analysis_response(response_text: str, title: str, location: str) -> Dict[str, Any]:
+    """Split Claude's response into the analysis section and the JSON recommendation"""
+    extractor = new_recommendation_extractor()
+    extractor.feed(response_text)
+    return build_analysis_result(extractor, response_text, title, location)
+
+class IssueAnalyzer:
+    def __init__(self, breaker: Optional[CircuitBreaker] = None):
+        self.breaker = breaker or LLM_BREAKER
+        
+        # Credentials are read here and reported once at app startup (see check_credentials)
+        self.api_key = os.environ.get("ANTHROPIC_API_KEY")
             
-            # Call Claude API in the simplest way
-            try:
-                message = client.messages.create(
-                    model="claude-3-haiku-20240307",  # Use available model
+        # Check for Twilio credentials
+        self.twilio_account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
+        self.twilio_auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
+        self.twilio_phone_number = os.environ.get("TWILIO_PHONE_NUMBER")
+        
+        # Check for Hume AI credentials
+        self.hume_config_id = os.environ.get("HUME_CONFIG_ID")
+        self.hume_api_key = os.environ.get("HUME_API_KEY")
+            
+    @modal.method()
+    async def analyze_issue(
+        self,
+        title: str,
+        description: str,
+        severity: str,
+        tags: str,
+        location: str,
+        photo_info: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Analyze an issue using Claude to determine which NYC city organization should handle it
+        and generate a call script for Hume AI.
+        """
+        try:
+            # Import here inside the method to avoid any Modal environment issues
+            import anthropic
+            
+            if not self.api_key:
+                return {
+                    "error": "ANTHROPIC_API_KEY not configured",
+                    "recommendation": default_recommendation(title, location, "Default recommendation due to missing API key")
+                }
+                
+            # Initialize Anthropic client 
+            client = anthropic.AsyncAnthropic(api_key=self.api_key)
+            
+            # Prepare the prompt with real values
+            prompt = build_analysis_prompt(
+                title=title,
+                description=description,
+                severity=severity,
+                tags=tags,
+                location=location,
+                photo_info=photo_info
+            )
+            
+            # Stream the response so we can stop as soon as the recommendation JSON closes
+            extractor = new_recommendation_extractor()
+            chunks = []
+            parse_seconds = 0.0
+            
+            async def stream_recommendation():
+                nonlocal parse_seconds
+                async with client.messages.stream(
+                    model=ANALYSIS_MODEL,
                     max_tokens=4095,
                     temperature=0.7,
                     messages=[
@@ -212,66 +358,43 @@ Ensure that your JSON response clearly distinguishes between cases where an orga
                             "content": prompt
                         }
                     ]
-                )
+                ) as stream:
+                    async for text in stream.text_stream:
+                        chunks.append(text)
+                        parse_start = time.perf_counter()
+                        recommendation = extractor.feed(text)
+                        parse_seconds += time.perf_counter() - parse_start
+                        if recommendation is not None:
+                            break
+            
+            try:
+                with span("llm_call"):
+                    await self.breaker.call(stream_recommendation)
                 
-                # Extract response text
-                response_text = message.content[0].text
+                # Parsing happens as chunks arrive, so its time is also inside llm_call
+                record("json_parse", parse_seconds)
+                response_text = "".join(chunks)
+            except (CircuitOpenError, asyncio.TimeoutError) as e:
+                reason = str(e) or f"Claude took longer than {self.breaker.config.timeout:.0f}s"
+                print(f"Routing issue by keyword: {reason}")
+                result = route_issue_locally(title, description, severity, tags, location, photo_info)
+                result["degraded"] = reason
+                return result
             except Exception as e:
                 print(f"Error calling Claude API: {e}")
                 return {
                     "error": f"Claude API error: {str(e)}",
-                    "recommendation": {
-                        "selectedOrganization": "NYC 311 Service",
-                        "organizationId": 1,
-                        "justification": "Default recommendation due to API error",
-                        "callScript": f"Hello, I'd like to report an issue: {title}. The issue is located at: {location}."
-                    }
+                    "recommendation": default_recommendation(title, location, "Default recommendation due to API error")
                 }
             
             # Parse the analysis and recommendation sections
-            full_analysis = ""
-            recommendation = {}
-            
-            # Extract analysis section
-            if "<issue_analysis>" in response_text and "</issue_analysis>" in response_text:
-                analysis_start = response_text.find("<issue_analysis>") + len("<issue_analysis>")
-                analysis_end = response_text.find("</issue_analysis>")
-                full_analysis = response_text[analysis_start:analysis_end].strip()
-            
-            # Extract JSON recommendation
-            try:
-                # Find JSON block by looking for curly braces pattern
-                json_start = response_text.find("{")
-                json_end = response_text.rfind("}") + 1
-                if json_start >= 0 and json_end > json_start:
-                    json_str = response_text[json_start:json_end]
-                    recommendation = json.loads(json_str)
-            except Exception as e:
-                print(f"Error parsing JSON recommendation: {e}")
-                recommendation = {
-                    "selectedOrganization": "NYC 311 Service",
-                    "organizationId": 1,
-                    "justification": "Default due to parsing error",
-                    "callScript": f"Hello, I'd like to report an issue: {title}. The issue is located at: {location}."
-                }
-            
-            # Return the complete response
-            return {
-                "analysis": full_analysis,
-                "recommendation": recommendation,
-                "raw_response": response_text
-            }
+            return build_analysis_result(extractor, response_text, title, location)
             
         except Exception as e:
             print(f"Unexpected error: {e}")
             return {
                 "error": str(e),
-                "recommendation": {
-                    "selectedOrganization": "NYC 311 Service",
-                    "organizationId": 1,
-                    "justification": "Default recommendation due to unexpected error",
-                    "callScript": f"Hello, I'd like to report an issue: {title}. The issue is located at: {location}."
-                }
+                "recommendation": default_recommendation(title, location, "Default recommendation due to unexpected error")
             }
     
     @modal.method()
@@ -280,28 +403,11 @@ Ensure that your JSON response clearly distinguishes between cases where an orga
         Make a call using Twilio and Hume AI with the generated call script
         """
         try:
-            import twilio
-            print(f"Twilio version: {twilio.__version__}")
-            from twilio.rest import Client
             import urllib.parse
-            # Debug environment variables - will show in Modal logs
-            print("DEBUG: Environment variables:")
-            print(f"TWILIO_ACCOUNT_SID exists: {bool(os.environ.get('TWILIO_ACCOUNT_SID'))}")
-            print(f"TWILIO_AUTH_TOKEN exists: {bool(os.environ.get('TWILIO_AUTH_TOKEN'))}")
-            print(f"TWILIO_PHONE_NUMBER exists: {bool(os.environ.get('TWILIO_PHONE_NUMBER'))}")
-            
-            # Debug instance variables
-            print("DEBUG: Instance variables:")
-            print(f"self.twilio_account_sid exists: {bool(self.twilio_account_sid)}")
-            print(f"self.twilio_auth_token exists: {bool(self.twilio_auth_token)}")
-            print(f"self.twilio_phone_number exists: {bool(self.twilio_phone_number)}")
             
             # Return more detailed error
-            if not all([self.twilio_account_sid, self.twilio_auth_token, self.twilio_phone_number]):
-                missing = []
-                if not self.twilio_account_sid: missing.append("TWILIO_ACCOUNT_SID")
-                if not self.twilio_auth_token: missing.append("TWILIO_AUTH_TOKEN")
-                if not self.twilio_phone_number: missing.append("TWILIO_PHONE_NUMBER")
+            missing = missing_credentials(TWILIO_CREDENTIALS)
+            if missing:
                 return {
                     "error": f"Twilio credentials not configured. Missing: {', '.join(missing)}",
                     "status": "failed"
@@ -313,8 +419,8 @@ Ensure that your JSON response clearly distinguishes between cases where an orga
                     "status": "failed"
                 }
                 
-            # Initialize Twilio client
-            client = Client(self.twilio_account_sid, self.twilio_auth_token)
+            # Shared Twilio client, reusing its pooled connections across calls
+            client = get_twilio_client()
         
             # Format the Hume AI webhook URL - BASE ONLY
             base_webhook_url = f"https://api.hume.ai/v0/evi/twilio"
@@ -330,14 +436,14 @@ Ensure that your JSON response clearly distinguishes between cases where an orga
             query_string = urllib.parse.urlencode(params)
             webhook_url = f"{base_webhook_url}?{query_string}"
             
-            print(f"Using webhook URL: {webhook_url}")
-            
-            # Make the call
-            call = client.calls.create(
-                to=to_number,
-                from_=self.twilio_phone_number,
-                url=webhook_url
-            )
+            # Make the call; the Twilio SDK blocks, so it runs on the shared thread pool
+            with span("twilio_call"):
+                call = await run_blocking(
+                    client.calls.create,
+                    to=to_number,
+                    from_=self.twilio_phone_number,
+                    url=webhook_url
+                )
             
             return {
                 "status": call.status,
@@ -394,6 +500,77 @@ Ensure that your JSON response clearly distinguishes between cases where an orga
             "call": call_result
         }
 
+def make_batch_backend(name: str, analyzer: IssueAnalyzer):
+    """Build the /analyze/batch backend selected by name"""
+    if name == "concurrent":
+        return ConcurrentBackend(analyzer.analyze_issue, max_concurrency=BATCH_CONCURRENCY)
+    if name == "anthropic":
+        if not analyzer.api_key:
+            raise ValueError("ANTHROPIC_API_KEY not configured")
+        return AnthropicBatchBackend(
+            api_key=analyzer.api_key,
+            build_prompt=build_analysis_prompt,
+            parse_response=parse_analysis_response
+        )
+    if name == "local":
+        latency = float(os.environ.get("ANALYZE_BATCH_LOCAL_LATENCY", "0"))
+        return LocalBackend(latency=latency, max_concurrency=BATCH_CONCURRENCY)
+    raise ValueError(f"Unknown batch backend: {name}")
+
+async def run_batch_chunk(backend_name: str, items):
+    """Analyze one chunk of a batch job, returning (index, result) pairs"""
+    return await make_batch_backend(backend_name, IssueAnalyzer(BATCH_LLM_BREAKER)).run(items)
+
+# Runs one chunk of an /analyze/batch job outside the web container; anthropic chunks wait up to 24h on the provider
+@app.function(
+    image=image,
+    secrets=[modal.Secret.from_name("anthropic-secret")],
+    timeout=24 * 60 * 60
+)
+async def analyze_batch_chunk(backend_name: str, items):
+    return await run_batch_chunk(backend_name, items)
+
+def make_analyze_and_call_handler(analyzer: IssueAnalyzer):
+    """Job handler that runs the analyze stage, then the call stage, committing each result"""
+    async def handle(job: Dict[str, Any], queue: JobQueue) -> None:
+        payload = job["payload"]
+        
+        if job["stage"] == "analyze":
+            analysis = await analyzer.analyze_issue(
+                title=payload["title"],
+                description=payload["description"],
+                severity=payload["severity"],
+                tags=payload["tags"],
+                location=payload["location"],
+                photo_info=payload.get("photo_info")
+            )
+            # On the last attempt fall through with the default recommendation, as before
+            if "error" in analysis and job["attempts"] < job["max_attempts"]:
+                raise RetryableError(analysis["error"])
+            await asyncio.to_thread(queue.save_stage, job, "call", {"analysis": analysis})
+        
+        if job["stage"] == "call":
+            if job["result"].get("call_dispatched_at"):
+                # A previous attempt died after handing the call to Twilio; never dial twice
+                raise Exception("Call outcome unknown after an interrupted attempt")
+            
+            call_script = job["result"].get("analysis", {}).get("recommendation", {}).get(
+                "callScript",
+                f"Hello, I'd like to report an issue: {payload['title']}. The issue is located at: {payload['location']}."
+            )
+            await asyncio.to_thread(queue.update_result, job, {"call_dispatched_at": time.time()})
+            call_result = await analyzer.make_hume_call(
+                to_number=payload["to_number"],
+                call_script=call_script
+            )
+            if "error" in call_result:
+                # Twilio answered with a definite failure, so a retry can't double-dial
+                job["result"].pop("call_dispatched_at", None)
+                raise RetryableError(call_result["error"])
+            await asyncio.to_thread(queue.save_stage, job, "done", {"call": call_result})
+    
+    return handle
+
 # Create FastAPI endpoint
 @app.function(
     image=image,
@@ -402,14 +579,19 @@ Ensure that your JSON response clearly distinguishes between cases where an orga
         modal.Secret.from_name("twilio-secret"),
         modal.Secret.from_name("hume-secret")
     ],
-    timeout=120  # Increase timeout to 2 minutes to allow for API calls
+    timeout=120,  # Increase timeout to 2 minutes to allow for API calls
+    allow_concurrent_inputs=100,
+    # The only writer of jobs.db and issues.db; a second container would work on its own copy of them
+    max_containers=1,
+    volumes={"/data": jobs_volume}
 )
 @modal.asgi_app()
 def api():
-    from fastapi import FastAPI, HTTPException
+    from fastapi import FastAPI, Header, HTTPException
     from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import PlainTextResponse
     from pydantic import BaseModel
-    from typing import Optional
+    from typing import List, Optional
     
     app = FastAPI(title="NYC Issue Analyzer with Hume AI Integration")
     
@@ -420,7 +602,9 @@ def api():
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Server-Timing"],
     )
+    app.add_middleware(TimingMiddleware)
     
     # Define request models
     class IssueRequest(BaseModel):
@@ -444,6 +628,76 @@ def api():
         to_number: str
         photo_info: Optional[str] = None
     
+    class BatchAnalyzeRequest(BaseModel):
+        issues: List[IssueRequest]
+        backend: Optional[str] = None
+    
+    # Every write is committed to the volume, so a replacement container picks up where this one stopped
+    jobs_sync = volume_sync(jobs_volume)
+    job_queue = JobQueue(JOB_QUEUE_PATH, on_write=jobs_sync.commit_later)
+    job_workers = []
+    
+    issue_index = IssueIndex(ISSUE_DB_PATH, Gazetteer.from_csv(GAZETTEER_PATH), on_write=jobs_sync.commit_later)
+    
+    def index_issue(issue: IssueRequest, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Geocode and store an analyzed issue; returns its point and the issues already reported near it"""
+        point = issue_index.geocode(issue.location)
+        if point is None:
+            return None
+        nearby = issue_index.within_radius(point[0], point[1], DEDUP_RADIUS_M, limit=10)
+        recommendation = result.get("recommendation") or {}
+        issue_id = issue_index.add(
+            point[0],
+            point[1],
+            title=issue.title,
+            category=recommendation.get("selectedOrganization", ""),
+            location=issue.location,
+            data={"severity": issue.severity, "tags": issue.tags}
+        )
+        return {
+            "issue_id": issue_id,
+            "lat": point[0],
+            "lon": point[1],
+            "nearby_issues": [
+                {key: match[key] for key in ("id", "title", "distance_m", "created_at")} for match in nearby
+            ]
+        }
+    
+    def parse_bbox(bbox: str):
+        try:
+            min_lat, min_lon, max_lat, max_lon = (float(value) for value in bbox.split(","))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="bbox must be min_lat,min_lon,max_lat,max_lon")
+        if min_lat > max_lat or min_lon > max_lon:
+            raise HTTPException(status_code=400, detail="bbox minimums must not exceed maximums")
+        return min_lat, min_lon, max_lat, max_lon
+    
+    @app.on_event("startup")
+    async def check_credentials():
+        log_missing_credentials("Anthropic", ["ANTHROPIC_API_KEY"])
+        log_missing_credentials("Twilio", TWILIO_CREDENTIALS)
+        log_missing_credentials("Hume AI", HUME_CREDENTIALS + ("HUME_CONFIG_ID",))
+    
+    @app.on_event("startup")
+    async def start_job_workers():
+        if BATCH_DISPATCH == "local":
+            dispatcher = InlineDispatcher(run_batch_chunk)
+        else:
+            dispatcher = ModalDispatcher(analyze_batch_chunk)
+        handlers = {
+            "analyze_and_call": make_analyze_and_call_handler(IssueAnalyzer()),
+            "analyze_batch": make_analyze_batch_handler(dispatcher, BATCH_CHUNK_SIZE, BATCH_POLL_INTERVAL)
+        }
+        for _ in range(JOB_WORKERS):
+            worker = JobWorker(job_queue, handlers)
+            job_workers.append((worker, asyncio.create_task(worker.run())))
+    
+    @app.on_event("shutdown")
+    async def stop_job_workers():
+        for worker, _ in job_workers:
+            worker.stop()
+        await asyncio.gather(*(task for _, task in job_workers), return_exceptions=True)
+    
     # Endpoint for analyzing issues
     @app.post("/analyze")
     async def analyze_issue(issue: IssueRequest):
@@ -460,9 +714,89 @@ def api():
         
         if "error" in result and not "recommendation" in result:
             raise HTTPException(status_code=500, detail=result["error"])
+        
+        with span("issue_index"):
+            result["geo"] = await asyncio.to_thread(index_issue, issue, result)
             
         return result
     
+    # Endpoints for reported issues by place
+    @app.get("/issues/nearby")
+    async def nearby_issues(
+        lat: Optional[float] = None,
+        lon: Optional[float] = None,
+        location: Optional[str] = None,
+        radius: float = DEDUP_RADIUS_M,
+        since: Optional[float] = None,
+        limit: int = 100
+    ):
+        if lat is None or lon is None:
+            if not location:
+                raise HTTPException(status_code=400, detail="Provide lat and lon, or location")
+            point = await asyncio.to_thread(issue_index.geocode, location)
+            if point is None:
+                raise HTTPException(status_code=404, detail=f"Could not geocode location: {location}")
+            lat, lon = point
+        
+        radius = min(radius, 5000)
+        issues = await asyncio.to_thread(issue_index.within_radius, lat, lon, radius, since, max(limit, 1))
+        return {"lat": lat, "lon": lon, "radius_m": radius, "issues": issues}
+    
+    @app.get("/issues")
+    async def issues_in_bbox(bbox: str, since: Optional[float] = None, limit: int = 100):
+        issues = await asyncio.to_thread(issue_index.within_bbox, *parse_bbox(bbox), since, max(limit, 1))
+        return {"issues": issues}
+    
+    @app.get("/issues/clusters")
+    async def issue_clusters(bbox: str, precision: int = 6, since: Optional[float] = None):
+        clusters = await asyncio.to_thread(issue_index.clusters, *parse_bbox(bbox), precision, since)
+        return {"precision": precision, "clusters": clusters}
+    
+    # Endpoint for submitting many issues as one background job
+    @app.post("/analyze/batch", status_code=202)
+    async def analyze_batch(batch_request: BatchAnalyzeRequest):
+        if not batch_request.issues:
+            raise HTTPException(status_code=400, detail="No issues provided")
+        if len(batch_request.issues) > BATCH_MAX_ITEMS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch too large: {len(batch_request.issues)} issues (max {BATCH_MAX_ITEMS})"
+            )
+        
+        backend_name = batch_request.backend or BATCH_BACKEND
+        try:
+            make_batch_backend(backend_name, IssueAnalyzer())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        issues = [issue.dict() for issue in batch_request.issues]
+        job, _ = await asyncio.to_thread(
+            job_queue.enqueue,
+            "analyze_batch",
+            {"backend": backend_name, "issues": issues},
+            "dispatch",
+            None,
+            JOB_MAX_ATTEMPTS
+        )
+        
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "total": len(issues),
+            "status_url": f"/analyze/batch/{job['id']}"
+        }
+    
+    # Endpoint for polling batch progress and per-item results
+    @app.get("/analyze/batch/{job_id}")
+    async def get_batch(job_id: str, offset: int = 0, limit: int = 100):
+        job = await asyncio.to_thread(job_queue.get, job_id)
+        if job is None or job["kind"] != "analyze_batch":
+            raise HTTPException(status_code=404, detail="Batch job not found")
+        offset, limit = max(offset, 0), min(max(limit, 1), 1000)
+        counts = await asyncio.to_thread(job_queue.item_counts, job_id)
+        items = await asyncio.to_thread(job_queue.items, job_id, offset, limit)
+        return batch_status(job, counts, items, offset=offset, limit=limit)
+    
     # Endpoint for making Hume AI calls
     @app.post("/call")
     async def make_call(call_request: CallRequest):
@@ -478,26 +812,52 @@ def api():
             
         return result
     
-    # Endpoint that combines analysis and calling
-    @app.post("/analyze-and-call")
-    async def analyze_and_call(request: AnalyzeAndCallRequest):
-        analyzer = IssueAnalyzer()
-        
-        result = await analyzer.analyze_and_call(
-            title=request.title,
-            description=request.description,
-            severity=request.severity,
-            tags=request.tags,
-            location=request.location,
-            to_number=request.to_number,
-            photo_info=request.photo_info
+    # Endpoint that queues analysis and calling as a background job
+    @app.post("/analyze-and-call", status_code=202)
+    async def analyze_and_call(
+        request: AnalyzeAndCallRequest,
+        idempotency_key: Optional[str] = Header(None)
+    ):
+        job, created = await asyncio.to_thread(
+            job_queue.enqueue,
+            "analyze_and_call",
+            request.dict(),
+            "analyze",
+            idempotency_key,
+            JOB_MAX_ATTEMPTS
         )
         
-        if "error" in result.get("analysis", {}) or "error" in result.get("call", {}):
-            # Return the result anyway, but with a 500 status code
-            return HTTPException(status_code=500, detail=result)
-            
-        return result
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "created": created,
+            "status_url": f"/jobs/{job['id']}"
+        }
+    
+    # Endpoint for polling queued jobs
+    @app.get("/jobs/{job_id}")
+    async def get_job(job_id: str):
+        job = await asyncio.to_thread(job_queue.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        
+        return {
+            "job_id": job["id"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "attempts": job["attempts"],
+            "max_attempts": job["max_attempts"],
+            "error": job["error"],
+            "result": job["result"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"]
+        }
+    
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
     
     @app.get("/")
     async def root():
@@ -505,8 +865,12 @@ def api():
             "message": "NYC Issue Analyzer with Hume AI Integration is running.",
             "endpoints": [
                 "/analyze - Analyze an issue and get a recommendation",
+                "/analyze/batch - Submit many issues for analysis and poll /analyze/batch/{job_id}",
                 "/call - Make a call with Hume AI",
-                "/analyze-and-call - Analyze an issue and immediately make a call"
+                "/analyze-and-call - Queue analysis and a call; poll /jobs/{job_id} for progress",
+                "/issues/nearby - Issues reported within a radius of a point or location",
+                "/issues - Issues inside a bounding box",
+                "/issues/clusters - Issue counts per geohash cell inside a bounding box"
             ]
         }
         
@@ -1,16 +1,38 @@
 import os
+import sys
 import json
-import requests
-from twilio.rest import Client
+import uuid
+import asyncio
+import urllib.parse
+from pathlib import Path
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request, Response
+from fastapi import BackgroundTasks, FastAPI, Query, Request, Response
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 import uvicorn
 from typing import Dict, List, Optional
 
+# backend/shared holds modules used by both the analyzer and detector services
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.tracing import METRICS_CONTENT_TYPE, REGISTRY, TimingMiddleware, span
+from call_store import CallStore
+from hume_api import HUME_API_BASE_URL, HumeClient
+from hume_configs import ConfigCache
+from call_scheduler import FINAL_GROUP_STATUSES, CallGroup, CallScheduler
+from clients import (
+    HUME_CREDENTIALS,
+    TWILIO_CREDENTIALS,
+    get_http_session,
+    get_twilio_client,
+    log_missing_credentials,
+    run_blocking
+)
+
 load_dotenv()
 
 app = FastAPI()
+app.add_middleware(TimingMiddleware)
 
 HUME_API_KEY = os.getenv("HUME_API_KEY")
 HUME_CONFIG_ID = os.getenv("HUME_CONFIG_ID")
@@ -19,8 +41,24 @@ TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 TARGET_PHONE_NUMBER = os.getenv("TARGET_PHONE_NUMBER")
 WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")
+CALL_DB_PATH = os.getenv("CALL_DB_PATH", "calls.db")
+SUMMARY_FETCH_CONCURRENCY = int(os.getenv("SUMMARY_FETCH_CONCURRENCY", "4"))
+SUMMARY_FETCH_TIMEOUT = float(os.getenv("SUMMARY_FETCH_TIMEOUT", "10"))
+HUME_CONFIG_CACHE_PATH = os.getenv("HUME_CONFIG_CACHE_PATH", "hume_configs.json")
 
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+# Campaign state and call slots live in this process, so CAMPAIGNS=0 is required to serve with --workers > 1
+CAMPAIGNS_ENABLED = os.getenv("CAMPAIGNS", "1") == "1"
+# Campaign scheduling limits; keep them within the Twilio account's CPS and concurrency limits
+CAMPAIGN_MAX_CONCURRENT_CALLS = int(os.getenv("CAMPAIGN_MAX_CONCURRENT_CALLS", "2"))
+CAMPAIGN_CALLS_PER_SECOND = float(os.getenv("CAMPAIGN_CALLS_PER_SECOND", "1"))
+CAMPAIGN_BURST = int(os.getenv("CAMPAIGN_BURST", "1"))
+CAMPAIGN_MERGE_WINDOW = float(os.getenv("CAMPAIGN_MERGE_WINDOW", "5"))
+# A campaign call holds its slot until /call-status reports its final status, or this many seconds pass
+CAMPAIGN_CALL_TIMEOUT = float(os.getenv("CAMPAIGN_CALL_TIMEOUT", "1800"))
+# A campaign whose calls have all ended stays readable at /campaigns/{id} this many seconds, then is dropped
+CAMPAIGN_RETENTION = float(os.getenv("CAMPAIGN_RETENTION", "600"))
+# JSON object mapping agency names to phone numbers; 311 goes to TARGET_PHONE_NUMBER by default
+AGENCY_PHONE_NUMBERS = {"311": TARGET_PHONE_NUMBER, **json.loads(os.getenv("CAMPAIGN_AGENCY_NUMBERS", "{}"))}
 
 class PlasticWasteReport(BaseModel):
     location: str
@@ -43,72 +81,101 @@ SAMPLE_REPORT = PlasticWasteReport(
     additional_notes="The plastic appears to have come from a nearby store. Some pieces are beginning to enter the storm drain."
 )
 
-call_records = {}
+call_store = CallStore(CALL_DB_PATH)
 
-def create_hume_config():
-    url = "https://api.hume.ai/v0/evi/configs"
-    
-    config_data = {
-        "name": "NY 311 Plastic Waste Reporter",
-        "description": "AI assistant for reporting plastic waste issues to NY 311",
-        "system_prompt": f"""
-        You are an AI assistant calling NY 311 to report plastic waste. You are calling on behalf of a concerned citizen.
-        
-        Here are details about the plastic waste issue:
-        - Location: {SAMPLE_REPORT.location}
-        - Type of plastic waste: {SAMPLE_REPORT.waste_type}
-        - Quantity: {SAMPLE_REPORT.quantity}
-        - Hazard level: {SAMPLE_REPORT.hazard_level}
-        - When observed: {SAMPLE_REPORT.date_observed}
-        - Reporter: {SAMPLE_REPORT.reporter_name} (Contact: {SAMPLE_REPORT.reporter_contact})
-        
-        Additional information: {SAMPLE_REPORT.additional_notes}
-        
-        Your goals for this call:
-        1. Clearly identify yourself as an AI assistant calling on behalf of the reporter.
-        2. Provide all relevant details about the plastic waste issue.
-        3. Answer questions using ONLY the information provided above.
-        4. If asked for information you don't have, politely state that you only have the details listed above.
-        5. Request a reference or case number for the report.
-        6. Thank the operator for their assistance.
-        
-        Keep your responses concise and focused on the reporting task. Remain polite and professional throughout the call.
-        """,
-        "voice": {
-            "provider": "eleven_labs",
-            "voice_id": "Rachel",
-            "settings": {
-                "stability": 0.7,
-                "similarity_boost": 0.75
-            }
-        },
-        "on_call_start": {
-            "greeting": "Hello, I'm an AI assistant calling on behalf of a concerned citizen to report a plastic waste issue in New York City. I'd like to file a report with 311."
-        },
-        "on_call_end": {
-            "farewell": "Thank you for your assistance with this report. Have a good day."
-        },
-        "emotions_to_track": ["confusion", "frustration", "satisfaction"],
-        "call_summary": True
-    }
+# Created on startup so the httpx pool is bound to the server's event loop
+hume_client: Optional[HumeClient] = None
+
+@app.on_event("startup")
+async def check_credentials():
+    log_missing_credentials("Twilio", TWILIO_CREDENTIALS)
+    log_missing_credentials("Hume AI", HUME_CREDENTIALS)
+
+@app.on_event("startup")
+async def open_hume_client():
+    global hume_client
+    hume_client = HumeClient(
+        HUME_API_KEY,
+        timeout=SUMMARY_FETCH_TIMEOUT,
+        max_concurrency=SUMMARY_FETCH_CONCURRENCY
+    )
+
+@app.on_event("shutdown")
+async def close_hume_client():
+    if hume_client is not None:
+        await hume_client.aclose()
+
+# One config serves every call. Report details are {{variable}} placeholders, which Hume fills from
+# session_settings.variables sent over the EVI WebSocket. For Twilio calls Hume holds that socket, and its
+# /v0/evi/twilio webhook documents only config_id and api_key, so this service has no per-call way to send
+# them; initiate_outbound_call logs every report whose details could not be delivered.
+REPORTER_CONFIG_TEMPLATE = {
+    "name": "NY 311 Plastic Waste Reporter",
+    "description": "AI assistant for reporting plastic waste issues to NY 311",
+    "system_prompt": """
+    You are an AI assistant calling NY 311 to report plastic waste. You are calling on behalf of a concerned citizen.
+    
+    Here are details about the plastic waste issue:
+    - Location: {{location}}
+    - Type of plastic waste: {{waste_type}}
+    - Quantity: {{quantity}}
+    - Hazard level: {{hazard_level}}
+    - When observed: {{date_observed}}
+    - Reporter: {{reporter_name}} (Contact: {{reporter_contact}})
+    
+    Additional information: {{additional_notes}}
+    
+    Your goals for this call:
+    1. Clearly identify yourself as an AI assistant calling on behalf of the reporter.
+    2. Provide all relevant details about the plastic waste issue.
+    3. Answer questions using ONLY the information provided above.
+    4. If asked for information you don't have, politely state that you only have the details listed above.
+    5. Request a reference or case number for the report.
+    6. Thank the operator for their assistance.
+    
+    Keep your responses concise and focused on the reporting task. Remain polite and professional throughout the call.
+    """,
+    "voice": {
+        "provider": "eleven_labs",
+        "voice_id": "Rachel",
+        "settings": {
+            "stability": 0.7,
+            "similarity_boost": 0.75
+        }
+    },
+    "on_call_start": {
+        "greeting": "Hello, I'm an AI assistant calling on behalf of a concerned citizen to report a plastic waste issue in New York City. I'd like to file a report with 311."
+    },
+    "on_call_end": {
+        "farewell": "Thank you for your assistance with this report. Have a good day."
+    },
+    "emotions_to_track": ["confusion", "frustration", "satisfaction"],
+    "call_summary": True
+}
+
+config_cache = ConfigCache(HUME_CONFIG_CACHE_PATH)
+
+def push_hume_config(config_data, config_id=None):
+    url = f"{HUME_API_BASE_URL}/v0/evi/configs"
     
     headers = {
         "Authorization": f"Bearer {HUME_API_KEY}",
         "Content-Type": "application/json"
     }
     
-    if HUME_CONFIG_ID:
-        response = requests.put(
-            f"{url}/{HUME_CONFIG_ID}",
-            headers=headers,
-            json=config_data
-        )
-    else:
-        response = requests.post(
-            url,
-            headers=headers,
-            json=config_data
-        )
+    with span("hume_config"):
+        if config_id:
+            response = get_http_session().put(
+                f"{url}/{config_id}",
+                headers=headers,
+                json=config_data
+            )
+        else:
+            response = get_http_session().post(
+                url,
+                headers=headers,
+                json=config_data
+            )
     
     if response.status_code in (200, 201):
         config = response.json()
@@ -116,73 +183,204 @@ def create_hume_config():
     else:
         raise Exception(f"Failed to create/update Hume config: {response.text}")
 
-def initiate_outbound_call():
-    config_id = HUME_CONFIG_ID or create_hume_config()
+def create_hume_config():
+    """Update HUME_CONFIG_ID in place, or create (or reuse) the cached config for the template"""
+    if HUME_CONFIG_ID:
+        return push_hume_config(REPORTER_CONFIG_TEMPLATE, HUME_CONFIG_ID)
+    return get_hume_config_id()
+
+def get_hume_config_id():
+    """HUME_CONFIG_ID if set, else the cached config for the current template (created on first use)"""
+    return HUME_CONFIG_ID or config_cache.get_or_create(REPORTER_CONFIG_TEMPLATE, push_hume_config)
+
+def initiate_outbound_call(report: PlasticWasteReport = SAMPLE_REPORT, to_number: Optional[str] = None):
+    config_id = get_hume_config_id()
+    # Not silent: the webhook has no documented field for the report (see REPORTER_CONFIG_TEMPLATE)
+    print(f"Hume's Twilio webhook takes no per-call variables; report details for {report.location!r} "
+          f"are not sent to config {config_id}")
     
-    hume_webhook = f"https://api.hume.ai/v0/evi/twilio?config_id={config_id}&api_key={HUME_API_KEY}"
+    # config_id and api_key are the parameters Hume documents for its Twilio webhook
+    query_string = urllib.parse.urlencode({
+        "config_id": config_id,
+        "api_key": HUME_API_KEY
+    })
+    hume_webhook = f"{HUME_API_BASE_URL}/v0/evi/twilio?{query_string}"
     
     status_callback = f"{WEBHOOK_BASE_URL}/call-status"
     
-    call = twilio_client.calls.create(
-        to=TARGET_PHONE_NUMBER,
-        from_=TWILIO_PHONE_NUMBER,
-        url=hume_webhook,
-        status_callback=status_callback,
-        status_callback_event=['completed'],
-        status_callback_method='POST'
-    )
+    with span("twilio_call"):
+        call = get_twilio_client().calls.create(
+            to=to_number or TARGET_PHONE_NUMBER,
+            from_=TWILIO_PHONE_NUMBER,
+            url=hume_webhook,
+            status_callback=status_callback,
+            status_callback_event=['completed'],
+            status_callback_method='POST'
+        )
     
-    call_records[call.sid] = {
-        "status": call.status,
-        "report_data": SAMPLE_REPORT.dict(),
-        "start_time": call.start_time,
-        "summary": None
-    }
+    call_store.insert(
+        call.sid,
+        status=call.status,
+        report_data=report.dict(),
+        start_time=call.start_time
+    )
     
     return call.sid
 
 @app.post("/initiate-call")
-async def api_initiate_call():
+async def api_initiate_call(report: Optional[PlasticWasteReport] = None):
     try:
-        call_sid = initiate_outbound_call()
+        call_sid = await run_blocking(initiate_outbound_call, report or SAMPLE_REPORT)
         return {"status": "success", "call_sid": call_sid, "message": "Call initiated"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+class CampaignReport(BaseModel):
+    report: PlasticWasteReport
+    agency: str = "311"
+
+class CampaignRequest(BaseModel):
+    reports: List[CampaignReport]
+
+def merge_reports(reports: List[PlasticWasteReport]) -> PlasticWasteReport:
+    """Fold reports about the same site into one report for a single call"""
+    if len(reports) == 1:
+        return reports[0]
+    
+    def joined(values):
+        return "; ".join(dict.fromkeys(value for value in values if value))
+    
+    return PlasticWasteReport(
+        location=reports[0].location,
+        waste_type=joined(r.waste_type for r in reports),
+        quantity=joined(r.quantity for r in reports),
+        hazard_level=joined(r.hazard_level for r in reports),
+        date_observed=joined(r.date_observed for r in reports),
+        reporter_name=f"{len(reports)} community reporters",
+        reporter_contact=joined(r.reporter_contact for r in reports),
+        additional_notes=joined([f"{len(reports)} separate reports of this location were combined."] +
+                                [r.additional_notes for r in reports])
+    )
+
+async def dial_call_group(group: CallGroup):
+    to_number = AGENCY_PHONE_NUMBERS.get(group.agency)
+    if not to_number:
+        raise ValueError(f"No phone number configured for agency {group.agency}")
+    report = merge_reports([PlasticWasteReport(**r) for r in group.reports])
+    # The Twilio SDK is blocking; keep it off the event loop
+    call_sid = await run_blocking(initiate_outbound_call, report, to_number)
+    return {"call_sid": call_sid}
+
+call_scheduler: Optional[CallScheduler] = None
+campaigns: Dict[str, List[str]] = {}
+
+def evict_campaign(campaign_id: str):
+    group_ids = campaigns.pop(campaign_id, [])
+    # A merged group can belong to a campaign that is still running
+    in_use = {group_id for ids in campaigns.values() for group_id in ids}
+    call_scheduler.forget([group_id for group_id in group_ids if group_id not in in_use])
+
+def campaign_group_done(group: CallGroup):
+    """Schedule eviction of each campaign whose last call just ended"""
+    for campaign_id, group_ids in list(campaigns.items()):
+        if group.id in group_ids and all(
+            call_scheduler.groups[group_id].status in FINAL_GROUP_STATUSES for group_id in group_ids
+        ):
+            asyncio.get_running_loop().call_later(CAMPAIGN_RETENTION, evict_campaign, campaign_id)
+
+@app.on_event("startup")
+async def start_call_scheduler():
+    global call_scheduler
+    if not CAMPAIGNS_ENABLED:
+        return
+    call_scheduler = CallScheduler(
+        dial_call_group,
+        max_concurrent_calls=CAMPAIGN_MAX_CONCURRENT_CALLS,
+        calls_per_second=CAMPAIGN_CALLS_PER_SECOND,
+        burst=CAMPAIGN_BURST,
+        merge_window=CAMPAIGN_MERGE_WINDOW,
+        call_timeout=CAMPAIGN_CALL_TIMEOUT,
+        on_group_done=campaign_group_done
+    )
+    call_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_call_scheduler():
+    if call_scheduler is not None:
+        await call_scheduler.stop()
+
+@app.post("/campaigns")
+async def create_campaign(campaign: CampaignRequest):
+    if call_scheduler is None:
+        return {"status": "error", "message": "Campaigns are disabled (CAMPAIGNS=0)"}
+    campaign_id = uuid.uuid4().hex
+    group_ids = []
+    for item in campaign.reports:
+        group = call_scheduler.submit(item.report.dict(), location=item.report.location, agency=item.agency)
+        if group.id not in group_ids:
+            group_ids.append(group.id)
+    campaigns[campaign_id] = group_ids
+    return {"campaign_id": campaign_id, "reports": len(campaign.reports), "calls": len(group_ids)}
+
+@app.get("/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str):
+    if call_scheduler is None or campaign_id not in campaigns:
+        return {"status": "error", "message": "Campaign not found"}
+    return {
+        "campaign_id": campaign_id,
+        "calls": [call_scheduler.groups[group_id].to_dict() for group_id in campaigns[campaign_id]],
+        "scheduler": call_scheduler.stats()
+    }
+
+async def store_call_summary(call_sid: str):
+    try:
+        with span("hume_summary"):
+            summary_data = await hume_client.get_call_summary(call_sid)
+        if summary_data is not None:
+            await run_blocking(call_store.set_summary, call_sid, summary_data)
+    except Exception as e:
+        print(f"Error fetching call summary: {str(e)}")
+
 @app.post("/call-status")
-async def call_status_webhook(request: Request):
+async def call_status_webhook(request: Request, background_tasks: BackgroundTasks):
     form_data = await request.form()
     call_sid = form_data.get("CallSid")
     call_status = form_data.get("CallStatus")
     
-    if call_sid in call_records:
-        call_records[call_sid]["status"] = call_status
-        
+    if call_sid and call_scheduler is not None:
+        # Frees the campaign slot this call was holding
+        call_scheduler.call_ended(call_sid, call_status)
+    
+    if call_sid and await run_blocking(call_store.update_status, call_sid, call_status):
         if call_status == "completed":
-            try:
-                headers = {"Authorization": f"Bearer {HUME_API_KEY}"}
-                response = requests.get(
-                    f"https://api.hume.ai/v0/evi/calls/{call_sid}/summary",
-                    headers=headers
-                )
-                
-                if response.status_code == 200:
-                    summary_data = response.json()
-                    call_records[call_sid]["summary"] = summary_data
-            except Exception as e:
-                print(f"Error fetching call summary: {str(e)}")
+            # Acknowledge Twilio right away; the summary is fetched after the response is sent
+            background_tasks.add_task(store_call_summary, call_sid)
     
     return Response(status_code=200)
 
 @app.get("/calls/{call_sid}")
 async def get_call_details(call_sid: str):
-    if call_sid in call_records:
-        return call_records[call_sid]
+    record = await run_blocking(call_store.get, call_sid)
+    if record:
+        return record
     return {"status": "error", "message": "Call not found"}
 
 @app.get("/calls")
-async def get_all_calls():
-    return call_records
+async def get_all_calls(
+    status: Optional[str] = Query(None, description="Only calls with this Twilio status"),
+    since: Optional[float] = Query(None, description="Created at or after this Unix time"),
+    until: Optional[float] = Query(None, description="Created before this Unix time"),
+    before: Optional[str] = Query(None, description="Cursor: next_before from the previous page"),
+    limit: int = Query(50, ge=1, le=500)
+):
+    try:
+        return await run_blocking(call_store.list, status=status, since=since, until=until, before=before, limit=limit)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
 
 if __name__ == "__main__":
     import argparse
@@ -190,6 +388,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Hume AI 311 Caller")
     parser.add_argument("--action", choices=["config", "call", "serve"], 
                         help="Action to perform: create config, make call, or start server")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of uvicorn worker processes for serve (call records are shared via CALL_DB_PATH; "
+                             "needs CAMPAIGNS=0)")
     
     args = parser.parse_args()
     
@@ -200,6 +401,13 @@ if __name__ == "__main__":
         call_sid = initiate_outbound_call()
         print(f"Initiated call with SID: {call_sid}")
     elif args.action == "serve":
-        uvicorn.run(app, host="0.0.0.0", port=8000)
+        if args.workers > 1 and CAMPAIGNS_ENABLED:
+            # Each worker would have its own campaigns and call slots, and status callbacks land on any of them
+            parser.error("--workers > 1 needs CAMPAIGNS=0: campaign state is kept in one process")
+        if args.workers > 1:
+            # Multiple workers need an import string rather than the app object
+            uvicorn.run("app:app", host="0.0.0.0", port=8000, workers=args.workers)
+        else:
+            uvicorn.run(app, host="0.0.0.0", port=8000)
     else:
         print("Please specify an action: --action [config|call|serve]")
\ No newline at end of file
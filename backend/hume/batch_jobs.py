@@ -0,0 +1,300 @@
+"""
+Batch analysis jobs behind the /analyze/batch endpoint.
+
+A batch is an "analyze_batch" job in the durable JobQueue, and each issue's
+result is a job_items row. Issues are analyzed by one of three backends:
+
+- "concurrent": awaits IssueAnalyzer.analyze_issue for every issue, bounded by
+  a semaphore
+- "anthropic": submits all prompts as a single Message Batches request and
+  polls it until the provider reports the batch as ended
+- "local": offline stand-in that routes issues by keyword, for testing the
+  endpoint without network access or API keys
+
+The work runs outside the web container. The job's "dispatch" stage spawns
+one Modal function call per chunk of issues (the whole batch for
+"anthropic", whose provider polling can take up to 24 hours) and saves the
+call ids. The "collect" stage checks those calls without waiting, stores the
+finished chunks' results and defers itself until every chunk is in. A
+container restart loses nothing: the queue holds the call ids and results.
+"""
+import asyncio
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# (index into the batch, issue fields) pairs, and the (index, result) pairs a backend returns
+BatchItems = List[Tuple[int, Dict[str, Any]]]
+
+# Keyword routing used by the local stand-in backend, checked in order
+LOCAL_ROUTING = [
+    (("pothole", "street light", "streetlight", "light", "sign", "sidewalk", "traffic", "road"),
+     "NYC Department of Transportation", 2),
+    (("litter", "dumping", "trash", "garbage", "waste", "plastic", "recycling"),
+     "NYC Department of Sanitation", 3),
+    (("flood", "drain", "sewer", "catch basin", "water main"),
+     "NYC Department of Environmental Protection", 4),
+    (("building", "construction", "facade", "elevator", "scaffold"),
+     "NYC Department of Buildings", 5),
+]
+
+
+def route_issue_locally(
+    title: str,
+    description: str,
+    severity: str,
+    tags: str,
+    location: str,
+    photo_info: Optional[str] = None
+) -> Dict[str, Any]:
+    """Pick an organization by keyword matching, mirroring the shape of a Claude analysis"""
+    text = " ".join([title, description, tags, photo_info or ""]).lower()
+    organization, organization_id = "NYC 311 Service", 1
+    for keywords, name, org_id in LOCAL_ROUTING:
+        if any(keyword in text for keyword in keywords):
+            organization, organization_id = name, org_id
+            break
+
+    return {
+        "analysis": "",
+        "recommendation": {
+            "selectedOrganization": organization,
+            "organizationId": organization_id,
+            "justification": f"Matched by keyword routing (severity: {severity})",
+            "callScript": f"Hello, I'd like to report an issue: {title}. The issue is located at: {location}."
+        },
+        "raw_response": ""
+    }
+
+
+def item_status(result: Dict[str, Any]) -> str:
+    """failed, degraded (routed by keyword while Claude was unavailable) or succeeded"""
+    if "error" in result:
+        return "failed"
+    return "degraded" if "degraded" in result else "succeeded"
+
+
+def batch_status(job: Dict[str, Any], counts: Dict[str, int], items: Dict[int, Tuple[str, Dict[str, Any]]],
+                 offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+    """The /analyze/batch/{job_id} response for a job, its item counts and one page of its items"""
+    total = len(job["payload"]["issues"])
+    results = []
+    for index in range(offset, min(offset + limit, total)):
+        if index in items:
+            status, result = items[index]
+            results.append({"index": index, "status": status, "result": result})
+        else:
+            results.append({"index": index, "status": "pending"})
+
+    if job["status"] in ("completed", "failed"):
+        status = job["status"]
+    else:
+        # Between checks on its chunks a job is queued again, but its work is still running
+        status = "queued" if job["stage"] == "dispatch" else "running"
+    completed = sum(counts.values())
+    return {
+        "job_id": job["id"],
+        "backend": job["payload"]["backend"],
+        "status": status,
+        "total": total,
+        "completed": completed,
+        "failed": counts.get("failed", 0),
+        "degraded": counts.get("degraded", 0),
+        "progress": round(completed / total, 4) if total else 1.0,
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "finished_at": job["updated_at"] if status in ("completed", "failed") else None,
+        "offset": offset,
+        "limit": limit,
+        "results": results
+    }
+
+
+class ModalDispatcher:
+    """Runs chunks in a spawned Modal function and fetches their results by call id"""
+
+    def __init__(self, function):
+        self.function = function
+
+    async def submit(self, backend: str, items: BatchItems) -> str:
+        call = await self.function.spawn.aio(backend, items)
+        return call.object_id
+
+    async def poll(self, call_id: str) -> Optional[BatchItems]:
+        """The chunk's results, or None while it is still running"""
+        import modal
+
+        try:
+            return await modal.FunctionCall.from_id(call_id).get.aio(timeout=0)
+        except modal.exception.FunctionTimeoutError:
+            raise
+        except (TimeoutError, modal.exception.TimeoutError):
+            return None
+
+
+class InlineDispatcher:
+    """Runs chunks as tasks in this process, for running the service outside Modal (e.g. load tests)"""
+
+    def __init__(self, run_chunk: Callable[[str, BatchItems], Awaitable[BatchItems]]):
+        self.run_chunk = run_chunk
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, backend: str, items: BatchItems) -> str:
+        call_id = uuid.uuid4().hex
+        self.tasks[call_id] = asyncio.create_task(self.run_chunk(backend, items))
+        return call_id
+
+    async def poll(self, call_id: str) -> Optional[BatchItems]:
+        task = self.tasks.get(call_id)
+        if task is None:
+            raise LookupError(f"Chunk {call_id} ran in a process that has since stopped")
+        if not task.done():
+            return None
+        del self.tasks[call_id]
+        return task.result()
+
+
+def make_analyze_batch_handler(dispatcher, chunk_size: int = 50, poll_interval: float = 10.0):
+    """Job handler that dispatches a batch's chunks, then collects their results as they finish"""
+    async def handle(job: Dict[str, Any], queue) -> None:
+        payload = job["payload"]
+
+        if job["stage"] == "dispatch":
+            calls = job["result"].get("calls", [])
+            # Items already finished or handed to a chunk by an interrupted attempt aren't sent again
+            covered = await asyncio.to_thread(queue.item_indexes, job["id"])
+            covered.update(index for call in calls for index in call["indexes"])
+            pending = [(index, issue) for index, issue in enumerate(payload["issues"]) if index not in covered]
+            size = len(pending) if payload["backend"] == "anthropic" else chunk_size
+            for start in range(0, len(pending), max(size, 1)):
+                chunk = pending[start:start + size]
+                call_id = await dispatcher.submit(payload["backend"], chunk)
+                calls.append({"call_id": call_id, "indexes": [index for index, _ in chunk], "done": False})
+                await asyncio.to_thread(queue.update_result, job, {"calls": calls})
+            await asyncio.to_thread(queue.save_stage, job, "collect", {"calls": calls})
+
+        if job["stage"] == "collect":
+            calls = job["result"]["calls"]
+            for call in calls:
+                if call["done"]:
+                    continue
+                try:
+                    results = await dispatcher.poll(call["call_id"])
+                except Exception as e:
+                    print(f"Batch job {job['id']} chunk {call['call_id']} failed: {e!r}")
+                    results = [(index, {"error": f"Chunk failed: {e}"}) for index in call["indexes"]]
+                if results is None:
+                    continue
+                # Anything the chunk did not report back counts as failed
+                reported = {index for index, _ in results}
+                results = list(results) + [
+                    (index, {"error": "Missing from chunk results"}) for index in call["indexes"] if index not in reported
+                ]
+                await asyncio.to_thread(
+                    queue.save_items, job["id"], [(index, item_status(result), result) for index, result in results]
+                )
+                call["done"] = True
+
+            if not all(call["done"] for call in calls):
+                await asyncio.to_thread(queue.defer, job, poll_interval, {"calls": calls})
+                return
+            await asyncio.to_thread(queue.save_stage, job, "done", {"calls": calls})
+
+    return handle
+
+
+class ConcurrentBackend:
+    """Runs each issue through the per-issue analyzer with at most max_concurrency in flight"""
+
+    name = "concurrent"
+
+    def __init__(self, analyze_fn: Callable[..., Awaitable[Dict[str, Any]]], max_concurrency: int = 8):
+        self.analyze_fn = analyze_fn
+        self.max_concurrency = max(1, max_concurrency)
+
+    async def run(self, items: BatchItems) -> BatchItems:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_one(index: int, issue: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    return index, await self.analyze_fn(**issue)
+                except Exception as e:
+                    return index, {"error": str(e)}
+
+        return list(await asyncio.gather(*(run_one(index, issue) for index, issue in items)))
+
+
+class AnthropicBatchBackend:
+    """Submits every prompt in one Message Batches request and collects results when it ends"""
+
+    name = "anthropic"
+
+    def __init__(
+        self,
+        api_key: str,
+        build_prompt: Callable[..., str],
+        parse_response: Callable[[str, str, str], Dict[str, Any]],
+        model: str = "claude-3-haiku-20240307",
+        max_tokens: int = 4095,
+        poll_interval: float = 10.0
+    ):
+        self.api_key = api_key
+        self.build_prompt = build_prompt
+        self.parse_response = parse_response
+        self.model = model
+        self.max_tokens = max_tokens
+        self.poll_interval = poll_interval
+
+    async def run(self, items: BatchItems) -> BatchItems:
+        import anthropic
+
+        client = anthropic.AsyncAnthropic(api_key=self.api_key)
+        issues = dict(items)
+        requests = [
+            {
+                "custom_id": str(index),
+                "params": {
+                    "model": self.model,
+                    "max_tokens": self.max_tokens,
+                    "temperature": 0.7,
+                    "messages": [{"role": "user", "content": self.build_prompt(**issue)}]
+                }
+            }
+            for index, issue in items
+        ]
+
+        batch = await client.messages.batches.create(requests=requests)
+        print(f"Submitted provider batch {batch.id} with {len(requests)} requests")
+
+        while batch.processing_status != "ended":
+            await asyncio.sleep(self.poll_interval)
+            batch = await client.messages.batches.retrieve(batch.id)
+
+        results = []
+        async for entry in await client.messages.batches.results(batch.id):
+            index = int(entry.custom_id)
+            issue = issues[index]
+            if entry.result.type == "succeeded":
+                response_text = entry.result.message.content[0].text
+                results.append((index, self.parse_response(response_text, issue["title"], issue["location"])))
+            else:
+                results.append((index, {"error": f"Provider batch request {entry.result.type}"}))
+        return results
+
+
+class LocalBackend:
+    """Offline stand-in: keyword routing with an optional simulated per-item latency"""
+
+    name = "local"
+
+    def __init__(self, latency: float = 0.0, max_concurrency: int = 8):
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+
+    async def _analyze(self, **issue) -> Dict[str, Any]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return route_issue_locally(**issue)
+
+    async def run(self, items: BatchItems) -> BatchItems:
+        return await ConcurrentBackend(self._analyze, self.max_concurrency).run(items)
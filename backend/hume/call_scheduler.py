@@ -0,0 +1,261 @@
+"""
+Outbound call scheduler for report campaigns.
+
+Reports are queued with the location and agency they concern. Reports for
+the same (normalized) location and agency that arrive within merge_window
+seconds are merged into one call group, so the agency hears about a site
+once. Ready groups are dialed through a token bucket (calls_per_second with
+a small burst) and at most max_concurrent_calls are in flight at a time.
+A dial that fails with a rate-limit response (HTTP 429) is retried with
+backoff; other failures mark the group failed.
+
+Once the dial returns, the group is "in_progress": the call exists but is
+still ringing or talking, so it keeps its slot. The Twilio status callback
+reports the final status through call_ended(), which marks the group
+completed or failed and frees the slot. A call with no final status after
+call_timeout seconds is marked "timed_out" so a lost webhook can't hold a
+slot forever.
+
+Groups stay in `groups` until forget() drops them; on_group_done(group) is
+called as each group reaches a final status, so the owner can evict what it
+no longer needs.
+
+The scheduler only knows a dial coroutine, so it runs the same against
+Twilio or against fake_twilio.FakeTwilioClient. State is in memory, so the
+status callback must reach the process that dialed.
+"""
+import asyncio
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+# Final CallStatus values Twilio sends to the status callback
+FINAL_CALL_STATUSES = ("completed", "busy", "no-answer", "failed", "canceled")
+# Group statuses that no longer change
+FINAL_GROUP_STATUSES = ("completed", "failed", "timed_out")
+
+
+def normalize_location(location: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", location.lower())).strip()
+
+
+@dataclass
+class CallGroup:
+    id: str
+    location: str
+    agency: str
+    reports: List[Dict[str, Any]] = field(default_factory=list)
+    status: str = "pending"
+    attempts: int = 0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    dialed_at: Optional[float] = None
+    ended_at: Optional[float] = None
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return normalize_location(self.location), self.agency
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "group_id": self.id,
+            "location": self.location,
+            "agency": self.agency,
+            "report_count": len(self.reports),
+            "status": self.status,
+            "attempts": self.attempts,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "dialed_at": self.dialed_at,
+            "ended_at": self.ended_at
+        }
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average with bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+Dialer = Callable[[CallGroup], Awaitable[Dict[str, Any]]]
+
+
+class CallScheduler:
+    def __init__(
+        self,
+        dial: Dialer,
+        max_concurrent_calls: int = 2,
+        calls_per_second: float = 1.0,
+        burst: int = 1,
+        merge_window: float = 5.0,
+        max_retries: int = 3,
+        retry_backoff: float = 2.0,
+        call_timeout: float = 1800.0,
+        on_group_done: Optional[Callable[[CallGroup], None]] = None
+    ):
+        self.dial = dial
+        self.merge_window = merge_window
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.call_timeout = call_timeout
+        self.on_group_done = on_group_done
+        self.bucket = TokenBucket(calls_per_second, burst)
+        self.groups: Dict[str, CallGroup] = {}
+        self._pending: Dict[Tuple[str, str], CallGroup] = {}
+        self._slots = asyncio.Semaphore(max(1, max_concurrent_calls))
+        self._ready: "asyncio.Queue[CallGroup]" = asyncio.Queue()
+        self._unfinished = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._tasks = set()
+        # call sid -> (group, timeout handle) for calls waiting on their final status
+        self._active: Dict[str, Tuple[CallGroup, asyncio.TimerHandle]] = {}
+
+    def start(self) -> None:
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+    def submit(self, report: Dict[str, Any], location: str, agency: str) -> CallGroup:
+        """Queue a report; it joins a pending group for the same location and agency if one exists"""
+        key = (normalize_location(location), agency)
+        group = self._pending.get(key)
+        if group is None:
+            group = CallGroup(id=uuid.uuid4().hex, location=location, agency=agency)
+            self.groups[group.id] = group
+            self._pending[key] = group
+            self._unfinished += 1
+            self._idle.clear()
+            asyncio.get_running_loop().call_later(self.merge_window, self._mark_ready, group)
+        group.reports.append(report)
+        return group
+
+    def _mark_ready(self, group: CallGroup) -> None:
+        # Later reports for this key start a new group
+        if self._pending.get(group.key) is group:
+            del self._pending[group.key]
+        group.status = "queued"
+        self._ready.put_nowait(group)
+
+    async def drain(self) -> None:
+        """Wait until every submitted group's call has ended or failed"""
+        await self._idle.wait()
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            group = await self._ready.get()
+            await self.bucket.acquire()
+            await self._slots.acquire()
+            task = asyncio.create_task(self._dial_group(group))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dial_group(self, group: CallGroup) -> None:
+        try:
+            group.status = "dialing"
+            group.attempts += 1
+            group.dialed_at = time.time()
+            group.result = await self.dial(group)
+        except Exception as e:
+            self._slots.release()
+            rate_limited = getattr(e, "status", None) == 429
+            if rate_limited and group.attempts <= self.max_retries:
+                retry_delay = self.retry_backoff * (2 ** (group.attempts - 1))
+                group.status = "queued"
+                print(f"Call group {group.id} rate limited, retrying in {retry_delay:.1f}s")
+                asyncio.get_running_loop().call_later(retry_delay, self._ready.put_nowait, group)
+                return
+            group.status = "failed"
+            group.error = str(e)
+            print(f"Call group {group.id} failed: {e}")
+            self._group_done(group)
+            return
+
+        # The slot stays taken until the call's final status arrives
+        call_sid = group.result["call_sid"]
+        group.status = "in_progress"
+        timeout = asyncio.get_running_loop().call_later(self.call_timeout, self._call_timed_out, call_sid)
+        self._active[call_sid] = (group, timeout)
+
+    def call_ended(self, call_sid: str, call_status: str) -> bool:
+        """Record a call's final status from the status callback; False if the call isn't one of ours"""
+        if call_status not in FINAL_CALL_STATUSES or call_sid not in self._active:
+            return False
+        group, timeout = self._active.pop(call_sid)
+        timeout.cancel()
+        group.result["call_status"] = call_status
+        if call_status == "completed":
+            group.status = "completed"
+        else:
+            group.status = "failed"
+            group.error = f"Call ended with status {call_status}"
+        self._finish_call(group)
+        return True
+
+    def _call_timed_out(self, call_sid: str) -> None:
+        group, _ = self._active.pop(call_sid)
+        group.status = "timed_out"
+        group.error = f"No final call status within {self.call_timeout:.0f}s"
+        print(f"Call group {group.id}: {group.error}")
+        self._finish_call(group)
+
+    def _finish_call(self, group: CallGroup) -> None:
+        group.ended_at = time.time()
+        self._slots.release()
+        self._group_done(group)
+
+    def _group_done(self, group: CallGroup) -> None:
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._idle.set()
+        if self.on_group_done is not None:
+            try:
+                self.on_group_done(group)
+            except Exception as e:
+                print(f"on_group_done failed for call group {group.id}: {e}")
+
+    def forget(self, group_ids: List[str]) -> None:
+        """Drop finished groups from `groups`; groups still in flight are kept"""
+        for group_id in group_ids:
+            group = self.groups.get(group_id)
+            if group is not None and group.status in FINAL_GROUP_STATUSES:
+                del self.groups[group_id]
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for group in self.groups.values():
+            counts[group.status] = counts.get(group.status, 0) + 1
+        reports = sum(len(group.reports) for group in self.groups.values())
+        return {
+            "groups": len(self.groups),
+            "reports": reports,
+            "merged_reports": reports - len(self.groups),
+            "by_status": counts
+        }
@@ -0,0 +1,123 @@
+"""
+Durable store for outbound call records.
+
+Calls live in a SQLite database in WAL mode so several uvicorn workers can
+share it: the status webhook updates one row by call SID, and /calls pages
+through an index on (status, created_at, call_sid) instead of serializing
+every record. The page cursor is "<created_at>:<call_sid>" of the last row,
+so calls created in the same instant are neither skipped nor repeated.
+"""
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from shared.sqlite_util import ThreadLocalConnections
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    call_sid TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    report_data TEXT NOT NULL,
+    start_time TEXT,
+    summary TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+DROP INDEX IF EXISTS calls_created;
+DROP INDEX IF EXISTS calls_status_created;
+CREATE INDEX IF NOT EXISTS calls_created_sid ON calls (created_at, call_sid);
+CREATE INDEX IF NOT EXISTS calls_status_created_sid ON calls (status, created_at, call_sid);
+"""
+
+MAX_PAGE_SIZE = 500
+
+
+def parse_cursor(cursor: str) -> Tuple[float, str]:
+    """(created_at, call_sid) from a next_before cursor"""
+    created_at, _, call_sid = cursor.partition(":")
+    try:
+        return float(created_at), call_sid
+    except ValueError:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+
+
+class CallStore:
+    def __init__(self, path: str):
+        self.connections = ThreadLocalConnections(path, SCHEMA)
+
+    @staticmethod
+    def _row_to_record(row) -> Dict[str, Any]:
+        return {
+            "call_sid": row["call_sid"],
+            "status": row["status"],
+            "report_data": json.loads(row["report_data"]),
+            "start_time": row["start_time"],
+            "summary": json.loads(row["summary"]) if row["summary"] else None,
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"]
+        }
+
+    def insert(self, call_sid: str, status: str, report_data: Dict[str, Any], start_time=None) -> None:
+        now = time.time()
+        self.connections.get().execute(
+            """INSERT OR REPLACE INTO calls (call_sid, status, report_data, start_time, summary, created_at, updated_at)
+               VALUES (?, ?, ?, ?, NULL, ?, ?)""",
+            (call_sid, status, json.dumps(report_data), str(start_time) if start_time else None, now, now)
+        )
+
+    def get(self, call_sid: str) -> Optional[Dict[str, Any]]:
+        row = self.connections.get().execute("SELECT * FROM calls WHERE call_sid = ?", (call_sid,)).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def update_status(self, call_sid: str, status: str) -> bool:
+        """Returns False when the call is unknown"""
+        cursor = self.connections.get().execute(
+            "UPDATE calls SET status = ?, updated_at = ? WHERE call_sid = ?",
+            (status, time.time(), call_sid)
+        )
+        return cursor.rowcount > 0
+
+    def set_summary(self, call_sid: str, summary: Dict[str, Any]) -> bool:
+        cursor = self.connections.get().execute(
+            "UPDATE calls SET summary = ?, updated_at = ? WHERE call_sid = ?",
+            (json.dumps(summary), time.time(), call_sid)
+        )
+        return cursor.rowcount > 0
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        before: Optional[str] = None,
+        limit: int = 50
+    ) -> Dict[str, Any]:
+        """Newest-first page of calls; pass the returned next_before to fetch the next page"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        if before:
+            before_at, before_sid = parse_cursor(before)
+            clauses.append("(created_at < ? OR (created_at = ? AND call_sid < ?))")
+            params.extend([before_at, before_at, before_sid])
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.connections.get().execute(
+            f"SELECT * FROM calls {where} ORDER BY created_at DESC, call_sid DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+
+        calls = [self._row_to_record(row) for row in rows[:limit]]
+        last = calls[-1] if len(rows) > limit else None
+        return {
+            "calls": calls,
+            "next_before": f"{last['created_at']!r}:{last['call_sid']}" if last else None
+        }
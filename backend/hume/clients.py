@@ -0,0 +1,80 @@
+"""
+Shared provider clients for the analyzer (analyze_issue.py) and the caller (app.py).
+
+Clients are created once per process and reused, so calls share pooled
+keep-alive connections instead of paying a new TLS handshake each time. The
+Twilio SDK and requests are blocking, so async code runs them through
+run_blocking(), which uses one bounded thread pool rather than the default
+executor. Credentials are checked once at startup with missing_credentials().
+"""
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "8"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+# Point the Twilio SDK at another host, e.g. the load-test stand-in in backend/loadtest
+TWILIO_API_BASE_URL = os.getenv("TWILIO_API_BASE_URL")
+
+TWILIO_CREDENTIALS = ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_PHONE_NUMBER")
+HUME_CREDENTIALS = ("HUME_API_KEY",)
+
+_blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking-sdk")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking SDK call on the shared bounded thread pool, in a copy of the caller's context"""
+    loop = asyncio.get_running_loop()
+    # Like asyncio.to_thread: the copied context carries the current Trace, so spans inside fn are recorded
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_blocking_executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+def missing_credentials(names: Iterable[str]) -> List[str]:
+    return [name for name in names if not os.getenv(name)]
+
+
+def log_missing_credentials(service: str, names: Iterable[str]) -> List[str]:
+    """Warn once at startup instead of re-checking on every request"""
+    missing = missing_credentials(names)
+    if missing:
+        print(f"Warning: {service} credentials not configured. Missing: {', '.join(missing)}")
+    return missing
+
+
+def _pooled_adapter() -> HTTPAdapter:
+    return HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+
+
+@functools.lru_cache(maxsize=None)
+def get_http_session() -> requests.Session:
+    """Process-wide requests session with a connection pool sized for the blocking pool"""
+    session = requests.Session()
+    session.mount("https://", _pooled_adapter())
+    session.mount("http://", _pooled_adapter())
+    return session
+
+
+@functools.lru_cache(maxsize=None)
+def get_twilio_client():
+    """Process-wide Twilio client; TWILIO_FAKE=1 swaps in the offline fake"""
+    if os.getenv("TWILIO_FAKE") == "1":
+        from fake_twilio import FakeTwilioClient
+        return FakeTwilioClient()
+
+    from twilio.http.http_client import TwilioHttpClient
+    from twilio.rest import Client
+
+    http_client = TwilioHttpClient(pool_connections=True)
+    http_client.session.mount("https://", _pooled_adapter())
+    http_client.session.mount("http://", _pooled_adapter())
+    client = Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"), http_client=http_client)
+    if TWILIO_API_BASE_URL:
+        client.api.base_url = TWILIO_API_BASE_URL.rstrip("/")
+    return client
@@ -0,0 +1,74 @@
+"""
+In-process stand-in for twilio.rest.Client, for exercising call paths offline.
+
+Only client.calls.create(...) is implemented. Each call sleeps for the
+configured latency, and creating more than max_concurrent calls at once
+raises FakeTwilioError with status 429, like Twilio's concurrency limit.
+When a status_callback URL is given, the fake posts CallStatus=completed to
+it after call_seconds, the way Twilio reports a finished call.
+Set TWILIO_FAKE=1 to use it in app.py.
+"""
+import itertools
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+
+class FakeTwilioError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class _FakeCalls:
+    def __init__(self, latency: float, max_concurrent: int, call_seconds: float):
+        self.latency = latency
+        self.max_concurrent = max_concurrent
+        self.call_seconds = call_seconds
+        self.created: List[Dict[str, Any]] = []
+        self._in_flight = 0
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create(self, to: str, from_: str, url: str, **kwargs):
+        with self._lock:
+            if self._in_flight >= self.max_concurrent:
+                raise FakeTwilioError(429, "Too many concurrent requests")
+            self._in_flight += 1
+        try:
+            time.sleep(self.latency)
+            sid = f"CAFAKE{next(self._counter):026d}"
+            with self._lock:
+                self.created.append({"sid": sid, "to": to, "from": from_, "url": url, "created_at": time.time(), **kwargs})
+            if kwargs.get("status_callback"):
+                timer = threading.Timer(self.call_seconds, self._report_completed, (kwargs["status_callback"], sid))
+                timer.daemon = True
+                timer.start()
+            return SimpleNamespace(sid=sid, status="queued", start_time=None)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+    @staticmethod
+    def _report_completed(url: str, sid: str) -> None:
+        data = urllib.parse.urlencode({"CallSid": sid, "CallStatus": "completed"}).encode()
+        try:
+            urllib.request.urlopen(url, data=data, timeout=10).close()
+        except Exception as e:
+            print(f"Fake Twilio could not post status for {sid}: {e}")
+
+
+class FakeTwilioClient:
+    def __init__(self, latency: float = None, max_concurrent: int = None, call_seconds: float = None):
+        if latency is None:
+            latency = float(os.getenv("TWILIO_FAKE_LATENCY", "0.2"))
+        if max_concurrent is None:
+            max_concurrent = int(os.getenv("TWILIO_FAKE_MAX_CONCURRENT", "5"))
+        if call_seconds is None:
+            call_seconds = float(os.getenv("TWILIO_FAKE_CALL_SECONDS", "1.0"))
+        self.calls = _FakeCalls(latency, max_concurrent, call_seconds)
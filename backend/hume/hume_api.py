@@ -0,0 +1,66 @@
+"""
+Async client for the Hume EVI REST API.
+
+One HumeClient wraps a shared httpx.AsyncClient so requests reuse pooled
+keep-alive connections. Every request has a timeout and is retried with
+exponential backoff on timeouts, connection errors, 429 and 5xx responses.
+A semaphore bounds how many requests run at once, so a burst of completed
+calls can't flood Hume or exhaust the pool.
+"""
+import asyncio
+import os
+import random
+from typing import Any, Dict, Optional
+
+import httpx
+
+HUME_API_BASE_URL = os.getenv("HUME_API_BASE_URL", "https://api.hume.ai")
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class HumeClient:
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = HUME_API_BASE_URL,
+        timeout: float = 10.0,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        backoff: float = 1.0
+    ):
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            headers={"Authorization": f"Bearer {api_key}"},
+            limits=httpx.Limits(max_connections=max_concurrency * 2, max_keepalive_connections=max_concurrency)
+        )
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send a request, retrying transient failures; the last response or error is returned/raised"""
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await self.http.request(method, path, **kwargs)
+                    if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                        return response
+                    print(f"Hume {method} {path} returned {response.status_code}, retrying")
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    if attempt == self.max_retries:
+                        raise
+                    print(f"Hume {method} {path} failed ({e!r}), retrying")
+                # Exponential backoff with jitter so retries from a burst spread out
+                await asyncio.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+
+    async def get_call_summary(self, call_sid: str) -> Optional[Dict[str, Any]]:
+        response = await self.request("GET", f"/v0/evi/calls/{call_sid}/summary")
+        if response.status_code == 200:
+            return response.json()
+        print(f"No summary for call {call_sid}: {response.status_code} {response.text}")
+        return None
@@ -0,0 +1,59 @@
+"""
+Content-addressed cache of Hume EVI configs.
+
+A config template is identified by a SHA-256 hash of its canonical JSON. The
+first time a template is used it is created through the Hume configs API and
+its id is stored in a local JSON cache; later calls reuse that id without any
+network round-trip. app.py keeps a single template for every call, so its
+config is created once.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+
+
+def template_hash(config_data: Dict[str, Any]) -> str:
+    canonical = json.dumps(config_data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ConfigCache:
+    """Maps template hashes to Hume config ids, persisted to a JSON file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable Hume config cache {path}: {e}")
+
+    def _save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get_or_create(self, config_data: Dict[str, Any], create: Callable[[Dict[str, Any]], str]) -> str:
+        """Return the cached config id for this template, creating it once if needed"""
+        key = template_hash(config_data)
+        entry = self._entries.get(key)
+        if entry:
+            return entry["id"]
+
+        # Serialize creation so concurrent first calls don't create duplicate configs
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                return entry["id"]
+            config_id = create(config_data)
+            self._entries[key] = {"id": config_id, "name": config_data.get("name"), "created_at": time.time()}
+            self._save()
+            print(f"Created Hume config {config_id} for template {key[:12]}")
+            return config_id
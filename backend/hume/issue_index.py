@@ -0,0 +1,175 @@
+"""
+Spatial index of reported issues, with a persistent geocode cache.
+
+Issues are stored in SQLite with a 9-character geohash (about 5 m cells) under
+a B-tree index. A radius or bounding-box query scans only the few geohash
+ranges that cover the query area, then filters by exact distance, so "what has
+already been reported within 50 m" stays fast as the table grows.
+
+Free-text locations are geocoded once: by explicit "lat, lon", else through
+the offline gazetteer. Places found are cached in the geocodes table. Misses
+are not, so a location starts to resolve as soon as the gazetteer gains it.
+"""
+import json
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from shared.geo import (
+    PREFIX_END,
+    Gazetteer,
+    bbox_around,
+    covering_cells,
+    geohash_encode,
+    haversine_m,
+    normalize_location,
+    parse_coordinates
+)
+from shared.sqlite_util import ThreadLocalConnections
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    id TEXT PRIMARY KEY,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    geohash TEXT NOT NULL,
+    title TEXT,
+    category TEXT,
+    location TEXT,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS issues_geohash ON issues (geohash);
+CREATE TABLE IF NOT EXISTS geocodes (
+    query TEXT PRIMARY KEY,
+    lat REAL,
+    lon REAL,
+    source TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+GEOHASH_PRECISION = 9
+MAX_RESULTS = 500
+
+
+class IssueIndex:
+    def __init__(self, path: str, gazetteer: Optional[Gazetteer] = None, on_write: Optional[Callable[[], None]] = None):
+        self.connections = ThreadLocalConnections(path, SCHEMA, on_write)
+        self.gazetteer = gazetteer or Gazetteer()
+
+    def geocode(self, location: str) -> Optional[Tuple[float, float]]:
+        """(lat, lon) for a free-text location, or None if it can't be placed"""
+        coordinates = parse_coordinates(location)
+        if coordinates:
+            return coordinates
+
+        query = normalize_location(location)
+        if not query:
+            return None
+        conn = self.connections.get()
+        # Rows without coordinates are misses cached by older versions, so look those up again
+        row = conn.execute(
+            "SELECT lat, lon FROM geocodes WHERE query = ? AND lat IS NOT NULL", (query,)
+        ).fetchone()
+        if row is not None:
+            return row["lat"], row["lon"]
+
+        point = self.gazetteer.lookup(location)
+        if point is None:
+            return None
+        conn.execute(
+            "INSERT OR REPLACE INTO geocodes (query, lat, lon, source, created_at) VALUES (?, ?, ?, ?, ?)",
+            (query, point[0], point[1], "gazetteer", time.time())
+        )
+        self.connections.wrote()
+        return point
+
+    def add(self, lat: float, lon: float, title: str = "", category: str = "", location: str = "",
+            data: Optional[Dict[str, Any]] = None, issue_id: Optional[str] = None) -> str:
+        issue_id = issue_id or uuid.uuid4().hex
+        self.connections.get().execute(
+            """INSERT OR REPLACE INTO issues (id, lat, lon, geohash, title, category, location, data, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (issue_id, lat, lon, geohash_encode(lat, lon, GEOHASH_PRECISION), title, category, location,
+             json.dumps(data or {}), time.time())
+        )
+        self.connections.wrote()
+        return issue_id
+
+    def _in_cells(self, cells: List[str], extra: str = "", params: Tuple = (), columns: str = "*",
+                  column_params: Tuple = (), suffix: str = "") -> List[Any]:
+        """Rows whose geohash falls under any of cells, one index range per cell"""
+        ranges = " OR ".join("(geohash >= ? AND geohash < ?)" for _ in cells)
+        cell_params = [bound for cell in cells for bound in (cell, cell + PREFIX_END)]
+        return self.connections.get().execute(
+            f"SELECT {columns} FROM issues WHERE ({ranges}) {extra} {suffix}",
+            (*column_params, *cell_params, *params)
+        ).fetchall()
+
+    @staticmethod
+    def _row_to_issue(row, distance: Optional[float] = None) -> Dict[str, Any]:
+        issue = {
+            "id": row["id"],
+            "lat": row["lat"],
+            "lon": row["lon"],
+            "title": row["title"],
+            "category": row["category"],
+            "location": row["location"],
+            "data": json.loads(row["data"]),
+            "created_at": row["created_at"]
+        }
+        if distance is not None:
+            issue["distance_m"] = round(distance, 1)
+        return issue
+
+    def _time_filter(self, since: Optional[float]) -> Tuple[str, Tuple]:
+        return ("AND created_at >= ?", (since,)) if since is not None else ("", ())
+
+    def within_radius(self, lat: float, lon: float, radius_m: float, since: Optional[float] = None,
+                      limit: int = 100) -> List[Dict[str, Any]]:
+        """Issues within radius_m of a point, nearest first"""
+        min_lat, min_lon, max_lat, max_lon = bbox_around(lat, lon, radius_m)
+        extra, params = self._time_filter(since)
+        rows = self._in_cells(
+            covering_cells(min_lat, min_lon, max_lat, max_lon),
+            f"AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? {extra}",
+            (min_lat, max_lat, min_lon, max_lon, *params)
+        )
+        matches = []
+        for row in rows:
+            distance = haversine_m(lat, lon, row["lat"], row["lon"])
+            if distance <= radius_m:
+                matches.append((distance, row))
+        matches.sort(key=lambda match: match[0])
+        return [self._row_to_issue(row, distance) for distance, row in matches[:min(limit, MAX_RESULTS)]]
+
+    def within_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                    since: Optional[float] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Newest issues inside a bounding box"""
+        extra, params = self._time_filter(since)
+        rows = self._in_cells(
+            covering_cells(min_lat, min_lon, max_lat, max_lon),
+            f"AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? {extra}",
+            (min_lat, max_lat, min_lon, max_lon, *params, min(limit, MAX_RESULTS)),
+            suffix="ORDER BY created_at DESC LIMIT ?"
+        )
+        return [self._row_to_issue(row) for row in rows]
+
+    def clusters(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float, precision: int,
+                 since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Issue counts and centroids per geohash cell of the given precision inside a bounding box"""
+        precision = max(1, min(precision, GEOHASH_PRECISION))
+        extra, params = self._time_filter(since)
+        rows = self._in_cells(
+            covering_cells(min_lat, min_lon, max_lat, max_lon, max_precision=precision),
+            f"AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? {extra}",
+            (min_lat, max_lat, min_lon, max_lon, *params),
+            columns="substr(geohash, 1, ?) AS cell, COUNT(*) AS count, AVG(lat) AS lat, AVG(lon) AS lon",
+            column_params=(precision,),
+            suffix="GROUP BY cell ORDER BY count DESC"
+        )
+        return [
+            {"cell": row["cell"], "count": row["count"], "lat": row["lat"], "lon": row["lon"]}
+            for row in rows
+        ]
@@ -0,0 +1,267 @@
+"""
+Durable job queue for /analyze-and-call.
+
+Jobs are rows in a SQLite database and move through named stages
+("analyze" -> "call" -> "done"). Each stage's result is committed before the
+job advances, so a retry only re-runs the stage that failed. Workers claim
+jobs with a lease; a job whose worker died is picked up again once the lease
+expires.
+
+Submitting the same idempotency key twice returns the existing job instead of
+creating a new one.
+
+Jobs made of many items (batch analysis) store each item's result as its own
+job_items row as it arrives, so a retried stage skips finished items. A stage
+waiting on outside work calls defer() to be claimed again later without
+using up an attempt.
+"""
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from shared.sqlite_util import ThreadLocalConnections
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    idempotency_key TEXT UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_run_at REAL NOT NULL,
+    lease_expires_at REAL,
+    worker_id TEXT,
+    result TEXT NOT NULL DEFAULT '{}',
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (status, next_run_at);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+) WITHOUT ROWID;
+"""
+
+
+class RetryableError(Exception):
+    """A stage failed in a way that is safe to retry"""
+
+
+class JobQueue:
+    def __init__(self, path: str, lease_seconds: float = 300, retry_base_delay: float = 5.0,
+                 on_write: Optional[Callable[[], None]] = None):
+        self.connections = ThreadLocalConnections(path, SCHEMA, on_write)
+        self.lease_seconds = lease_seconds
+        self.retry_base_delay = retry_base_delay
+
+    @staticmethod
+    def _row_to_job(row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"])
+        return job
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        first_stage: str,
+        idempotency_key: Optional[str] = None,
+        max_attempts: int = 3
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Insert a job; returns (job, created) where created is False for a repeated key"""
+        conn = self.connections.get()
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        cursor = conn.execute(
+            """INSERT OR IGNORE INTO jobs
+               (id, idempotency_key, kind, payload, stage, status, max_attempts, next_run_at, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?, ?)""",
+            (job_id, idempotency_key, kind, json.dumps(payload), first_stage, max_attempts, now, now, now)
+        )
+        if cursor.rowcount == 0:
+            return self.get_by_key(idempotency_key), False
+        self.connections.wrote()
+        return self.get(job_id), True
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self.connections.get().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def get_by_key(self, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        row = self.connections.get().execute(
+            "SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,)
+        ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Lease the next runnable job, including jobs whose previous lease ran out"""
+        conn = self.connections.get()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                """SELECT id FROM jobs
+                   WHERE (status = 'queued' AND next_run_at <= ?)
+                      OR (status = 'running' AND lease_expires_at < ?)
+                   ORDER BY next_run_at LIMIT 1""",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                """UPDATE jobs SET status = 'running', worker_id = ?, lease_expires_at = ?,
+                   attempts = attempts + 1, updated_at = ? WHERE id = ?""",
+                (worker_id, now + self.lease_seconds, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.connections.wrote()
+        return self.get(row["id"])
+
+    def save_stage(self, job: Dict[str, Any], next_stage: str, updates: Dict[str, Any]) -> None:
+        """Commit a stage's output and move the job to next_stage; resets the attempt budget"""
+        job["result"].update(updates)
+        job["stage"] = next_stage
+        status = "completed" if next_stage == "done" else "running"
+        self.connections.get().execute(
+            """UPDATE jobs SET stage = ?, status = ?, result = ?, attempts = CASE WHEN ? = 'done' THEN attempts ELSE 1 END,
+               error = NULL, updated_at = ? WHERE id = ?""",
+            (next_stage, status, json.dumps(job["result"]), next_stage, time.time(), job["id"])
+        )
+        self.connections.wrote()
+        job["status"] = status
+        if next_stage != "done":
+            job["attempts"] = 1
+
+    def update_result(self, job: Dict[str, Any], updates: Dict[str, Any]) -> None:
+        """Persist extra result fields without changing stage or attempts"""
+        job["result"].update(updates)
+        self.connections.get().execute(
+            "UPDATE jobs SET result = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(job["result"]), time.time(), job["id"])
+        )
+        self.connections.wrote()
+
+    def fail(self, job: Dict[str, Any], error: str, retryable: bool = True) -> None:
+        """Schedule a retry with exponential backoff, or mark the job failed when out of attempts"""
+        now = time.time()
+        if retryable and job["attempts"] < job["max_attempts"]:
+            delay = self.retry_base_delay * (2 ** (job["attempts"] - 1))
+            status, next_run_at = "queued", now + delay
+        else:
+            status, next_run_at = "failed", job["next_run_at"]
+        self.connections.get().execute(
+            """UPDATE jobs SET status = ?, error = ?, next_run_at = ?, lease_expires_at = NULL,
+               result = ?, updated_at = ? WHERE id = ?""",
+            (status, error, next_run_at, json.dumps(job["result"]), now, job["id"])
+        )
+        self.connections.wrote()
+        job["status"] = status
+
+    def defer(self, job: Dict[str, Any], delay: float, updates: Optional[Dict[str, Any]] = None) -> None:
+        """Release a job to be claimed again after delay, without counting this claim as an attempt"""
+        job["result"].update(updates or {})
+        now = time.time()
+        self.connections.get().execute(
+            """UPDATE jobs SET status = 'queued', next_run_at = ?, lease_expires_at = NULL,
+               attempts = MAX(attempts - 1, 0), result = ?, updated_at = ? WHERE id = ?""",
+            (now + delay, json.dumps(job["result"]), now, job["id"])
+        )
+        self.connections.wrote()
+        job["status"] = "queued"
+
+    def save_items(self, job_id: str, items: List[Tuple[int, str, Dict[str, Any]]]) -> None:
+        """Store (index, status, result) for items of a job; items that already have a result are kept"""
+        if not items:
+            return
+        conn = self.connections.get()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO job_items (job_id, idx, status, result) VALUES (?, ?, ?, ?)",
+                [(job_id, index, status, json.dumps(result)) for index, status, result in items]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.connections.wrote()
+
+    def item_indexes(self, job_id: str) -> Set[int]:
+        rows = self.connections.get().execute("SELECT idx FROM job_items WHERE job_id = ?", (job_id,)).fetchall()
+        return {row["idx"] for row in rows}
+
+    def item_counts(self, job_id: str) -> Dict[str, int]:
+        rows = self.connections.get().execute(
+            "SELECT status, COUNT(*) AS count FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+        ).fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+    def items(self, job_id: str, offset: int = 0, limit: int = 100) -> Dict[int, Tuple[str, Dict[str, Any]]]:
+        """index -> (status, result) for the stored items with offset <= index < offset + limit"""
+        rows = self.connections.get().execute(
+            "SELECT idx, status, result FROM job_items WHERE job_id = ? AND idx >= ? AND idx < ? ORDER BY idx",
+            (job_id, offset, offset + limit)
+        ).fetchall()
+        return {row["idx"]: (row["status"], json.loads(row["result"])) for row in rows}
+
+
+StageHandler = Callable[[Dict[str, Any], JobQueue], Awaitable[None]]
+
+
+class JobWorker:
+    """Polls the queue and runs the handler registered for each job's kind"""
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, StageHandler], poll_interval: float = 1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.poll_interval = poll_interval
+        self.worker_id = uuid.uuid4().hex[:12]
+        self._stopped = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                job = await asyncio.to_thread(self.queue.claim, self.worker_id)
+            except Exception as e:
+                print(f"Worker {self.worker_id} failed to claim a job: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.run_job(job)
+
+    async def run_job(self, job: Dict[str, Any]) -> None:
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await asyncio.to_thread(self.queue.fail, job, f"No handler for job kind {job['kind']}", False)
+            return
+        try:
+            await handler(job, self.queue)
+        except RetryableError as e:
+            print(f"Job {job['id']} stage {job['stage']} failed (attempt {job['attempts']}): {e}")
+            await asyncio.to_thread(self.queue.fail, job, str(e), True)
+        except Exception as e:
+            print(f"Job {job['id']} stage {job['stage']} failed permanently: {e}")
+            await asyncio.to_thread(self.queue.fail, job, str(e), False)
@@ -0,0 +1,45 @@
+"""
+uvicorn factories for running each service locally, outside Modal.
+
+    python -m uvicorn loadtest.apps:detector_app --factory     (from backend/)
+
+The Modal apps are unwrapped with get_raw_f(), so the same FastAPI code that
+is deployed is what gets measured. run.py sets the environment (fake
+provider URLs, temp databases, DETECTOR_BACKEND=local) before starting them.
+"""
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+def _add_path(name: str) -> None:
+    path = str(BACKEND_DIR / name)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def fake_providers_app():
+    from loadtest.fake_providers import create_app
+    return create_app()
+
+
+def detector_app():
+    """inference.fastapi_app with the YOLO models loaded in-process"""
+    _add_path("object-detection")
+    import inference
+    return inference.fastapi_app.get_raw_f()()
+
+
+def analyzer_app():
+    """analyze_issue.api (issue analysis, batch jobs, job queue)"""
+    _add_path("hume")
+    import analyze_issue
+    return analyze_issue.api.get_raw_f()()
+
+
+def caller_app():
+    """hume/app.py (outbound calls, campaigns, call records)"""
+    _add_path("hume")
+    import app
+    return app.app
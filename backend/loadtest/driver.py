@@ -0,0 +1,181 @@
+"""
+Closed-loop HTTP load generator.
+
+`concurrency` workers each send one request at a time until `requests` have
+been sent or `duration` seconds have passed. Every response's latency and
+status are recorded, along with the stage timings from its Server-Timing
+header, and summarized by summarize().
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from shared.tracing import percentiles
+
+
+@dataclass
+class Scenario:
+    app: str
+    method: str
+    path: str
+    # Returns the keyword arguments (json=, data=, content=) for each request
+    body: Optional[Callable[[], Dict[str, Any]]] = None
+    ok_statuses: tuple = (200, 201, 202)
+
+
+@dataclass
+class Sample:
+    started: float
+    latency: float
+    status: int
+    stages: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Server-Timing "decode;dur=1.2, env_model;dur=30.5" -> {stage: seconds}"""
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    stages[name] = float(value) / 1000
+                except ValueError:
+                    pass
+    return stages
+
+
+async def send(client: httpx.AsyncClient, scenario: Scenario) -> Sample:
+    kwargs = scenario.body() if scenario.body else {}
+    started = time.perf_counter()
+    try:
+        response = await client.request(scenario.method, scenario.path, **kwargs)
+        latency = time.perf_counter() - started
+        return Sample(
+            started=started,
+            latency=latency,
+            status=response.status_code,
+            stages=parse_server_timing(response.headers.get("server-timing"))
+        )
+    except httpx.HTTPError as e:
+        return Sample(started=started, latency=time.perf_counter() - started, status=0, error=repr(e))
+
+
+async def run_load(
+    base_url: str,
+    scenario: Scenario,
+    concurrency: int,
+    requests: Optional[int] = None,
+    duration: Optional[float] = None,
+    warmup: int = 0,
+    timeout: float = 120.0
+) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for _ in range(warmup):
+            await send(client, scenario)
+
+        samples: List[Sample] = []
+        sent = 0
+        deadline = time.perf_counter() + duration if duration else None
+
+        async def worker():
+            nonlocal sent
+            while True:
+                if requests is not None and sent >= requests:
+                    return
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                sent += 1
+                samples.append(await send(client, scenario))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return summarize(samples, elapsed, scenario)
+
+
+def summarize(samples: List[Sample], elapsed: float, scenario: Scenario) -> Dict[str, Any]:
+    ok = [s for s in samples if s.status in scenario.ok_statuses]
+    statuses: Dict[str, int] = {}
+    for sample in samples:
+        statuses[str(sample.status)] = statuses.get(str(sample.status), 0) + 1
+
+    stage_values: Dict[str, List[float]] = {}
+    for sample in ok:
+        for stage, seconds in sample.stages.items():
+            stage_values.setdefault(stage, []).append(seconds)
+
+    return {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": len(samples) - len(ok),
+        "statuses": statuses,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_ms": percentiles([s.latency for s in ok], scale=1000),
+        "stages_ms": {stage: percentiles(values, scale=1000) for stage, values in sorted(stage_values.items())},
+        "sample_errors": sorted({s.error for s in samples if s.error})[:5]
+    }
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident memory of a process, from /proc (Linux) or psutil if installed"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+class MemorySampler:
+    """Polls a process's RSS in the background and keeps the first, peak and last readings"""
+
+    def __init__(self, pid: int, interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.readings: List[int] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict[str, Optional[float]]:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._sample()
+        return self.summary()
+
+    def _sample(self) -> None:
+        value = rss_bytes(self.pid)
+        if value is not None:
+            self.readings.append(value)
+
+    async def _run(self) -> None:
+        while True:
+            self._sample()
+            await asyncio.sleep(self.interval)
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        if not self.readings:
+            return {"rss_start_mb": None, "rss_peak_mb": None, "rss_end_mb": None}
+        to_mb = lambda value: round(value / (1024 * 1024), 1)
+        return {
+            "rss_start_mb": to_mb(self.readings[0]),
+            "rss_peak_mb": to_mb(max(self.readings)),
+            "rss_end_mb": to_mb(self.readings[-1])
+        }
@@ -0,0 +1,184 @@
+"""
+Local stand-ins for the Anthropic, Twilio and Hume APIs, served from one FastAPI app.
+
+Point the services at it with ANTHROPIC_BASE_URL, TWILIO_API_BASE_URL and
+HUME_API_BASE_URL. Latency is configurable per provider so load tests can
+model slow upstreams:
+
+    FAKE_ANTHROPIC_TTFT        seconds before the first streamed token (0.5)
+    FAKE_ANTHROPIC_LATENCY     seconds for the whole message (2.0)
+    FAKE_TWILIO_LATENCY        seconds per call create (0.2)
+    FAKE_TWILIO_MAX_CONCURRENT calls in flight before 429s, like Twilio's limit (5)
+    FAKE_HUME_LATENCY          seconds per Hume request (0.1)
+    FAKE_LATENCY_JITTER        +/- fraction applied to every delay (0.1)
+
+GET /stats returns request counts per provider.
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import uuid
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANTHROPIC_TTFT = float(os.getenv("FAKE_ANTHROPIC_TTFT", "0.5"))
+ANTHROPIC_LATENCY = float(os.getenv("FAKE_ANTHROPIC_LATENCY", "2.0"))
+TWILIO_LATENCY = float(os.getenv("FAKE_TWILIO_LATENCY", "0.2"))
+TWILIO_MAX_CONCURRENT = int(os.getenv("FAKE_TWILIO_MAX_CONCURRENT", "5"))
+HUME_LATENCY = float(os.getenv("FAKE_HUME_LATENCY", "0.1"))
+LATENCY_JITTER = float(os.getenv("FAKE_LATENCY_JITTER", "0.1"))
+
+STREAM_CHUNKS = 20
+
+PHOTO_ANSWER = {
+    "description": "Clear the litter from the sidewalk",
+    "environmental_task": "A sidewalk with scattered plastic bottles and bags near a storm drain",
+    "severity": 3,
+    "tags": ["litter", "sidewalk", "plastic"]
+}
+
+RECOMMENDATION = {
+    "selectedOrganization": "Department of Sanitation (DSNY)",
+    "organizationId": 2,
+    "justification": "Litter on public sidewalks is handled by DSNY street cleaning.",
+    "callScript": "Hello, I'm calling to report litter on the sidewalk that needs cleanup."
+}
+
+
+def jittered(seconds: float) -> float:
+    return max(0.0, seconds * (1 + random.uniform(-LATENCY_JITTER, LATENCY_JITTER)))
+
+
+def prompt_text(body: Dict[str, Any]) -> str:
+    parts = []
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get("text", "") for block in content if block.get("type") == "text")
+    return "\n".join(parts)
+
+
+def completion_text(prompt: str) -> str:
+    """Answer in the shape the calling service expects, based on its prompt"""
+    if "<answer>" in prompt:
+        return f"<answer>\n{json.dumps(PHOTO_ANSWER, indent=1)}\n</answer>"
+    analysis = "The report describes litter on a public sidewalk. " * 20
+    return f"<issue_analysis>\n{analysis}\n</issue_analysis>\n\n{json.dumps(RECOMMENDATION, indent=2)}"
+
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="Fake Anthropic/Twilio/Hume")
+    stats = {"anthropic": 0, "twilio": 0, "twilio_rejected": 0, "hume": 0}
+    twilio_state = {"in_flight": 0}
+    call_counter = itertools.count(1)
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/messages")
+    async def messages(request: Request):
+        stats["anthropic"] += 1
+        body = await request.json()
+        text = completion_text(prompt_text(body))
+        message = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "claude-fake"),
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": {"input_tokens": len(prompt_text(body)) // 4, "output_tokens": 1}
+        }
+
+        if not body.get("stream"):
+            await asyncio.sleep(jittered(ANTHROPIC_LATENCY))
+            message.update(
+                content=[{"type": "text", "text": text}],
+                stop_reason="end_turn",
+                usage={**message["usage"], "output_tokens": len(text) // 4}
+            )
+            return message
+
+        async def events():
+            yield sse("message_start", {"type": "message_start", "message": message})
+            yield sse("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+            await asyncio.sleep(jittered(ANTHROPIC_TTFT))
+            step = max(1, len(text) // STREAM_CHUNKS)
+            chunk_delay = max(0.0, ANTHROPIC_LATENCY - ANTHROPIC_TTFT) / STREAM_CHUNKS
+            for start in range(0, len(text), step):
+                yield sse("content_block_delta", {
+                    "type": "content_block_delta",
+                    "index": 0,
+                    "delta": {"type": "text_delta", "text": text[start:start + step]}
+                })
+                await asyncio.sleep(jittered(chunk_delay))
+            yield sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+            yield sse("message_delta", {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": len(text) // 4}
+            })
+            yield sse("message_stop", {"type": "message_stop"})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/2010-04-01/Accounts/{account_sid}/Calls.json")
+    async def create_call(account_sid: str, request: Request):
+        stats["twilio"] += 1
+        form = await request.form()
+        if twilio_state["in_flight"] >= TWILIO_MAX_CONCURRENT:
+            stats["twilio_rejected"] += 1
+            return JSONResponse(
+                content={"code": 20429, "message": "Too Many Requests", "more_info": "", "status": 429},
+                status_code=429
+            )
+        twilio_state["in_flight"] += 1
+        try:
+            await asyncio.sleep(jittered(TWILIO_LATENCY))
+        finally:
+            twilio_state["in_flight"] -= 1
+        return JSONResponse(content={
+            "sid": f"CAFAKE{next(call_counter):026d}",
+            "account_sid": account_sid,
+            "to": form.get("To"),
+            "from": form.get("From"),
+            "status": "queued",
+            "start_time": None,
+            "uri": f"/2010-04-01/Accounts/{account_sid}/Calls.json"
+        }, status_code=201)
+
+    @app.post("/v0/evi/configs")
+    async def create_config(request: Request):
+        stats["hume"] += 1
+        await asyncio.sleep(jittered(HUME_LATENCY))
+        return {"id": str(uuid.uuid4()), "version": 0}
+
+    @app.put("/v0/evi/configs/{config_id}")
+    async def update_config(config_id: str):
+        stats["hume"] += 1
+        await asyncio.sleep(jittered(HUME_LATENCY))
+        return {"id": config_id, "version": 1}
+
+    @app.get("/v0/evi/calls/{call_sid}/summary")
+    async def call_summary(call_sid: str):
+        stats["hume"] += 1
+        await asyncio.sleep(jittered(HUME_LATENCY))
+        return {
+            "call_sid": call_sid,
+            "summary": "The agent took the report and will schedule a cleanup.",
+            "emotions": {"confusion": 0.1, "frustration": 0.05, "satisfaction": 0.7}
+        }
+
+    return app
@@ -0,0 +1,318 @@
+"""
+Load-test the Envolve services locally against fake upstreams.
+
+Starts loadtest.fake_providers plus each service the chosen scenarios need
+(as uvicorn subprocesses on free ports), drives them at a fixed concurrency
+and writes a JSON report with throughput, p50/p95/p99 latency, Server-Timing
+stage breakdowns and peak RSS of the service process. Run from backend/:
+
+    python -m loadtest.run --scenario detect --concurrency 4 --requests 200 --output before.json
+    python -m loadtest.run --scenario detect --concurrency 4 --requests 200 --baseline before.json
+
+With --baseline, metrics that regress by more than --max-regression (15%)
+are listed and the exit status is 1, so it can gate a deploy. The detector
+runs its YOLO models on CPU in-process (DETECTOR_BACKEND=local); set
+ENV_MODEL_PATH/COCO_MODEL_PATH to choose weights. Requires the service
+dependencies plus modal (only to unwrap the app functions, nothing runs on
+Modal).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from loadtest import fake_providers
+from loadtest.driver import MemorySampler, Scenario, run_load
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+SAMPLE_ISSUE = {
+    "title": "Plastic bags and bottles piling up on sidewalk",
+    "description": "Overflowing litter near the storm drain on the corner, blowing into the street.",
+    "severity": "Medium",
+    "tags": "litter,plastic,sidewalk",
+    "location": "Broadway & W 116th St, New York, NY"
+}
+
+# Higher is worse for latency and memory; lower is worse for throughput
+COMPARED_METRICS = (
+    ("latency_ms.p50", 1),
+    ("latency_ms.p95", 1),
+    ("latency_ms.p99", 1),
+    ("throughput_rps", -1),
+    ("memory.rss_peak_mb", 1)
+)
+
+
+def image_payload(args) -> Dict[str, Any]:
+    if args.image:
+        import base64
+        with open(args.image, "rb") as f:
+            encoded = base64.b64encode(f.read()).decode("utf-8")
+    else:
+        # Same seeded synthetic images as the detector micro-benchmark
+        sys.path.insert(0, str(BACKEND_DIR / "object-detection"))
+        from bench_detect import parse_size, synthetic_jpeg_base64
+        encoded = synthetic_jpeg_base64(*parse_size(args.image_size))
+    return {"image": f"data:image/jpeg;base64,{encoded}"}
+
+
+def build_scenarios(args) -> Dict[str, Scenario]:
+    image = {}
+
+    def image_body():
+        # Encoded once, on first use, so non-image scenarios don't need OpenCV
+        if not image:
+            image.update(image_payload(args))
+        return {"json": image}
+
+    def analyze_and_call_body():
+        return {
+            "json": {**SAMPLE_ISSUE, "to_number": "+15555550100"},
+            "headers": {"Idempotency-Key": uuid.uuid4().hex}
+        }
+
+    return {
+        "detect": Scenario("detector", "POST", "/detect", image_body),
+        "detect-analyze": Scenario("detector", "POST", "/analyze", image_body),
+        "issue-analyze": Scenario("analyzer", "POST", "/analyze", lambda: {"json": SAMPLE_ISSUE}),
+        "analyze-and-call": Scenario("analyzer", "POST", "/analyze-and-call", analyze_and_call_body),
+        "initiate-call": Scenario("caller", "POST", "/initiate-call"),
+        "list-calls": Scenario("caller", "GET", "/calls?limit=50")
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(factory: str, port: int, env: Dict[str, str], log_dir: Path) -> subprocess.Popen:
+    log_file = open(log_dir / f"{factory}.log", "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"loadtest.apps:{factory}", "--factory",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=str(BACKEND_DIR),
+        env=env,
+        stdout=log_file,
+        stderr=subprocess.STDOUT
+    )
+
+
+def wait_ready(process: subprocess.Popen, url: str, timeout: float) -> None:
+    """Poll until the server answers; model loading can take a while on first start"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server for {url} exited with status {process.returncode}")
+        try:
+            httpx.get(url, timeout=2.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} not ready after {timeout:.0f}s")
+
+
+def service_env(providers_url: str, work_dir: Path) -> Dict[str, str]:
+    env = dict(os.environ)
+    # Upstreams always point at the fakes, whatever the shell has configured
+    env.update({
+        "ANTHROPIC_BASE_URL": providers_url,
+        "ANTHROPIC_API_KEY": "sk-ant-loadtest",
+        "TWILIO_API_BASE_URL": providers_url,
+        "TWILIO_ACCOUNT_SID": "AC" + "0" * 32,
+        "TWILIO_AUTH_TOKEN": "loadtest",
+        "TWILIO_PHONE_NUMBER": "+15555550000",
+        "TARGET_PHONE_NUMBER": "+15555550100",
+        "HUME_API_BASE_URL": providers_url,
+        "HUME_API_KEY": "loadtest",
+        "WEBHOOK_BASE_URL": "http://127.0.0.1",
+        "CALL_DB_PATH": str(work_dir / "calls.db"),
+        "HUME_CONFIG_CACHE_PATH": str(work_dir / "hume_configs.json"),
+        "JOB_QUEUE_PATH": str(work_dir / "jobs.db"),
+        "ANALYZE_BATCH_DISPATCH": "local",
+        "ISSUE_DB_PATH": str(work_dir / "issues.db"),
+        "GAZETTEER_PATH": str(work_dir / "nyc_gazetteer.csv"),
+        "TILE_DB_PATH": str(work_dir / "tiles.db"),
+        "REQUEST_LOG_DIR": str(work_dir / "analytics"),
+        "DETECTOR_BACKEND": "local",
+        "DETECTOR_DATA_DIR": str(work_dir),
+        "PYTHONUNBUFFERED": "1"
+    })
+    env.pop("TWILIO_FAKE", None)
+    env.pop("HUME_CONFIG_ID", None)
+    return env
+
+
+def git_revision() -> Dict[str, Any]:
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=str(BACKEND_DIR), capture_output=True, text=True).stdout.strip()
+        except OSError:
+            return ""
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain"))}
+
+
+def metric(report: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = report
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Describe every metric that got worse than the baseline by more than max_regression"""
+    regressions = []
+    for name, report in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for path, direction in COMPARED_METRICS:
+            new, old = metric(report, path), metric(base, path)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            print(f"  {name:18s} {path:20s} {old:>10.2f} -> {new:>10.2f} ({change:+.1%})")
+            if change * direction > max_regression:
+                regressions.append(f"{name} {path}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+async def run_scenario(name: str, scenario: Scenario, base_url: str, pid: int, args) -> Dict[str, Any]:
+    sampler = MemorySampler(pid)
+    sampler.start()
+    report = await run_load(
+        base_url,
+        scenario,
+        concurrency=args.concurrency,
+        requests=None if args.duration else args.requests,
+        duration=args.duration,
+        warmup=args.warmup
+    )
+    report["memory"] = await sampler.stop()
+    print(
+        f"{name}: {report['ok']}/{report['requests']} ok, {report['throughput_rps']} req/s, "
+        f"p50 {report['latency_ms']['p50']} ms, p95 {report['latency_ms']['p95']} ms, "
+        f"p99 {report['latency_ms']['p99']} ms, peak RSS {report['memory']['rss_peak_mb']} MB"
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test Envolve services against fake upstreams")
+    parser.add_argument("--scenario", action="append", help="Scenario to run (repeatable, default detect)")
+    parser.add_argument("--list", action="store_true", help="List scenarios and exit")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario")
+    parser.add_argument("--duration", type=float, default=None, help="Run each scenario for this many seconds instead")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured requests before each scenario")
+    parser.add_argument("--image", default=None, help="JPEG to send to the detector instead of a synthetic one")
+    parser.add_argument("--image-size", default="1280x720", help="Synthetic image size, WIDTHxHEIGHT")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", default=None, help="JSON report from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    args = parser.parse_args()
+
+    scenarios = build_scenarios(args)
+    if args.list:
+        for name, scenario in scenarios.items():
+            print(f"{name:18s} {scenario.app:9s} {scenario.method} {scenario.path}")
+        return
+
+    selected = args.scenario or ["detect"]
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(unknown)}")
+
+    work_dir = Path(tempfile.mkdtemp(prefix="envolve-loadtest-"))
+    processes: List[subprocess.Popen] = []
+    try:
+        providers_port = free_port()
+        providers_url = f"http://127.0.0.1:{providers_port}"
+        env = service_env(providers_url, work_dir)
+
+        providers = start_server("fake_providers_app", providers_port, env, work_dir)
+        processes.append(providers)
+        wait_ready(providers, f"{providers_url}/stats", args.startup_timeout)
+
+        services: Dict[str, Any] = {}
+        for app_name in dict.fromkeys(scenarios[name].app for name in selected):
+            port = free_port()
+            process = start_server(f"{app_name}_app", port, env, work_dir)
+            processes.append(process)
+            wait_ready(process, f"http://127.0.0.1:{port}/", args.startup_timeout)
+            services[app_name] = (f"http://127.0.0.1:{port}", process.pid)
+
+        results = {
+            "created_at": time.time(),
+            "git": git_revision(),
+            "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+            "config": {
+                "concurrency": args.concurrency,
+                "requests": None if args.duration else args.requests,
+                "duration": args.duration,
+                "warmup": args.warmup,
+                "image": args.image or f"synthetic {args.image_size}",
+                "fake_latency": {
+                    "anthropic_ttft": fake_providers.ANTHROPIC_TTFT,
+                    "anthropic": fake_providers.ANTHROPIC_LATENCY,
+                    "twilio": fake_providers.TWILIO_LATENCY,
+                    "hume": fake_providers.HUME_LATENCY,
+                    "jitter": fake_providers.LATENCY_JITTER
+                }
+            },
+            "scenarios": {}
+        }
+
+        for name in selected:
+            base_url, pid = services[scenarios[name].app]
+            results["scenarios"][name] = asyncio.run(run_scenario(name, scenarios[name], base_url, pid, args))
+
+        results["providers"] = httpx.get(f"{providers_url}/stats").json()
+    except RuntimeError as e:
+        print(f"Load test failed: {e} (server logs in {work_dir})")
+        sys.exit(2)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline} ({(baseline.get('git') or {}).get('commit')}):")
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print("Regressions over the allowed threshold:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions over the allowed threshold")
+
+
+if __name__ == "__main__":
+    main()
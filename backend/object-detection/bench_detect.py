@@ -0,0 +1,212 @@
+"""
+Micro-benchmark for Detector.detect, run locally (CPU by default).
+
+For every image size x object density it times each stage of detect
+(b64decode, imdecode, letterbox, env_model, coco_model or fused_model,
+env_tiles, boxes, draw, imencode, b64encode) from the detector's own trace, for each requested model
+format. It then times raw model calls at several batch sizes. Images are
+synthetic and seeded, so runs are comparable; pass --images to use real photos.
+
+    python bench_detect.py --sizes 640x480,1920x1080,4032x3024 --densities 0,20,80 \\
+        --formats pt,onnx --batch-sizes 1,4,8 --output bench.json
+
+Formats other than pt are exported from the COCO weights with ultralytics
+(onnx, openvino and torchscript need their own extra packages).
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import time
+from pathlib import Path
+
+from detector import Detector
+
+DEFAULT_SIZES = "640x480,1920x1080,4032x3024"
+DEFAULT_DENSITIES = "0,20,80"
+
+
+def synthetic_image(width, height, objects=12, seed=0):
+    """A BGR image of random filled shapes on a noisy background"""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 110, dtype=np.uint8)
+    img += rng.integers(0, 30, size=img.shape, dtype=np.uint8)
+    for _ in range(objects):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        size = int(rng.integers(min(width, height) // 20 + 1, min(width, height) // 5 + 2))
+        color = tuple(int(c) for c in rng.integers(0, 255, size=3))
+        if rng.random() < 0.5:
+            cv2.rectangle(img, (x, y), (x + size, y + size), color, -1)
+        else:
+            cv2.circle(img, (x, y), size // 2, color, -1)
+    return img
+
+
+def encode_base64(img, quality=90):
+    import cv2
+
+    _, buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return base64.b64encode(buffer).decode("utf-8")
+
+
+def synthetic_jpeg_base64(width, height, objects=12, seed=0):
+    return encode_base64(synthetic_image(width, height, objects, seed))
+
+
+def parse_size(value):
+    width, height = (int(v) for v in value.lower().split("x"))
+    return width, height
+
+
+def load_images(image_dir):
+    """(name, image) for every JPEG/PNG in image_dir, in name order"""
+    import cv2
+
+    images = []
+    for path in sorted(Path(image_dir).iterdir()):
+        if path.suffix.lower() in (".jpg", ".jpeg", ".png"):
+            img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if img is not None:
+                images.append((path.name, img))
+    return images
+
+
+def summarize(seconds):
+    """Mean/p50/p95 in milliseconds"""
+    if not seconds:
+        return None
+    ordered = sorted(seconds)
+    result = {"mean": round(sum(ordered) / len(ordered) * 1000, 2)}
+    for label, q in (("p50", 0.5), ("p95", 0.95)):
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        result[label] = round(ordered[index] * 1000, 2)
+    return result
+
+
+def export_model(weights, fmt, imgsz):
+    """Path to weights in the given ultralytics export format ("pt" returns weights unchanged)"""
+    if fmt == "pt":
+        return weights
+    from ultralytics import YOLO
+
+    print(f"Exporting {weights} to {fmt}")
+    return YOLO(weights).export(format=fmt, imgsz=imgsz)
+
+
+def bench_detect(detector, img_b64, repeats, warmup, conf):
+    for _ in range(warmup):
+        detector.detect(img_b64, conf_env=conf, conf_coco=conf)
+
+    totals, stages, boxes = [], {}, []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = detector.detect(img_b64, conf_env=conf, conf_coco=conf)
+        totals.append(time.perf_counter() - start)
+        if result is None:
+            raise RuntimeError("detect returned None")
+        for stage, seconds in result["timings"].items():
+            stages.setdefault(stage, []).append(seconds)
+        boxes.append(len(result["detections"]["env"]) + len(result["detections"]["coco"]))
+
+    return {
+        "total_ms": summarize(totals),
+        "stages_ms": {stage: summarize(values) for stage, values in stages.items()},
+        "boxes": round(sum(boxes) / len(boxes), 1)
+    }
+
+
+def bench_batch(model, img, batch_size, repeats, warmup, conf, device):
+    """Per-image latency and throughput of one model call over batch_size copies of img"""
+    batch = [img] * batch_size
+    for _ in range(warmup):
+        model(batch, conf=conf, device=device, verbose=False)
+
+    calls = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model(batch, conf=conf, device=device, verbose=False)
+        calls.append(time.perf_counter() - start)
+
+    mean_call = sum(calls) / len(calls)
+    return {
+        "batch_size": batch_size,
+        "call_ms": summarize(calls),
+        "per_image_ms": round(mean_call / batch_size * 1000, 2),
+        "images_per_second": round(batch_size / mean_call, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Detector.detect stage by stage")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated WIDTHxHEIGHT")
+    parser.add_argument("--densities", default=DEFAULT_DENSITIES, help="Comma-separated shape counts per image")
+    parser.add_argument("--images", default=None, help="Directory of photos to use instead of synthetic images")
+    parser.add_argument("--coco-model", default="yolov8n.pt")
+    parser.add_argument("--env-model", default=None, help="Fine-tuned weights (default: the trained model under --data-dir, skipped if missing)")
+    parser.add_argument("--data-dir", default=".", help="Local copy of the yolo-finetune volume")
+    parser.add_argument("--fused-model", default=None, help="Benchmark this fused model instead of the env/COCO pair")
+    parser.add_argument("--formats", default="pt", help="Comma-separated export formats, e.g. pt,onnx,openvino")
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--output", default=None, help="Write the JSON results here")
+    args = parser.parse_args()
+
+    if args.images:
+        images = load_images(args.images)
+    else:
+        images = [
+            (f"{width}x{height}/{density}", synthetic_image(width, height, objects=density, seed=density))
+            for width, height in (parse_size(size) for size in args.sizes.split(","))
+            for density in (int(d) for d in args.densities.split(","))
+        ]
+    if not images:
+        raise SystemExit("No images to benchmark")
+
+    results = {
+        "created_at": time.time(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": vars(args),
+        "detect": [],
+        "batch": []
+    }
+
+    for fmt in args.formats.split(","):
+        weights = export_model(args.coco_model, fmt, args.imgsz)
+        detector = Detector(args.env_model, weights, data_dir=args.data_dir, device=args.device,
+                            fused_model_path=args.fused_model)
+        detector.load_models()
+
+        for name, img in images:
+            img_b64 = encode_base64(img)
+            row = {"format": fmt, "image": name, "height": img.shape[0], "width": img.shape[1],
+                   **bench_detect(detector, img_b64, args.repeats, args.warmup, args.conf)}
+            results["detect"].append(row)
+            stages = ", ".join(f"{stage} {timing['p50']}" for stage, timing in row["stages_ms"].items())
+            print(f"[{fmt}] {name}: total p50 {row['total_ms']['p50']} ms, {row['boxes']} boxes ({stages})")
+
+        batch_model = detector.model("fused" if detector.fused else "coco").model
+        if batch_model is None:
+            continue
+        _, reference = images[len(images) // 2]
+        for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+            row = {"format": fmt, **bench_batch(batch_model, reference, batch_size,
+                                                 args.repeats, args.warmup, args.conf, args.device)}
+            results["batch"].append(row)
+            print(f"[{fmt}] batch {batch_size}: {row['per_image_ms']} ms/image, {row['images_per_second']} images/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
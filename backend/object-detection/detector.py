@@ -0,0 +1,351 @@
+"""
+Dual-model YOLO detection without any Modal dependency.
+
+Detector loads the fine-tuned environmental model and the COCO model and runs
+both over one image, decoded and sized by preprocess.py. Given a fused model
+(trained by train.py with --fused) it runs that single network instead and
+splits its classes into the same env/coco response.
+
+detect() may be called from several threads at once: decoding, drawing and
+encoding run in parallel while each model is used by one thread at a time.
+inference.DualModelDetection wraps it as a Modal GPU class; the load-test
+harness (backend/loadtest) runs it directly on CPU with DETECTOR_BACKEND=local.
+Models are loaded through model_pool.ModelPool, which can host several
+versions of the primary model within a memory budget. Optimized execution
+(FP16, channels_last, torch.compile, CPU pinning) is applied to each one as it
+loads, by exec_modes.py, and checked against FP32 detections.
+"""
+import base64
+import sys
+from functools import partial
+from pathlib import Path
+
+# backend/shared holds modules used by both the analyzer and detector services
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.tracing import Trace
+from exec_modes import ExecConfig, configure_cpu, load_reference_images, optimize_with_self_check
+from model_pool import ModelPool, PooledModel, VersionRouter, model_nbytes
+from preprocess import LetterboxCache, PreprocessConfig, decode_image, detect_tiled, inference_size, merge_rows, result_rows, should_tile
+
+DEFAULT_DATA_DIR = Path("/root") / "data"
+
+COCO_CLASSES = [
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat", "traffic light",
+    "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep", "cow",
+    "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee",
+    "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove", "skateboard", "surfboard",
+    "tennis racket", "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple",
+    "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch",
+    "potted plant", "bed", "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone",
+    "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors", "teddy bear",
+    "hair drier", "toothbrush"
+]
+
+FALLBACK_ENV_CLASSES = {0: "Pothole", 1: "Litter", 2: "Flood", 3: "Light"}
+ENV_CLASS_NAMES = set(FALLBACK_ENV_CLASSES.values())
+MODEL_LABELS = {"env": "environmental", "coco": "COCO", "fused": "fused"}
+
+# Every Detector in the process shares one pool, so a path is only ever loaded once
+MODEL_POOL = ModelPool.from_env()
+
+
+def default_env_model_path(data_dir=DEFAULT_DATA_DIR):
+    return str(Path(data_dir) / "runs" / "unified_model" / "weights" / "best.pt")
+
+
+def default_fused_model_path(data_dir=DEFAULT_DATA_DIR):
+    return str(Path(data_dir) / "runs" / "fused_model" / "weights" / "best.pt")
+
+
+class Detector:
+    def __init__(self, env_model_path=None, coco_model_path="yolov8n.pt", data_dir=DEFAULT_DATA_DIR, device=None,
+                 preprocess=None, fused_model_path=None, exec_config=None, versions=None, pool=None):
+        self.data_dir = Path(data_dir)
+        self.preprocess = preprocess or PreprocessConfig.from_env()
+        # Resolved in load_models, once the device is known
+        self.exec_config = exec_config
+        self.letterbox = LetterboxCache()
+        self.share_input = False
+        self.input_device = None
+        # None lets ultralytics pick (first GPU if present, else CPU)
+        self.device = device
+        self.env_model_path = env_model_path or default_env_model_path(self.data_dir)
+        self.coco_model_path = coco_model_path
+        # A fused model (train.py --fused) detects both class sets in one pass and replaces the pair
+        self.fused_model_path = fused_model_path
+        self.fused = fused_model_path is not None
+        # Versions of the primary model: the environmental one, or the fused one in fused mode
+        self.versions = versions or VersionRouter.from_config(fused_model_path or self.env_model_path)
+        self.pool = pool or MODEL_POOL
+        self.reference_images = None
+
+        self.initialized = False
+
+    def _load_env_classes(self, env_model):
+        import yaml
+
+        try:
+            model_yaml = env_model.yaml
+            if hasattr(model_yaml, 'get') and model_yaml.get('names'):
+                env_classes = model_yaml['names']
+                print(f"Loaded environmental class names from model: {env_classes}")
+                return env_classes
+            yaml_path = self.data_dir / "unified_dataset" / "data.yaml"
+            if yaml_path.exists():
+                with open(yaml_path, "r") as f:
+                    dataset_config = yaml.safe_load(f)
+                    if 'names' in dataset_config:
+                        env_classes = dataset_config['names']
+                        print(f"Loaded environmental class names from yaml: {env_classes}")
+                        return env_classes
+        except Exception as e:
+            print(f"Error loading environmental class names: {e}")
+            print(f"Using fallback environmental class names: {FALLBACK_ENV_CLASSES}")
+            return FALLBACK_ENV_CLASSES
+        return None
+
+    def load_models(self):
+        import os
+        import torch
+
+        os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "expandable_segments:True"
+
+        if not getattr(torch.load, "_weights_only_patched", False):
+            _original_torch_load = torch.load
+            patched_load = lambda *args, **kwargs: _original_torch_load(*args, weights_only=False, **kwargs)
+            patched_load._weights_only_patched = True
+            torch.load = patched_load
+
+        torch.backends.cudnn.benchmark = True
+
+        if self.exec_config is None:
+            on_cuda = torch.cuda.is_available() and str(self.device or "").lower() != "cpu"
+            self.exec_config = ExecConfig.from_env(cuda=on_cuda)
+        configure_cpu(self.exec_config)
+
+        # Other versions load on first use; the default one and the COCO model are ready before traffic
+        primary = self.model("fused" if self.fused else "env")
+        if primary.model is None:
+            print(f"{MODEL_LABELS['fused' if self.fused else 'env'].capitalize()} model disabled")
+        if self.fused:
+            self.initialized = True
+            return
+
+        coco = self.model("coco")
+        if coco.model is None:
+            print("COCO model disabled")
+
+        # Exported formats can have fixed, differing input shapes, so only PyTorch weights share an input tensor
+        self.share_input = (
+            self.preprocess.shared_input
+            and all(str(path).endswith(".pt") for path in [self.coco_model_path, *self.versions.versions.values()])
+        )
+        if self.share_input:
+            from ultralytics.utils.torch_utils import select_device
+            self.input_device = select_device(self.device or "", verbose=False)
+            print(f"Sharing one preprocessed input between both models on {self.input_device}")
+
+        self.initialized = True
+
+    def model(self, kind, version=None) -> PooledModel:
+        """The pooled "env", "coco" or "fused" model, loading it if it isn't resident"""
+        path = self.coco_model_path if kind == "coco" else self.versions.path(version)
+        return self.pool.get(path, partial(self._load_model, kind=kind))
+
+    def _load_model(self, path, kind) -> PooledModel:
+        from ultralytics import YOLO
+
+        label = MODEL_LABELS[kind]
+        try:
+            print(f"Loading {label} model from {path}")
+            model = YOLO(path)
+        except Exception as e:
+            print(f"Error loading {label} model: {e}")
+            return PooledModel(path, None)
+
+        if kind == "env":
+            names = self._load_env_classes(model)
+        elif kind == "coco":
+            names = COCO_CLASSES
+        else:
+            names = dict(model.names)
+        print(f"Successfully loaded {label} model with classes: {names}")
+
+        predict_kwargs = {}
+        try:
+            model, predict_kwargs = optimize_with_self_check(
+                model, partial(YOLO, path), self.exec_config, result_rows, self._reference_images(),
+                device=self.device, name=f"{label} model"
+            )
+        except Exception as e:
+            print(f"Error applying execution mode to {label} model, keeping it as loaded: {e}")
+        return PooledModel(path, model, names, model_nbytes(model), predict_kwargs)
+
+    def _reference_images(self):
+        import os
+
+        if self.reference_images is None:
+            image_dir = os.getenv("DETECT_SELF_CHECK_DIR") or self.data_dir / "unified_dataset" / "images" / "test"
+            self.reference_images = load_reference_images(image_dir, self.exec_config.self_check_images)
+        return self.reference_images
+
+    def _run_model(self, entry, source, **kwargs):
+        """Call a pooled model under its lock; decode/draw/encode of concurrent inputs overlap, model calls don't"""
+        with entry.lock:
+            return entry.model(source, device=self.device, verbose=False, **entry.predict_kwargs, **kwargs)
+
+    def _predict(self, entry, img, prepared, conf, imgsz):
+        """Rows in image coordinates, from the shared letterboxed tensor when there is one"""
+        if prepared is None:
+            return result_rows(self._run_model(entry, img, conf=conf, imgsz=imgsz))
+        return prepared.to_image(result_rows(self._run_model(entry, prepared.tensor, conf=conf)))
+
+    def detect(self, img_data_base64, conf_env=0.25, conf_coco=0.25, model_version=None, live=False):
+        """Detect on one image; live frames follow the live_tiling mode instead of tiling"""
+        import cv2
+        import numpy as np
+
+        trace = Trace()
+
+        try:
+            version = model_version or self.versions.default
+            with trace.span("model_pool"):
+                primary = self.model("fused" if self.fused else "env", version)
+                coco = None if self.fused else self.model("coco")
+            env_model = None if self.fused or primary.model is None else primary
+            fused_model = primary if self.fused and primary.model is not None else None
+            coco_model = coco if coco is not None and coco.model is not None else None
+            fused_env_ids = [cls_id for cls_id, name in primary.names.items() if name in ENV_CLASS_NAMES] if fused_model else []
+
+            with trace.span("b64decode"):
+                img_bytes = base64.b64decode(img_data_base64)
+            with trace.span("imdecode"):
+                decoded = decode_image(img_bytes, self.preprocess.decode_min_side)
+            img = decoded.image
+            width, height = decoded.size
+            imgsz = inference_size(width, height, self.preprocess)
+
+            # Boxes are in decoded-image coordinates until they are drawn
+            detections = {
+                'env': [],
+                'coco': []
+            }
+            tiled = False
+
+            prepared = None
+            if self.share_input and env_model is not None and coco_model is not None:
+                with trace.span("letterbox"):
+                    prepared = self.letterbox.prepare(img, imgsz, self.input_device)
+
+            env_rows = coco_rows = None
+            if fused_model is not None:
+                try:
+                    # One pass at the lower threshold, then each class set keeps its own threshold
+                    with trace.span("fused_model"):
+                        rows = self._predict(fused_model, img, None, min(conf_env, conf_coco), imgsz)
+                    is_env = np.isin(rows[:, 5], fused_env_ids)
+                    env_rows = rows[is_env & (rows[:, 4] >= conf_env)]
+                    coco_rows = rows[~is_env & (rows[:, 4] >= conf_coco)]
+                except Exception as e:
+                    print(f"Error in fused model inference: {e}")
+
+            if env_model is not None:
+                try:
+                    with trace.span("env_model"):
+                        env_rows = self._predict(env_model, img, prepared, conf_env, imgsz)
+                except Exception as e:
+                    print(f"Error in environmental model inference: {e}")
+
+            if coco_model is not None:
+                try:
+                    with trace.span("coco_model"):
+                        coco_rows = self._predict(coco_model, img, prepared, conf_coco, imgsz)
+                except Exception as e:
+                    print(f"Error in COCO model inference: {e}")
+
+            if env_rows is not None and should_tile(width, height, len(env_rows) > 0, self.preprocess, live):
+                try:
+                    tiled = True
+                    with trace.span("env_tiles"):
+                        tile_rows = detect_tiled(partial(self._run_model, primary), img, conf_env, self.preprocess)
+                        if fused_model is not None:
+                            tile_rows = tile_rows[np.isin(tile_rows[:, 5], fused_env_ids)]
+                        env_rows = merge_rows(np.concatenate([env_rows, tile_rows]), self.preprocess.tile_iou)
+                except Exception as e:
+                    print(f"Error in tiled inference: {e}")
+
+            with trace.span("boxes"):
+                if env_rows is not None:
+                    detections['env'] = [
+                        row_to_detection(row, class_name(primary.names, int(row[5]), "Env")) for row in env_rows
+                    ]
+                if coco_rows is not None:
+                    coco_names = primary.names if self.fused else coco.names
+                    detections['coco'] = [
+                        row_to_detection(row, class_name(coco_names, int(row[5]), "COCO")) for row in coco_rows
+                    ]
+
+            # The decoded image is ours alone, so draw on it directly instead of a copy
+            with trace.span("draw"):
+                for detection in detections['env']:
+                    draw_detection(img, detection, (0, 0, 255))  # Red for environmental issues
+                for detection in detections['coco']:
+                    draw_detection(img, detection, (0, 255, 0))  # Green for COCO objects
+
+            for detection in detections['env'] + detections['coco']:
+                detection['box'] = decoded.to_original(detection['box'])
+
+            # Encode the image with detections drawn on it
+            with trace.span("imencode"):
+                _, buffer = cv2.imencode('.jpg', img)
+            with trace.span("b64encode"):
+                img_base64 = base64.b64encode(buffer).decode('utf-8')
+
+            # Return both the image and structured detection data, plus per-stage timings.
+            # Boxes are in original-photo pixels; the annotated image may be downscaled.
+            return {
+                'image': f"data:image/jpeg;base64,{img_base64}",
+                'image_size': list(decoded.original_size),
+                'model_version': version,
+                'tiled': tiled,
+                'detections': detections,
+                'timings': trace.timings()
+            }
+
+        except Exception as e:
+            print(f"Error in detection: {e}")
+            return None
+
+
+def class_name(names, cls_id, prefix):
+    """Look up a class name in a list or {id: name} dict, with a placeholder for unknown ids"""
+    if isinstance(names, dict):
+        return names.get(cls_id, f"{prefix}-{cls_id}")
+    if names is not None and cls_id < len(names):
+        return names[cls_id]
+    return f"{prefix}-{cls_id}"
+
+
+def row_to_detection(row, cls_name):
+    """Convert an x1, y1, x2, y2, confidence, class row into the detection dict returned by the API"""
+    x1, y1, x2, y2, conf = row[:5]
+    return {
+        'class': cls_name,
+        'confidence': float(conf),
+        'box': [int(x1), int(y1), int(x2), int(y2)]
+    }
+
+
+def draw_detection(vis_img, detection, color):
+    import cv2
+
+    x1, y1, x2, y2 = detection['box']
+    cv2.rectangle(vis_img, (x1, y1), (x2, y2), color, 2)
+
+    label = f"{detection['class']} {detection['confidence']:.2f}"
+    t_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)[0]
+    c2 = x1 + t_size[0], y1 - t_size[1] - 3
+    cv2.rectangle(vis_img, (x1, y1), c2, color, -1, cv2.LINE_AA)
+    cv2.putText(vis_img, label, (x1, y1 - 2), cv2.FONT_HERSHEY_SIMPLEX,
+               0.6, [255, 255, 255], 1, cv2.LINE_AA)
@@ -0,0 +1,211 @@
+"""
+Optimized execution modes for the serving detector, with a startup self-check.
+
+DETECT_EXEC_MODE is "auto" (the default), "none", or a comma-separated list of:
+
+- fp16: half-precision inference (CUDA only)
+- channels_last: NHWC weights, which cuDNN and oneDNN convolutions prefer
+- compile: torch.compile the network (first calls are slow while it compiles)
+- onednn: keep PyTorch's oneDNN (MKL-DNN) CPU kernels enabled, with channels_last
+
+"auto" means fp16,channels_last on CUDA and onednn on CPU. Every mode also
+fuses Conv+BN at load rather than on the first request. On CPU, DETECT_CPU_THREADS pins the process to that
+many cores and sizes torch's thread pool to match.
+
+Before an optimized model serves traffic, it runs on up to
+DETECT_SELF_CHECK_IMAGES reference images (the unified dataset's test split
+by default). Its detections are compared with a plain FP32 pass. If too few
+boxes match, the model is reloaded without optimizations and the mismatch is
+logged. Without reference images the predictor is built on a blank synthetic
+frame instead, so the optimizations still apply, just unchecked.
+"""
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+EXEC_FEATURES = ("fp16", "channels_last", "compile", "onednn")
+
+
+@dataclass
+class ExecConfig:
+    features: Tuple[str, ...] = ()
+    cpu_threads: int = 0
+    self_check: bool = True
+    self_check_images: int = 8
+    self_check_iou: float = 0.8
+    self_check_conf_tolerance: float = 0.05
+    self_check_min_match: float = 0.95
+
+    @classmethod
+    def from_env(cls, cuda: bool) -> "ExecConfig":
+        mode = os.getenv("DETECT_EXEC_MODE", "auto")
+        if mode == "auto":
+            features = ("fp16", "channels_last") if cuda else ("onednn",)
+        elif mode in ("", "none"):
+            features = ()
+        else:
+            features = tuple(f.strip() for f in mode.split(",") if f.strip())
+        unknown = [f for f in features if f not in EXEC_FEATURES]
+        if unknown:
+            raise ValueError(f"Unknown exec mode(s): {', '.join(unknown)} (expected some of {', '.join(EXEC_FEATURES)})")
+        if not cuda and "fp16" in features:
+            print("fp16 needs CUDA, running FP32 on CPU")
+            features = tuple(f for f in features if f != "fp16")
+
+        return cls(
+            features=features,
+            cpu_threads=int(os.getenv("DETECT_CPU_THREADS", "0")),
+            self_check=os.getenv("DETECT_SELF_CHECK", "1") == "1",
+            self_check_images=int(os.getenv("DETECT_SELF_CHECK_IMAGES", "8")),
+        )
+
+    @property
+    def half(self) -> bool:
+        return "fp16" in self.features
+
+
+def configure_cpu(config: ExecConfig) -> None:
+    """Process-wide CPU settings: core pinning, torch thread pools and oneDNN"""
+    import torch
+
+    if config.cpu_threads > 0:
+        if hasattr(os, "sched_setaffinity"):
+            available = sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(0, available[:config.cpu_threads])
+        torch.set_num_threads(config.cpu_threads)
+        try:
+            # Can only be set before the first parallel op runs
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+        print(f"Pinned detector to {config.cpu_threads} CPU threads")
+    if "onednn" in config.features:
+        torch.backends.mkldnn.enabled = True
+
+
+def synthetic_frame(size: int = 640):
+    """Letterbox-grey frame, enough to make the model build its predictor"""
+    import numpy as np
+
+    return np.full((size, size, 3), 114, dtype=np.uint8)
+
+
+def optimize_model(model, config: ExecConfig, device=None, warmup_image=None) -> None:
+    """Rebuild the model's predictor for config and apply module-level optimizations in place"""
+    import torch
+
+    model.fuse()
+    # The predictor fixes its precision when it is created, so make a new one
+    model.predictor = None
+    model(synthetic_frame() if warmup_image is None else warmup_image, half=config.half, device=device, verbose=False)
+    if model.predictor is None:
+        skipped = [f for f in config.features if f in ("channels_last", "compile", "onednn")]
+        if skipped:
+            print(f"No predictor after warmup, skipped {','.join(skipped)}")
+        return
+
+    network = model.predictor.model.model
+    if "channels_last" in config.features or "onednn" in config.features:
+        network = network.to(memory_format=torch.channels_last)
+    if "compile" in config.features:
+        # Inference sizes vary per request, so compile for dynamic shapes up front
+        network = torch.compile(network, dynamic=True)
+    model.predictor.model.model = network
+
+
+def box_iou(a, b) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare_detections(baseline: List[Any], optimized: List[Any], config: ExecConfig) -> Dict[str, Any]:
+    """Greedy same-class IoU matching of rows (x1, y1, x2, y2, conf, cls) image by image"""
+    matched = missing = extra = 0
+    max_conf_diff = 0.0
+    for base_rows, opt_rows in zip(baseline, optimized):
+        unused = list(range(len(opt_rows)))
+        for base in base_rows:
+            best, best_iou = None, config.self_check_iou
+            for j in unused:
+                if int(opt_rows[j][5]) == int(base[5]):
+                    iou = box_iou(base, opt_rows[j])
+                    if iou >= best_iou:
+                        best, best_iou = j, iou
+            if best is None:
+                missing += 1
+                continue
+            unused.remove(best)
+            conf_diff = abs(float(base[4]) - float(opt_rows[best][4]))
+            max_conf_diff = max(max_conf_diff, conf_diff)
+            if conf_diff <= config.self_check_conf_tolerance:
+                matched += 1
+            else:
+                missing += 1
+        extra += len(unused)
+
+    total = matched + missing + extra
+    match_rate = matched / total if total else 1.0
+    return {
+        "images": len(baseline),
+        "matched": matched,
+        "missing": missing,
+        "extra": extra,
+        "match_rate": round(match_rate, 4),
+        "max_conf_diff": round(max_conf_diff, 4),
+        "ok": match_rate >= config.self_check_min_match
+    }
+
+
+def load_reference_images(image_dir, limit: int) -> List[Any]:
+    import cv2
+
+    image_dir = Path(image_dir)
+    if not image_dir.is_dir():
+        return []
+    images = []
+    for path in sorted(image_dir.iterdir()):
+        if path.suffix.lower() in (".jpg", ".jpeg", ".png", ".bmp"):
+            img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if img is not None:
+                images.append(img)
+        if len(images) >= limit:
+            break
+    return images
+
+
+def optimize_with_self_check(
+    model,
+    reload: Callable[[], Any],
+    config: ExecConfig,
+    rows: Callable[[Any], Any],
+    reference_images: List[Any],
+    device=None,
+    name: str = "model"
+) -> Tuple[Any, Dict[str, Any]]:
+    """Return (model, extra predict kwargs), falling back to a fresh FP32 model if the check fails"""
+    if not config.features:
+        return model, {}
+
+    baseline = None
+    if config.self_check and reference_images:
+        baseline = [rows(model(img, half=False, device=device, verbose=False)) for img in reference_images]
+
+    optimize_model(model, config, device, warmup_image=reference_images[0] if reference_images else None)
+    predict_kwargs = {"half": config.half}
+
+    if baseline is None:
+        print(f"{name}: running {','.join(config.features)} without a self-check (no reference images)")
+        return model, predict_kwargs
+
+    optimized = [rows(model(img, device=device, verbose=False, **predict_kwargs)) for img in reference_images]
+    report = compare_detections(baseline, optimized, config)
+    print(f"{name}: {','.join(config.features)} self-check {report}")
+    if report["ok"]:
+        return model, predict_kwargs
+
+    print(f"{name}: optimized detections differ from FP32, serving the unoptimized model")
+    return reload(), {}
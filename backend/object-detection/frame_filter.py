@@ -0,0 +1,176 @@
+"""
+Cheap CPU quality checks that skip live-camera frames before they reach the GPU.
+
+The camera page posts a frame every few hundred milliseconds, and many are
+useless: motion-blurred, black or overexposed, or the same view as the last
+frame. Each frame is decoded to a small grayscale copy (JPEG reduced decode,
+then at most analysis_side pixels on its long side) and checked, in order:
+
+- exposure: mean brightness below min_brightness or above max_brightness
+- blur: variance of the Laplacian below min_sharpness
+- duplicate: 64-bit difference hash (dHash) within duplicate_distance bits of
+  the last frame this client had detected
+
+Skipped frames don't call the detector. The caller gets the client's last
+result with `skipped` and `skip_reason` set, minus the annotated image, so the
+page keeps showing the previous overlay. Client state is per process and LRU
+bounded. Thresholds come from PREFILTER_* environment variables. Outcomes and
+the running skip ratio are exported on REGISTRY.
+"""
+import base64
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from preprocess import jpeg_dimensions, reduction_factor
+from shared.tracing import REGISTRY
+
+PREFILTER_FRAMES = REGISTRY.counter(
+    "envolve_prefilter_frames_total", "Live frames by pre-filter outcome", ["outcome"]
+)
+PREFILTER_SKIP_RATIO = REGISTRY.gauge(
+    "envolve_prefilter_skip_ratio", "Share of live frames skipped by the pre-filter since start"
+)
+
+
+@dataclass
+class FilterConfig:
+    enabled: bool = True
+    analysis_side: int = 256
+    min_brightness: float = 25.0
+    max_brightness: float = 235.0
+    min_sharpness: float = 40.0
+    duplicate_distance: int = 4
+    max_clients: int = 1024
+
+    @classmethod
+    def from_env(cls) -> "FilterConfig":
+        return cls(
+            enabled=os.getenv("PREFILTER", "1") == "1",
+            analysis_side=int(os.getenv("PREFILTER_ANALYSIS_SIDE", "256")),
+            min_brightness=float(os.getenv("PREFILTER_MIN_BRIGHTNESS", "25")),
+            max_brightness=float(os.getenv("PREFILTER_MAX_BRIGHTNESS", "235")),
+            min_sharpness=float(os.getenv("PREFILTER_MIN_SHARPNESS", "40")),
+            duplicate_distance=int(os.getenv("PREFILTER_DUPLICATE_DISTANCE", "4")),
+            max_clients=int(os.getenv("PREFILTER_MAX_CLIENTS", "1024"))
+        )
+
+
+@dataclass
+class FrameQuality:
+    brightness: float
+    sharpness: float
+    dhash: int
+
+
+def decode_gray(img_bytes: bytes, max_side: int):
+    """Small grayscale copy of an image, decoded at reduced JPEG scale where possible"""
+    import cv2
+    import numpy as np
+
+    reduced_flags = {
+        1: cv2.IMREAD_GRAYSCALE,
+        2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        8: cv2.IMREAD_REDUCED_GRAYSCALE_8
+    }
+    dimensions = jpeg_dimensions(img_bytes)
+    factor = reduction_factor(*dimensions, max_side) if dimensions else 1
+    gray = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), reduced_flags[factor])
+    if gray is None:
+        raise ValueError("Could not decode image")
+
+    # A fixed analysis size keeps the sharpness score comparable across camera resolutions
+    height, width = gray.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1:
+        gray = cv2.resize(gray, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def dhash(gray) -> int:
+    """64-bit difference hash: whether each pixel of a 9x8 thumbnail is brighter than its right neighbour"""
+    import cv2
+
+    thumb = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def assess(img_bytes: bytes, max_side: int) -> FrameQuality:
+    import cv2
+
+    gray = decode_gray(img_bytes, max_side)
+    return FrameQuality(
+        brightness=float(gray.mean()),
+        sharpness=float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+        dhash=dhash(gray)
+    )
+
+
+class FrameFilter:
+    def __init__(self, config: FilterConfig):
+        self.config = config
+        # client id -> {"dhash": ..., "result": ...} for the client's last detected frame
+        self._clients: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.skipped = 0
+
+    def skip_reason(self, client_id: str, quality: FrameQuality) -> Optional[str]:
+        if quality.brightness < self.config.min_brightness:
+            return "dark"
+        if quality.brightness > self.config.max_brightness:
+            return "overexposed"
+        if quality.sharpness < self.config.min_sharpness:
+            return "blurry"
+        with self._lock:
+            last = self._clients.get(client_id)
+        if last is not None and bin(last["dhash"] ^ quality.dhash).count("1") <= self.config.duplicate_distance:
+            return "duplicate"
+        return None
+
+    def check(self, client_id: str, img_data_base64) -> Optional[Dict[str, Any]]:
+        """The response for a frame that should be skipped, or None to run detection on it"""
+        if not self.config.enabled:
+            return None
+        try:
+            quality = assess(base64.b64decode(img_data_base64), self.config.analysis_side)
+        except Exception as e:
+            # Undecodable frames go on to the detector, which reports the error as before
+            print(f"Pre-filter could not assess frame: {e}")
+            return None
+
+        reason = self.skip_reason(client_id, quality)
+        with self._lock:
+            self.frames += 1
+            if reason is None:
+                # Remember the hash now, so the next frame is compared with this one
+                self._clients[client_id] = {"dhash": quality.dhash, "result": None}
+                self._clients.move_to_end(client_id)
+                while len(self._clients) > self.config.max_clients:
+                    self._clients.popitem(last=False)
+            else:
+                self.skipped += 1
+                last = self._clients.get(client_id)
+            PREFILTER_SKIP_RATIO.set(self.skipped / self.frames)
+        PREFILTER_FRAMES.inc(outcome=reason or "passed")
+        if reason is None:
+            return None
+
+        response = dict(last["result"]) if last and last["result"] else {"detections": {"env": [], "coco": []}}
+        response.update({
+            "skipped": True,
+            "skip_reason": reason,
+            "quality": {"brightness": round(quality.brightness, 1), "sharpness": round(quality.sharpness, 1)}
+        })
+        return response
+
+    def remember(self, client_id: str, result: Dict[str, Any]) -> None:
+        """Keep a detected frame's result, without the annotated image, to answer the client's skipped frames"""
+        with self._lock:
+            state = self._clients.get(client_id)
+            if state is not None:
+                state["result"] = {key: value for key, value in result.items() if key != "image"}
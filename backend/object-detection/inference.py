@@ -1,18 +1,36 @@
 import modal
-import base64
+import asyncio
 from pathlib import Path
 import os
+import sys
 import json
 import anthropic
 
+# backend/shared holds modules used by both the analyzer and detector services
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.admission import AdmissionMiddleware, Lane, LaneConfig
+from shared.circuit_breaker import BreakerConfig, CircuitBreaker, CircuitOpenError
+from shared.llm_json import ExtractionError, extract_json
+from shared.parquet_log import ParquetLog
+from shared.volume_sync import VolumeSync
+from shared.tracing import METRICS_CONTENT_TYPE, REGISTRY, TimingMiddleware, record, span
+from detector import Detector, default_env_model_path, default_fused_model_path
+from frame_filter import FilterConfig, FrameFilter
+from model_pool import VersionRouter, record_version
+from llm_image import ImageBudget, build_image_blocks
+from request_log import DATASET as REQUEST_DATASET, request_record, request_schema
+from tile_store import TileStore
+
 image = (
     modal.Image.debian_slim(python_version="3.10")
     .apt_install(
         ["libgl1-mesa-glx", "libglib2.0-0"]
     )
     .pip_install(
-        ["ultralytics", "opencv-python", "fastapi", "python-multipart", "Pillow", "anthropic"]
+        ["ultralytics", "opencv-python", "fastapi", "python-multipart", "Pillow", "anthropic", "pyarrow"]
     )
+    .add_local_python_source("shared", "detector", "exec_modes", "frame_filter", "llm_image", "model_pool", "preprocess", "request_log", "tile_store", copy=True)
 )
 
 volume = modal.Volume.from_name("yolo-finetune", create_if_missing=True)
@@ -20,214 +38,93 @@ volume_path = Path("/root") / "data"
 
 app = modal.App("yolo-dual-model-detection", image=image, volumes={volume_path: volume})
 
-models_cache = {}
+# Inputs one detector container works on at once; CPU pre/post-processing overlaps, model calls are serialized
+DETECT_CONCURRENT_INPUTS = int(os.getenv("DETECT_CONCURRENT_INPUTS", "4"))
+WEB_CONCURRENT_INPUTS = int(os.getenv("WEB_CONCURRENT_INPUTS", "32"))
+
+# "overlapped" sends the photo to Claude while detection runs, hiding GPU time behind the LLM round-trip.
+# It is opt-in: Claude then sees no classification or title, which the sequential pipeline gives it.
+ANALYZE_PIPELINES = ("sequential", "overlapped")
+ANALYZE_PIPELINE = os.getenv("ANALYZE_PIPELINE", "sequential")
+
+# Fields Claude's photo analysis must carry inside its <answer> tags
+PHOTO_ANALYSIS_SCHEMA = {
+    "description": str,
+    "environmental_task": str,
+    "severity": (int, float, str),
+    "tags": list
+}
 
-@app.cls(gpu="a10g")
+@app.cls(gpu="a10g", allow_concurrent_inputs=DETECT_CONCURRENT_INPUTS)
 class DualModelDetection:
-    def __init__(self, env_model_path=None, coco_model_path="yolov8n.pt"):
-        if env_model_path is None:
-            self.env_model_path = str(volume_path / "runs" / "unified_model" / "weights" / "best.pt")
-        else:
-            self.env_model_path = env_model_path
-            
+    def __init__(self, env_model_path=None, coco_model_path="yolov8n.pt", fused_model_path=None,
+                 model_versions=None, model_routing=None):
+        self.env_model_path = env_model_path or default_env_model_path(volume_path)
         self.coco_model_path = coco_model_path
-            
-        self.env_classes = None
-        self.coco_classes = None
-        
-        self.initialized = False
+        self.fused_model_path = fused_model_path
+        # "name=path,..." and "name=percent,..." as in MODEL_VERSIONS / MODEL_ROUTING
+        self.model_versions = model_versions
+        self.model_routing = model_routing
 
     @modal.enter()
     def load_models(self):
-        import torch
-        from ultralytics import YOLO
-        import os
-        import yaml
-        
-        os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "expandable_segments:True"
-        
-        _original_torch_load = torch.load
-        torch.load = lambda *args, **kwargs: _original_torch_load(*args, weights_only=False, **kwargs)
-        
-        torch.backends.cudnn.benchmark = True
-        
-        global models_cache
-        
-        if self.env_model_path not in models_cache:
-            try:
-                print(f"Loading environmental model from {self.env_model_path}")
-                env_model = YOLO(self.env_model_path)
-                print(f"Successfully loaded environmental model")
-                
-                env_classes = None
-                try:
-                    model_yaml = env_model.yaml
-                    if hasattr(model_yaml, 'get') and model_yaml.get('names'):
-                        env_classes = model_yaml['names']
-                        print(f"Loaded environmental class names from model: {env_classes}")
-                    else:
-                        yaml_path = volume_path / "unified_dataset" / "data.yaml"
-                        if yaml_path.exists():
-                            with open(yaml_path, "r") as f:
-                                dataset_config = yaml.safe_load(f)
-                                if 'names' in dataset_config:
-                                    env_classes = dataset_config['names']
-                                    print(f"Loaded environmental class names from yaml: {env_classes}")
-                except Exception as e:
-                    print(f"Error loading environmental class names: {e}")
-                    env_classes = {0: "Pothole", 1: "Litter", 2: "Flood", 3: "Light"}
-                    print(f"Using fallback environmental class names: {env_classes}")
-                
-                models_cache[self.env_model_path] = (env_model, env_classes)
-                    
-            except Exception as e:
-                print(f"Error loading environmental model: {e}")
-                models_cache[self.env_model_path] = (None, None)
-        
-        self.env_model, self.env_classes = models_cache.get(self.env_model_path, (None, None))
-        if self.env_model is None:
-            print("Environmental model disabled")
-        
-        if self.coco_model_path not in models_cache:
-            try:
-                print(f"Loading COCO model from {self.coco_model_path}")
-                coco_model = YOLO(self.coco_model_path)
-                print(f"Successfully loaded COCO model")
-                
-                coco_classes = [
-                    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat", "traffic light",
-                    "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep", "cow",
-                    "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee",
-                    "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove", "skateboard", "surfboard",
-                    "tennis racket", "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple",
-                    "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch",
-                    "potted plant", "bed", "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone",
-                    "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors", "teddy bear",
-                    "hair drier", "toothbrush"
-                ]
-                print(f"Loaded COCO class names ({len(coco_classes)} classes)")
-                
-                models_cache[self.coco_model_path] = (coco_model, coco_classes)
-                
-            except Exception as e:
-                print(f"Error loading COCO model: {e}")
-                models_cache[self.coco_model_path] = (None, None)
-        
-        self.coco_model, self.coco_classes = models_cache.get(self.coco_model_path, (None, None))
-        if self.coco_model is None:
-            print("COCO model disabled")
-            
-        self.initialized = True
+        versions = VersionRouter.from_config(self.fused_model_path or self.env_model_path,
+                                             self.model_versions, self.model_routing)
+        self.detector = Detector(self.env_model_path, self.coco_model_path, data_dir=volume_path,
+                                 fused_model_path=self.fused_model_path, versions=versions)
+        self.detector.load_models()
 
     @modal.method()
-    def detect(self, img_data_base64, conf_env=0.25, conf_coco=0.25):
-        import cv2
-        import numpy as np
-        import math
-        
-        try:
-            img_bytes = base64.b64decode(img_data_base64)
-            nparr = np.frombuffer(img_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            vis_img = img.copy()
-            
-            # Initialize detections list to return detailed detection data
-            detections = {
-                'env': [],
-                'coco': []
-            }
-            
-            if self.env_model is not None:
-                try:
-                    env_results = self.env_model(img, stream=True, conf=conf_env, verbose=False)
-                    
-                    for r in env_results:
-                        boxes = r.boxes
-                        
-                        for box in boxes:
-                            x1, y1, x2, y2 = box.xyxy[0]
-                            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                            
-                            confidence = float(box.conf[0])
-                            cls_id = int(box.cls[0])
-                            
-                            cls_name = self.env_classes.get(cls_id, f"Env-{cls_id}")
-                            
-                            color = (0, 0, 255)  # Red for environmental issues
-                            cv2.rectangle(vis_img, (x1, y1), (x2, y2), color, 2)
-                            
-                            label = f"{cls_name} {confidence:.2f}"
-                            t_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)[0]
-                            c2 = x1 + t_size[0], y1 - t_size[1] - 3
-                            cv2.rectangle(vis_img, (x1, y1), c2, color, -1, cv2.LINE_AA)
-                            cv2.putText(vis_img, label, (x1, y1 - 2), cv2.FONT_HERSHEY_SIMPLEX,
-                                       0.6, [255, 255, 255], 1, cv2.LINE_AA)
-                            
-                            # Add detection to the results
-                            detections['env'].append({
-                                'class': cls_name,
-                                'confidence': confidence,
-                                'box': [int(x1), int(y1), int(x2), int(y2)]
-                            })
-                except Exception as e:
-                    print(f"Error in environmental model inference: {e}")
-            
-            if self.coco_model is not None:
-                try:
-                    coco_results = self.coco_model(img, stream=True, conf=conf_coco, verbose=False)
-                    
-                    for r in coco_results:
-                        boxes = r.boxes
-                        
-                        for box in boxes:
-                            x1, y1, x2, y2 = box.xyxy[0]
-                            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                            
-                            confidence = float(box.conf[0])
-                            cls_id = int(box.cls[0])
-                            
-                            if cls_id < len(self.coco_classes):
-                                cls_name = self.coco_classes[cls_id]
-                            else:
-                                cls_name = f"COCO-{cls_id}"
-                            
-                            color = (0, 255, 0)  # Green for COCO objects
-                            cv2.rectangle(vis_img, (x1, y1), (x2, y2), color, 2)
-                            
-                            label = f"{cls_name} {confidence:.2f}"
-                            t_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)[0]
-                            c2 = x1 + t_size[0], y1 - t_size[1] - 3
-                            cv2.rectangle(vis_img, (x1, y1), c2, color, -1, cv2.LINE_AA)
-                            cv2.putText(vis_img, label, (x1, y1 - 2), cv2.FONT_HERSHEY_SIMPLEX,
-                                       0.6, [255, 255, 255], 1, cv2.LINE_AA)
-                            
-                            # Add detection to the results
-                            detections['coco'].append({
-                                'class': cls_name,
-                                'confidence': confidence,
-                                'box': [int(x1), int(y1), int(x2), int(y2)]
-                            })
-                except Exception as e:
-                    print(f"Error in COCO model inference: {e}")
-            
-            # Encode the image with detections drawn on it
-            _, buffer = cv2.imencode('.jpg', vis_img)
-            img_base64 = base64.b64encode(buffer).decode('utf-8')
-            
-            # Return both the image and structured detection data
-            return {
-                'image': f"data:image/jpeg;base64,{img_base64}",
-                'detections': detections
-            }
-            
-        except Exception as e:
-            print(f"Error in detection: {e}")
-            return None
+    def detect(self, img_data_base64, conf_env=0.25, conf_coco=0.25, model_version=None, live=False):
+        return self.detector.detect(img_data_base64, conf_env=conf_env, conf_coco=conf_coco,
+                                    model_version=model_version, live=live)
+
+# tiles.db on the volume must have one writer, so one container aggregates for every web container
+@app.cls(max_containers=1, allow_concurrent_inputs=WEB_CONCURRENT_INPUTS)
+class TileAggregator:
+    @modal.enter()
+    def open_store(self):
+        # Committed after every flush, so a replacement container starts from the latest counts
+        self.store = TileStore.from_env(os.getenv("TILE_DB_PATH", str(volume_path / "tiles.db")),
+                                        on_write=VolumeSync(volume).commit)
+
+    @modal.method()
+    def add(self, detections, lat, lon, timestamp=None):
+        self.store.add(detections, lat, lon, timestamp)
 
-@modal.method()
-async def analyze_with_claude(self, image_base64, classification, title):
-    """Use Claude to analyze the image and provide enhanced information"""
+    @modal.method()
+    def tile(self, z, x, y, period="day", since=None, until=None, classes=None, detail=2):
+        return self.store.tile(z, x, y, period, since=since, until=until, classes=classes, detail=detail)
+
+    @modal.exit()
+    def flush(self):
+        self.store.flush()
+
+PHOTO_MODEL = "claude-3-7-sonnet-20250219"
+
+async def probe_claude():
+    """Smallest possible request, to tell when Claude is reachable again; real calls then decide whether to close"""
+    client = anthropic.AsyncAnthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+    await client.messages.create(model=PHOTO_MODEL, max_tokens=1, messages=[{"role": "user", "content": "ping"}])
+
+# While Claude is slow or failing, /analyze answers with the detection-based summary alone
+LLM_BREAKER = CircuitBreaker(
+    "photo_llm",
+    BreakerConfig.from_env("PHOTO_LLM_", latency_budget=15.0, timeout=30.0),
+    probe=probe_claude
+)
+
+PHOTO_INSTRUCTIONS = {
+    "image": "1. Examine the attached photo.",
+    "detections": "1. Examine the attached crops of the regions the object detector flagged. The full photo is not attached.",
+    "text": "1. No photo is attached. Rely on the object detector output given as the classification below."
+}
+
+async def analyze_with_claude(image_blocks, classification, title, image_mode="image"):
+    """Use Claude to analyze the image and provide enhanced information
+
+    image_blocks are Anthropic image content blocks built by llm_image for image_mode.
+    """
     
     # Check if ANTHROPIC_API_KEY is available
     api_key = os.environ.get("ANTHROPIC_API_KEY")
@@ -236,15 +133,12 @@ async def analyze_with_claude(self, image_base64, classification, title):
         return None
     
     try:
-        client = anthropic.Anthropic(api_key=api_key)
+        client = anthropic.AsyncAnthropic(api_key=api_key)
         
         # Format the prompt with actual values
         prompt_content = f"""You will be given a photo and a classification (which may be null) of the photo, as well as the title of the photo. Your task is to analyze the photo and provide information about it in a specific JSON format. Follow these steps:
 
-1. Examine the provided photo:
-<photo>
-data:image/jpeg;base64,{image_base64}
-</photo>
+{PHOTO_INSTRUCTIONS[image_mode]}
 
 2. Consider the given classification and title (if available):
 <classification>
@@ -282,31 +176,37 @@ Ensure that your analysis is based solely on the information provided in the pho
 Remember to be objective and focus on observable details. If you cannot determine certain aspects from the photo, it's acceptable to state that in your response."""
 
         # Call Claude
-        message = await client.messages.create(
-            model="claude-3-7-sonnet-20250219",
-            max_tokens=4000,
-            temperature=0.7,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt_content
-                }
-            ]
-        )
+        with span("llm_call"):
+            message = await LLM_BREAKER.call(lambda: client.messages.create(
+                model=PHOTO_MODEL,
+                max_tokens=4000,
+                temperature=0.7,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": image_blocks + [{"type": "text", "text": prompt_content}]
+                    }
+                ]
+            ))
         
         # Extract JSON from Claude's response
         response_text = message.content[0].text
         
-        # Extract JSON between <answer> tags
-        json_str = response_text.split('<answer>')[1].split('</answer>')[0].strip()
-        result = json.loads(json_str)
-        return result
+        # Extract JSON, preferring the object between <answer> tags
+        with span("json_parse"):
+            return extract_json(response_text, schema=PHOTO_ANALYSIS_SCHEMA, answer_tag="answer")
     
+    except ExtractionError as e:
+        print(f"Error parsing Claude analysis: {e}")
+        return None
+    except (CircuitOpenError, asyncio.TimeoutError) as e:
+        print(f"Skipping Claude analysis, using detections only: {str(e) or 'Claude timed out'}")
+        return None
     except Exception as e:
         print(f"Error using Claude for analysis: {e}")
         return None
 
-def map_severity_to_string(self, severity_value):
+def map_severity_to_string(severity_value):
     """Map numerical severity (1-5) to string values (Low, Medium, High)"""
     if isinstance(severity_value, str):
         return severity_value
@@ -320,22 +220,93 @@ def map_severity_to_string(self, severity_value):
     }
     return severity_map.get(severity_value, "Medium")
 
+def summarize_detections(detections):
+    """Title, category, severity, tags and description derived from the detector output alone"""
+    env_detections = detections['env']
+    coco_detections = detections['coco']
+    
+    # Generate the API response with titles, descriptions, etc.
+    title = "No issues detected"
+    category = "General"
+    severity = "Low"
+    tags = []
+    
+    # Customize based on environmental detections
+    if env_detections:
+        # Get most confident environmental detection
+        best_env = max(env_detections, key=lambda x: x['confidence'])
+        title = f"{best_env['class']} detected"
+        category = "Environmental Issue"
+        
+        # Set severity based on confidence and type
+        if best_env['confidence'] > 0.7:
+            severity = "High"
+        elif best_env['confidence'] > 0.5:
+            severity = "Medium"
+        else:
+            severity = "Low"
+        
+        # Add all environmental classes to tags
+        tags.extend([d['class'] for d in env_detections])
+    
+    # Add relevant COCO objects to tags
+    if coco_detections:
+        top_coco = [d['class'] for d in sorted(coco_detections, key=lambda x: x['confidence'], reverse=True)[:3]]
+        tags.extend(top_coco)
+    
+    # Generate a description based on detections
+    description = "Analysis complete."
+    if env_detections:
+        env_classes = [d['class'] for d in env_detections]
+        description = f"Detected environmental issues: {', '.join(env_classes)}. "
+        
+        if "Pothole" in env_classes:
+            description += "Potholes may pose a hazard to vehicles and pedestrians. "
+        if "Litter" in env_classes:
+            description += "Litter should be cleaned up promptly. "
+        if "Flood" in env_classes:
+            description += "Flooding detected, which may require immediate attention. "
+    
+    if coco_detections:
+        relevant_objects = [d['class'] for d in coco_detections if d['confidence'] > 0.4]
+        if relevant_objects:
+            description += f"Also detected: {', '.join(relevant_objects)}."
+    
+    return {
+        "title": title,
+        "description": description,
+        "category": category,
+        "tags": tags,
+        "severity": severity
+    }
+
 @app.function(
     image=image.pip_install(["fastapi", "python-multipart", "uvicorn"]),
+    allow_concurrent_inputs=WEB_CONCURRENT_INPUTS,
 )
 @modal.asgi_app(label="yolo-dual-model-detection")
 def fastapi_app():
     from fastapi import FastAPI, Request, Response, Query
     from fastapi.middleware.cors import CORSMiddleware
-    from fastapi.responses import JSONResponse
+    from fastapi.responses import JSONResponse, PlainTextResponse
+    import asyncio
     import json
     import os
+    import time
     
     env_model_path = os.getenv("ENV_MODEL_PATH", None)
     coco_model_path = os.getenv("COCO_MODEL_PATH", "yolov8n.pt")
     
     web_app = FastAPI(title="YOLO Dual Model Detection API")
     
+    # Live-camera previews and full analyses get separate lanes, so an /analyze burst can't starve previews.
+    # Previews are shed quickly: a frame that waited seconds is stale anyway.
+    lanes = {
+        "preview": Lane("preview", LaneConfig.from_env("preview", concurrency=8, queue=8, max_wait=1.0)),
+        "analyze": Lane("analyze", LaneConfig.from_env("analyze", concurrency=4, queue=16, max_wait=30.0))
+    }
+    web_app.add_middleware(AdmissionMiddleware, lanes=lanes, routes={"/detect": "preview", "/analyze": "analyze"})
+    
     # Add CORS middleware to allow requests from your frontend
     web_app.add_middleware(
         CORSMiddleware,
@@ -343,20 +314,120 @@ def fastapi_app():
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Server-Timing", "Retry-After"],
+    )
+    web_app.add_middleware(TimingMiddleware)
+    
+    data_dir = os.getenv("DETECTOR_DATA_DIR", volume_path)
+    
+    # Append-only Parquet log of every request's detections and analysis, for offline analytics
+    request_log = ParquetLog.from_env(
+        os.getenv("REQUEST_LOG_DIR", str(Path(data_dir) / "analytics")), REQUEST_DATASET, request_schema
     )
     
-    detector = DualModelDetection(env_model_path, coco_model_path)
+    # Per-tile detection counts for the map heatmap, fed by located /analyze submissions.
+    # On Modal they go to the single TileAggregator container, which owns tiles.db.
+    local_tiles = None
+    if os.getenv("DETECTOR_BACKEND", "modal") == "local":
+        local_tiles = TileStore.from_env(os.getenv("TILE_DB_PATH", str(Path(data_dir) / "tiles.db")))
+        add_tile_counts, read_tile = local_tiles.add, local_tiles.tile
+    else:
+        tile_aggregator = TileAggregator()
+        add_tile_counts, read_tile = tile_aggregator.add.spawn, tile_aggregator.tile.remote
+    
+    @web_app.on_event("shutdown")
+    def flush_stores():
+        if local_tiles is not None:
+            local_tiles.flush()
+        request_log.close()
+    
+    # Blurry, badly exposed or unchanged live frames are answered without a GPU pass
+    frame_filter = FrameFilter(FilterConfig.from_env())
+    
+    def log_request(*args, **kwargs):
+        """Buffer a request for the analytics log's writer thread; never fails the request"""
+        try:
+            request_log.append(request_record(*args, **kwargs))
+        except Exception as e:
+            print(f"Failed to log request: {e}")
+    
+    # DETECTOR_MODE=fused serves one network trained on both class sets (train.py --fused)
+    fused_model_path = None
+    if os.getenv("DETECTOR_MODE", "dual") == "fused":
+        fused_model_path = os.getenv("FUSED_MODEL_PATH") or default_fused_model_path(data_dir)
+    
+    # Several versions of the primary model can be served side by side, e.g. to canary new weights
+    model_versions = os.getenv("MODEL_VERSIONS")
+    model_routing = os.getenv("MODEL_ROUTING")
+    router = VersionRouter.from_config(
+        fused_model_path or env_model_path or default_env_model_path(data_dir), model_versions, model_routing
+    )
+    
+    # DETECTOR_BACKEND=local runs the models in this process (CPU), for load tests without Modal
+    if os.getenv("DETECTOR_BACKEND", "modal") == "local":
+        local_detector = Detector(env_model_path, coco_model_path, data_dir=data_dir, fused_model_path=fused_model_path,
+                                  versions=router)
+        local_detector.load_models()
+        detect_fn = local_detector.detect
+    else:
+        detect_fn = DualModelDetection(env_model_path, coco_model_path, fused_model_path,
+                                       model_versions, model_routing).detect.remote
+
+    def run_detection(img_data_base64, conf_env, conf_coco, model_version, live=False):
+        """Call the GPU detector and fold its stage timings into this request's trace"""
+        start = time.perf_counter()
+        with span("detect_rpc"):
+            result = detect_fn(
+                img_data_base64,
+                conf_env=conf_env,
+                conf_coco=conf_coco,
+                model_version=model_version,
+                live=live
+            )
+        record_version(model_version, time.perf_counter() - start, result)
+        if result:
+            for stage, seconds in result.get('timings', {}).items():
+                record(stage, seconds)
+        return result
+
+    async def run_claude(img_data_base64, detections, title, budget):
+        """Claude's analysis of the photo, or None if it is unavailable or fails"""
+        try:
+            # Downscaling and cropping is CPU work, keep it off the event loop
+            with span("image_prep"):
+                image_blocks = await asyncio.to_thread(build_image_blocks, img_data_base64, detections or {}, budget)
+            return await analyze_with_claude(
+                image_blocks=image_blocks,
+                classification=json.dumps(detections) if detections is not None else None,
+                title=title,
+                image_mode=budget.mode
+            )
+        except Exception as e:
+            print(f"Claude analysis failed, using basic analysis: {e}")
+            return None
     
     @web_app.get("/")
     async def read_root():
         return {"message": "YOLO Dual Model Detection API is running"}
     
+    @web_app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+    
     @web_app.post("/detect")
     async def detect(
         request: Request,
         conf_env: float = Query(0.25, description="Confidence threshold for environmental model"),
-        conf_coco: float = Query(0.25, description="Confidence threshold for COCO model")
+        conf_coco: float = Query(0.25, description="Confidence threshold for COCO model"),
+        model_version: str = Query(None, description="Model version to use (default: picked by MODEL_ROUTING)"),
+        client_id: str = Query(None, description="Stable id of the camera session, for duplicate-frame checks"),
+        prefilter: bool = Query(True, description="Skip blurry, dark or duplicate frames without detection")
     ):
+        try:
+            model_version = router.choose(model_version)
+        except ValueError as e:
+            return JSONResponse(content={"error": str(e)}, status_code=400)
+        
         try:
             body = await request.body()
             # Handle if data is sent as JSON with base64 string
@@ -373,14 +444,20 @@ def fastapi_app():
                 except:
                     img_data_base64 = body
             
-            result = detector.detect.remote(
-                img_data_base64, 
-                conf_env=conf_env, 
-                conf_coco=conf_coco
-            )
+            client_key = client_id or (request.client.host if request.client else "anonymous")
+            if prefilter:
+                with span("prefilter"):
+                    skipped = await asyncio.to_thread(frame_filter.check, client_key, img_data_base64)
+                if skipped is not None:
+                    return JSONResponse(content=skipped)
+            
+            # Off the event loop, so this container can have several detections in flight
+            result = await asyncio.to_thread(run_detection, img_data_base64, conf_env, conf_coco, model_version, True)
             
             if result:
-                return JSONResponse(content=result)
+                frame_filter.remember(client_key, result)
+                log_request("detect", result, conf_env, conf_coco)
+                return JSONResponse(content={**result, "skipped": False})
             else:
                 return JSONResponse(content={"error": "Detection failed"}, status_code=500)
         except Exception as e:
@@ -391,9 +468,25 @@ def fastapi_app():
     async def analyze(
         request: Request,
         conf_env: float = Query(0.3, description="Confidence threshold for environmental model"),
-        conf_coco: float = Query(0.3, description="Confidence threshold for COCO model")
+        conf_coco: float = Query(0.3, description="Confidence threshold for COCO model"),
+        image_mode: str = Query(None, description="What Claude sees: image, detections or text (default ANALYZE_IMAGE_MODE)"),
+        model_version: str = Query(None, description="Model version to use (default: picked by MODEL_ROUTING)"),
+        pipeline: str = Query(None, description="sequential or overlapped (default ANALYZE_PIPELINE)"),
+        lat: float = Query(None, description="Latitude of the photo, counted into the heatmap tiles"),
+        lon: float = Query(None, description="Longitude of the photo, counted into the heatmap tiles")
     ):
         """Endpoint for final image analysis with higher confidence thresholds and additional metadata"""
+        try:
+            budget = ImageBudget.from_env(image_mode)
+            model_version = router.choose(model_version)
+            pipeline = pipeline or ANALYZE_PIPELINE
+            if pipeline not in ANALYZE_PIPELINES:
+                raise ValueError(f"Unknown pipeline: {pipeline} (expected one of {', '.join(ANALYZE_PIPELINES)})")
+            if (lat is None) != (lon is None) or (lat is not None and not (-90 <= lat <= 90 and -180 <= lon <= 180)):
+                raise ValueError("lat and lon must be given together as valid coordinates")
+        except ValueError as e:
+            return JSONResponse(content={"error": str(e)}, status_code=400)
+        
         try:
             body = await request.body()
             
@@ -411,104 +504,90 @@ def fastapi_app():
                 except:
                     img_data_base64 = body
             
-            # Call the same detection method but with higher confidence thresholds
-            result = detector.detect.remote(
-                img_data_base64, 
-                conf_env=conf_env, 
-                conf_coco=conf_coco
-            )
-            
-            if not result:
-                return JSONResponse(content={"error": "Detection failed"}, status_code=500)
-                
-            # Process the results to get more meaningful API response for the React app
-            env_detections = result['detections']['env']
-            coco_detections = result['detections']['coco']
-            
-            # Generate the API response with titles, descriptions, etc.
-            title = "No issues detected"
-            category = "General"
-            severity = "Low"
-            tags = []
-            
-            # Customize based on environmental detections
-            if env_detections:
-                # Get most confident environmental detection
-                best_env = max(env_detections, key=lambda x: x['confidence'])
-                title = f"{best_env['class']} detected"
-                category = "Environmental Issue"
-                
-                # Set severity based on confidence and type
-                if best_env['confidence'] > 0.7:
-                    severity = "High"
-                elif best_env['confidence'] > 0.5:
-                    severity = "Medium"
-                else:
-                    severity = "Low"
-                
-                # Add all environmental classes to tags
-                tags.extend([d['class'] for d in env_detections])
-            
-            # Add relevant COCO objects to tags
-            if coco_detections:
-                top_coco = [d['class'] for d in sorted(coco_detections, key=lambda x: x['confidence'], reverse=True)[:3]]
-                tags.extend(top_coco)
-            
-            # Generate a description based on detections
-            description = "Analysis complete."
-            if env_detections:
-                env_classes = [d['class'] for d in env_detections]
-                description = f"Detected environmental issues: {', '.join(env_classes)}. "
-                
-                if "Pothole" in env_classes:
-                    description += "Potholes may pose a hazard to vehicles and pedestrians. "
-                if "Litter" in env_classes:
-                    description += "Litter should be cleaned up promptly. "
-                if "Flood" in env_classes:
-                    description += "Flooding detected, which may require immediate attention. "
-            
-            if coco_detections:
-                relevant_objects = [d['class'] for d in coco_detections if d['confidence'] > 0.4]
-                if relevant_objects:
-                    description += f"Also detected: {', '.join(relevant_objects)}."
+            # Only the whole-photo mode can start Claude before detection; crops and text need the boxes
+            if pipeline == "overlapped" and budget.mode == "image":
+                # Claude sees the photo without a classification, the detector's output is merged in after
+                claude_task = asyncio.create_task(run_claude(img_data_base64, None, None, budget))
+                try:
+                    result = await asyncio.to_thread(run_detection, img_data_base64, conf_env, conf_coco, model_version)
+                except BaseException:
+                    claude_task.cancel()
+                    raise
+                if not result:
+                    claude_task.cancel()
+                    return JSONResponse(content={"error": "Detection failed"}, status_code=500)
+                summary = summarize_detections(result['detections'])
+                enhanced_analysis = await claude_task
+            else:
+                # Call the same detection method but with higher confidence thresholds
+                # Off the event loop, so this container can have several detections in flight
+                result = await asyncio.to_thread(run_detection, img_data_base64, conf_env, conf_coco, model_version)
+                if not result:
+                    return JSONResponse(content={"error": "Detection failed"}, status_code=500)
+                summary = summarize_detections(result['detections'])
+                enhanced_analysis = await run_claude(img_data_base64, result['detections'], summary['title'], budget)
             
-            # Call Claude for enhanced analysis if ANTHROPIC_API_KEY is available
-            enhanced_analysis = None
-            try:
-                enhanced_analysis = await self.analyze_with_claude(
-                    image_base64=img_data_base64,
-                    classification=json.dumps(result['detections']), 
-                    title=title
-                )
-            except Exception as e:
-                print(f"Claude analysis failed, using basic analysis: {e}")
+            # Previews aren't counted: the same scene would be counted once per frame
+            if lat is not None:
+                try:
+                    await asyncio.to_thread(add_tile_counts, result['detections'], lat, lon, time.time())
+                except Exception as e:
+                    print(f"Failed to count detections into tiles: {e}")
                 
             # Create the final API response with Claude analysis if available
             api_response = {
                 "image": result['image'],
                 "detections": result['detections'],
-                "title": title,
-                "description": description,
-                "category": category,
-                "tags": ",".join(tags),
-                "severity": severity
+                "model_version": result.get('model_version', model_version),
+                "title": summary['title'],
+                "description": summary['description'],
+                "category": summary['category'],
+                "tags": ",".join(summary['tags']),
+                "severity": summary['severity']
             }
             
             # Update with Claude analysis if available
             if enhanced_analysis:
                 api_response.update({
-                    "description": enhanced_analysis.get("general_information", description),
+                    "description": enhanced_analysis.get("description", summary['description']),
                     "environmental_task": enhanced_analysis.get("environmental_task", ""),
-                    "severity": self.map_severity_to_string(enhanced_analysis.get("severity", 3)),
-                    "tags": ",".join(enhanced_analysis.get("tags", tags))
+                    "severity": map_severity_to_string(enhanced_analysis.get("severity", 3)),
+                    "tags": ",".join(enhanced_analysis.get("tags", summary['tags']))
                 })
             
+            log_request("analyze", result, conf_env, conf_coco, analysis=api_response, image_mode=budget.mode,
+                        pipeline=pipeline, lat=lat, lon=lon, llm_used=enhanced_analysis is not None)
             return JSONResponse(content=api_response)
             
         except Exception as e:
             print(f"Error in analyze endpoint: {e}")
             return JSONResponse(content={"error": f"Error processing image: {str(e)}"}, status_code=500)
     
+    @web_app.get("/tiles/{z}/{x}/{y}")
+    async def tiles(
+        z: int,
+        x: int,
+        y: int,
+        period: str = Query("day", description="Time bucket size: hour or day"),
+        since: float = Query(None, description="Only buckets from this Unix time"),
+        until: float = Query(None, description="Only buckets before this Unix time"),
+        classes: str = Query(None, description="Comma-separated class names (default: all)"),
+        detail: int = Query(2, ge=0, le=4, description="Heatmap cells are this many zoom levels below the tile")
+    ):
+        """Per-class detection counts and heatmap cells for one map tile"""
+        if not 0 <= z <= 22 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return JSONResponse(content={"error": f"No tile {z}/{x}/{y}"}, status_code=400)
+        class_list = [name.strip() for name in classes.split(",") if name.strip()] if classes else None
+        
+        try:
+            tile = await asyncio.to_thread(read_tile, z, x, y, period, since=since, until=until,
+                                           classes=class_list, detail=detail)
+        except ValueError as e:
+            return JSONResponse(content={"error": str(e)}, status_code=400)
+        if tile is None:
+            return JSONResponse(content={"error": f"No tiles are aggregated at zoom {z} or finer"}, status_code=404)
+        return JSONResponse(content=tile, headers={"Cache-Control": "public, max-age=60"})
+    
     return web_app
 
 @app.local_entrypoint()
@@ -0,0 +1,117 @@
+"""
+Image payloads for the Claude call in /analyze.
+
+Claude receives pixels as proper image content blocks instead of a base64
+string pasted into the prompt. Three modes trade detail for prompt size:
+
+- "image": the whole photo, downscaled so its longest side fits max_side
+- "detections": the detector output as text plus crops of the top boxes
+- "text": the detector output only, no pixels at all
+
+Limits come from ANALYZE_* environment variables and can be overridden per
+call.
+"""
+import base64
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+IMAGE_MODES = ("image", "detections", "text")
+
+
+@dataclass
+class ImageBudget:
+    mode: str = "image"
+    max_side: int = 768
+    jpeg_quality: int = 80
+    max_crops: int = 3
+    crop_max_side: int = 256
+    crop_padding: float = 0.15
+
+    @classmethod
+    def from_env(cls, mode: Optional[str] = None) -> "ImageBudget":
+        budget = cls(
+            mode=os.getenv("ANALYZE_IMAGE_MODE", "image"),
+            max_side=int(os.getenv("ANALYZE_IMAGE_MAX_SIDE", "768")),
+            jpeg_quality=int(os.getenv("ANALYZE_IMAGE_QUALITY", "80")),
+            max_crops=int(os.getenv("ANALYZE_MAX_CROPS", "3")),
+            crop_max_side=int(os.getenv("ANALYZE_CROP_MAX_SIDE", "256")),
+        )
+        if mode:
+            budget.mode = mode
+        if budget.mode not in IMAGE_MODES:
+            raise ValueError(f"Unknown image mode: {budget.mode} (expected one of {', '.join(IMAGE_MODES)})")
+        return budget
+
+
+def decode_image(image_base64):
+    import cv2
+    import numpy as np
+
+    img_bytes = base64.b64decode(image_base64)
+    return cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+
+def encode_jpeg(img, max_side: int, quality: int) -> str:
+    """Shrink img so its longest side is at most max_side and return it as base64 JPEG"""
+    import cv2
+
+    height, width = img.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return base64.b64encode(buffer).decode("utf-8")
+
+
+def image_block(data: str) -> Dict[str, Any]:
+    return {
+        "type": "image",
+        "source": {"type": "base64", "media_type": "image/jpeg", "data": data}
+    }
+
+
+def top_detections(detections: Dict[str, List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    """Highest-confidence boxes, environmental issues ahead of COCO objects"""
+    env = sorted(detections.get("env", []), key=lambda d: d["confidence"], reverse=True)
+    coco = sorted(detections.get("coco", []), key=lambda d: d["confidence"], reverse=True)
+    return (env + coco)[:limit]
+
+
+def crop_detections(img, detections, budget: ImageBudget) -> List[Dict[str, Any]]:
+    """Padded crops around the top boxes, each downscaled to crop_max_side"""
+    height, width = img.shape[:2]
+    crops = []
+    for detection in top_detections(detections, budget.max_crops):
+        x1, y1, x2, y2 = detection["box"]
+        pad_x = int((x2 - x1) * budget.crop_padding)
+        pad_y = int((y2 - y1) * budget.crop_padding)
+        x1, y1 = max(0, x1 - pad_x), max(0, y1 - pad_y)
+        x2, y2 = min(width, x2 + pad_x), min(height, y2 + pad_y)
+        if x2 <= x1 or y2 <= y1:
+            continue
+        crops.append({
+            "label": f"{detection['class']} {detection['confidence']:.2f}",
+            "data": encode_jpeg(img[y1:y2, x1:x2], budget.crop_max_side, budget.jpeg_quality)
+        })
+    return crops
+
+
+def build_image_blocks(image_base64, detections, budget: ImageBudget) -> List[Dict[str, Any]]:
+    """Content blocks to place ahead of the text prompt for the selected mode"""
+    if budget.mode == "text":
+        return []
+
+    img = decode_image(image_base64)
+    if img is None:
+        return []
+
+    if budget.mode == "image":
+        return [image_block(encode_jpeg(img, budget.max_side, budget.jpeg_quality))]
+
+    blocks = []
+    for crop in crop_detections(img, detections, budget):
+        blocks.append({"type": "text", "text": f"Crop: {crop['label']}"})
+        blocks.append(image_block(crop["data"]))
+    return blocks
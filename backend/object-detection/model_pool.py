@@ -0,0 +1,202 @@
+"""
+Multi-version model hosting for the detector.
+
+ModelPool keeps loaded models keyed by weights path. When their total memory
+goes over MODEL_POOL_MEMORY_MB, it evicts the least recently used ones. An
+evicted model is loaded again the next time a request needs it. 0 (the
+default) means no limit.
+
+VersionRouter names the versions of the primary model: the environmental
+model, or the fused model in fused mode. MODEL_VERSIONS maps names to weights
+as "stable=/root/data/runs/unified_model/weights/best.pt,canary=/root/data/...".
+MODEL_ROUTING splits traffic by percentage, as "stable=90,canary=10". A
+request can also ask for a version by name.
+
+Per-version request counts, latency and detection counts are recorded where
+the routing happens (the web app), through record_version.
+"""
+import os
+import random
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from shared.tracing import REGISTRY
+
+VERSION_REQUESTS = REGISTRY.counter(
+    "envolve_model_version_requests_total", "Detection requests per model version", ["version", "outcome"]
+)
+VERSION_SECONDS = REGISTRY.histogram("envolve_model_version_seconds", "Detection latency per model version", ["version"])
+VERSION_DETECTIONS = REGISTRY.counter(
+    "envolve_model_version_detections_total", "Boxes returned per model version", ["version", "kind"]
+)
+POOL_BYTES = REGISTRY.gauge("envolve_model_pool_bytes", "Estimated memory held by loaded models")
+POOL_MODELS = REGISTRY.gauge("envolve_model_pool_models", "Models currently loaded")
+POOL_LOADS = REGISTRY.counter("envolve_model_pool_loads_total", "Model loads, including reloads after eviction")
+POOL_EVICTIONS = REGISTRY.counter("envolve_model_pool_evictions_total", "Models evicted to stay within the memory budget")
+
+
+@dataclass
+class PooledModel:
+    """A loaded model (None if loading failed) with its class names, lock and predict arguments"""
+    path: str
+    model: Any
+    names: Any = None
+    nbytes: int = 0
+    predict_kwargs: Dict[str, Any] = field(default_factory=dict)
+    # An ultralytics predictor must not be used by two threads at once
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def model_nbytes(model) -> int:
+    """Parameter and buffer bytes of an ultralytics model, 0 for exported formats"""
+    network = getattr(model, "model", None)
+    if not hasattr(network, "parameters"):
+        return 0
+    tensors = list(network.parameters()) + list(network.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelPool:
+    def __init__(self, budget_bytes: int = 0):
+        self.budget_bytes = budget_bytes
+        self._entries: "OrderedDict[str, PooledModel]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ModelPool":
+        return cls(budget_bytes=int(float(os.getenv("MODEL_POOL_MEMORY_MB", "0")) * 1024 * 1024))
+
+    def get(self, path: str, load: Callable[[str], PooledModel]) -> PooledModel:
+        """The model for path, loading it with load(path) if it isn't resident"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._entries.move_to_end(path)
+                return entry
+            load_lock = self._loading.setdefault(path, threading.Lock())
+
+        # One thread loads a given path; others wait for it instead of loading a copy
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry is not None:
+                    self._entries.move_to_end(path)
+                    return entry
+            entry = load(path)
+            POOL_LOADS.inc()
+            with self._lock:
+                self._entries[path] = entry
+                evicted = self._evict(keep=path)
+                self._update_gauges()
+
+        if evicted:
+            print(f"Evicted {', '.join(evicted)} to stay within {self.budget_bytes / 2**20:.0f} MB")
+            release_device_memory()
+        return entry
+
+    def _evict(self, keep: str) -> List[str]:
+        """Drop least recently used models until within budget; in-flight calls keep their own reference"""
+        evicted = []
+        if self.budget_bytes <= 0:
+            return evicted
+        for path in list(self._entries):
+            if self._total_bytes() <= self.budget_bytes:
+                break
+            if path != keep:
+                del self._entries[path]
+                evicted.append(path)
+                POOL_EVICTIONS.inc()
+        return evicted
+
+    def _total_bytes(self) -> int:
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def _update_gauges(self) -> None:
+        POOL_BYTES.set(self._total_bytes())
+        POOL_MODELS.set(sum(1 for entry in self._entries.values() if entry.model is not None))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "budget_bytes": self.budget_bytes,
+                "total_bytes": self._total_bytes(),
+                "models": [{"path": path, "bytes": entry.nbytes, "loaded": entry.model is not None}
+                           for path, entry in self._entries.items()]
+            }
+
+
+def release_device_memory() -> None:
+    import torch
+
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def parse_mapping(value: str) -> List[Tuple[str, str]]:
+    """'a=x,b=y' as [('a', 'x'), ('b', 'y')]"""
+    pairs = []
+    for item in value.split(","):
+        if item.strip():
+            name, _, target = item.partition("=")
+            if not target:
+                raise ValueError(f"Expected name=value, got {item!r}")
+            pairs.append((name.strip(), target.strip()))
+    return pairs
+
+
+@dataclass
+class VersionRouter:
+    versions: Dict[str, str]
+    weights: Dict[str, float]
+
+    @classmethod
+    def from_config(cls, default_path: str, versions: Optional[str] = None, routing: Optional[str] = None) -> "VersionRouter":
+        """Versions from 'name=path,...' (default: one 'stable' version) and routing from 'name=percent,...'"""
+        version_map = dict(parse_mapping(versions)) if versions else {"stable": default_path}
+        if routing:
+            weights = {name: float(percent) for name, percent in parse_mapping(routing)}
+        else:
+            weights = {next(iter(version_map)): 100.0}
+        unknown = [name for name in weights if name not in version_map]
+        if unknown:
+            raise ValueError(f"Routing names unknown model version(s): {', '.join(unknown)}")
+        if sum(weights.values()) <= 0:
+            raise ValueError("Routing percentages must add up to more than 0")
+        return cls(version_map, weights)
+
+    @classmethod
+    def from_env(cls, default_path: str) -> "VersionRouter":
+        return cls.from_config(default_path, os.getenv("MODEL_VERSIONS"), os.getenv("MODEL_ROUTING"))
+
+    @property
+    def default(self) -> str:
+        return max(self.weights, key=self.weights.get)
+
+    def path(self, version: Optional[str]) -> str:
+        return self.versions[version or self.default]
+
+    def choose(self, requested: Optional[str] = None) -> str:
+        """The requested version if given, otherwise one picked by the routing percentages"""
+        if requested:
+            if requested not in self.versions:
+                raise ValueError(f"Unknown model version: {requested} (available: {', '.join(self.versions)})")
+            return requested
+        point = random.uniform(0, sum(self.weights.values()))
+        for name, weight in self.weights.items():
+            point -= weight
+            if point <= 0:
+                return name
+        return self.default
+
+
+def record_version(version: str, seconds: float, result: Optional[Dict[str, Any]]) -> None:
+    if not result:
+        VERSION_REQUESTS.inc(version=version, outcome="error")
+        return
+    VERSION_REQUESTS.inc(version=version, outcome="ok")
+    VERSION_SECONDS.observe(seconds, version=version)
+    for kind, detections in result.get("detections", {}).items():
+        VERSION_DETECTIONS.inc(len(detections), version=version, kind=kind)
@@ -0,0 +1,293 @@
+"""
+Input preprocessing for Detector: reduced-size decoding, per-request
+inference size and optional tiling.
+
+Phone photos are often 12+ megapixels, but YOLO runs at 640. JPEGs are
+decoded straight to 1/2, 1/4 or 1/8 scale with cv2.IMREAD_REDUCED_* when the
+result still has at least decode_min_side pixels on its long side, which
+skips most of the IDCT work and memory. Boxes are detected on the reduced
+image and mapped back to original coordinates with DecodedImage.to_original.
+
+Tiling runs the environmental model over overlapping inference-size tiles,
+so small, distant potholes keep enough pixels. In "auto" mode it only runs
+when the whole-image pass found nothing and the image is large enough for
+tiling to see more detail. Live camera frames (/detect) use live_tiling,
+"off" by default: most live frames are empty, and auto would add a full set
+of tile passes to each of them.
+
+When both models are PyTorch weights, LetterboxCache letterboxes and
+normalizes the frame once, into reused per-thread buffers, and uploads it to
+the device once. Both models take that tensor instead of each redoing the
+resize, BGR->RGB, /255 and host-to-device copy. Limits come from DETECT_*
+environment variables.
+"""
+import math
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+TILING_MODES = ("off", "auto", "on")
+
+# Start-of-frame markers carry the image size (baseline, progressive, lossless, ...)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+@dataclass
+class PreprocessConfig:
+    decode_min_side: int = 1280
+    max_imgsz: int = 640
+    min_imgsz: int = 320
+    tiling: str = "auto"
+    live_tiling: str = "off"
+    tile_overlap: float = 0.2
+    tile_min_ratio: float = 1.5
+    tile_iou: float = 0.5
+    shared_input: bool = True
+
+    @classmethod
+    def from_env(cls) -> "PreprocessConfig":
+        config = cls(
+            decode_min_side=int(os.getenv("DETECT_DECODE_MIN_SIDE", "1280")),
+            max_imgsz=int(os.getenv("DETECT_IMGSZ", "640")),
+            min_imgsz=int(os.getenv("DETECT_MIN_IMGSZ", "320")),
+            tiling=os.getenv("DETECT_TILING", "auto"),
+            live_tiling=os.getenv("DETECT_LIVE_TILING", "off"),
+            tile_overlap=float(os.getenv("DETECT_TILE_OVERLAP", "0.2")),
+            shared_input=os.getenv("DETECT_SHARED_INPUT", "1") == "1",
+        )
+        for mode in (config.tiling, config.live_tiling):
+            if mode not in TILING_MODES:
+                raise ValueError(f"Unknown tiling mode: {mode} (expected one of {', '.join(TILING_MODES)})")
+        return config
+
+
+@dataclass
+class DecodedImage:
+    image: Any
+    original_size: Tuple[int, int]
+    reduction: int = 1
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        height, width = self.image.shape[:2]
+        return width, height
+
+    def to_original(self, box: List[int]) -> List[int]:
+        """Map an [x1, y1, x2, y2] box on the decoded image to original pixel coordinates"""
+        if self.reduction == 1:
+            return box
+        width, height = self.size
+        original_width, original_height = self.original_size
+        scale_x, scale_y = original_width / width, original_height / height
+        x1, y1, x2, y2 = box
+        return [
+            min(original_width, int(x1 * scale_x)),
+            min(original_height, int(y1 * scale_y)),
+            min(original_width, int(x2 * scale_x)),
+            min(original_height, int(y2 * scale_y))
+        ]
+
+
+def jpeg_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from a JPEG's SOF header without decoding it, or None if not a JPEG"""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in SOF_MARKERS:
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+def reduction_factor(width: int, height: int, min_side: int) -> int:
+    """Largest JPEG DCT scale-down that keeps the long side at least min_side"""
+    if min_side <= 0:
+        return 1
+    for factor in (8, 4, 2):
+        if max(width, height) / factor >= min_side:
+            return factor
+    return 1
+
+
+def decode_image(img_bytes: bytes, min_side: int) -> DecodedImage:
+    import cv2
+    import numpy as np
+
+    reduced_flags = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8
+    }
+
+    dimensions = jpeg_dimensions(img_bytes)
+    factor = reduction_factor(*dimensions, min_side) if dimensions else 1
+    img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), reduced_flags[factor])
+    if img is None:
+        raise ValueError("Could not decode image")
+
+    height, width = img.shape[:2]
+    if factor == 1:
+        return DecodedImage(img, (width, height))
+
+    original_width, original_height = dimensions
+    # imdecode applies EXIF orientation, the header size is before rotation
+    if (width > height) != (original_width > original_height):
+        original_width, original_height = original_height, original_width
+    return DecodedImage(img, (original_width, original_height), factor)
+
+
+def inference_size(width: int, height: int, config: PreprocessConfig) -> int:
+    """Smallest multiple of 32 covering the long side, within [min_imgsz, max_imgsz]"""
+    long_side = math.ceil(max(width, height) / 32) * 32
+    return max(config.min_imgsz, min(config.max_imgsz, long_side))
+
+
+def should_tile(width: int, height: int, found_any: bool, config: PreprocessConfig, live: bool = False) -> bool:
+    mode = config.live_tiling if live else config.tiling
+    if mode == "off" or max(width, height) < config.max_imgsz * config.tile_min_ratio:
+        return False
+    return mode == "on" or not found_any
+
+
+def _tile_starts(length: int, tile: int, step: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+def tile_windows(width: int, height: int, tile: int, overlap: float) -> List[Tuple[int, int, int, int]]:
+    """Overlapping (x1, y1, x2, y2) windows of size tile that cover the image"""
+    step = max(1, int(tile * (1 - overlap)))
+    return [
+        (x, y, min(width, x + tile), min(height, y + tile))
+        for y in _tile_starts(height, tile, step)
+        for x in _tile_starts(width, tile, step)
+    ]
+
+
+def result_rows(results):
+    """Ultralytics results as an (N, 6) array of x1, y1, x2, y2, confidence, class"""
+    import numpy as np
+
+    rows = [
+        np.column_stack([r.boxes.xyxy.cpu().numpy(), r.boxes.conf.cpu().numpy(), r.boxes.cls.cpu().numpy()])
+        for r in results
+        if len(r.boxes)
+    ]
+    return np.concatenate(rows) if rows else np.zeros((0, 6), dtype=np.float32)
+
+
+def merge_rows(rows, iou: float):
+    """Per-class non-maximum suppression, for boxes found twice in overlapping tiles"""
+    import cv2
+    import numpy as np
+
+    if len(rows) < 2:
+        return rows
+    # Offsetting each class into its own region makes class-agnostic NMS per-class
+    offset = rows[:, 5:6] * (rows[:, :4].max() + 1)
+    boxes = rows[:, :4] + offset
+    xywh = np.column_stack([boxes[:, 0], boxes[:, 1], boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]])
+    keep = cv2.dnn.NMSBoxes(xywh.tolist(), rows[:, 4].tolist(), 0.0, iou)
+    return rows[np.array(keep, dtype=int).reshape(-1)]
+
+
+def detect_tiled(predict, img, conf: float, config: PreprocessConfig):
+    """Run predict(crops, conf=, imgsz=) over overlapping tiles in one batch; merged rows in image coordinates"""
+    import numpy as np
+
+    height, width = img.shape[:2]
+    windows = tile_windows(width, height, config.max_imgsz, config.tile_overlap)
+    crops = [img[y1:y2, x1:x2] for x1, y1, x2, y2 in windows]
+    results = predict(crops, conf=conf, imgsz=config.max_imgsz)
+
+    rows = []
+    for (x1, y1, _, _), result in zip(windows, results):
+        tile_rows = result_rows([result])
+        tile_rows[:, [0, 2]] += x1
+        tile_rows[:, [1, 3]] += y1
+        rows.append(tile_rows)
+    return merge_rows(np.concatenate(rows), config.tile_iou)
+
+
+@dataclass
+class PreparedInput:
+    """A letterboxed (1, 3, H, W) RGB float tensor and how to undo the letterbox"""
+    tensor: Any
+    gain: float
+    left: int
+    top: int
+    width: int
+    height: int
+
+    def to_image(self, rows):
+        """Map rows from letterboxed-tensor coordinates back onto the source image"""
+        rows[:, [0, 2]] = ((rows[:, [0, 2]] - self.left) / self.gain).clip(0, self.width)
+        rows[:, [1, 3]] = ((rows[:, [1, 3]] - self.top) / self.gain).clip(0, self.height)
+        return rows
+
+
+class LetterboxCache:
+    """Letterboxes frames into cached host buffers (pinned when uploading to CUDA)
+
+    Buffers belong to the calling thread, so concurrent detect calls never
+    write into each other's input.
+    """
+
+    def __init__(self, pad_value: int = 114):
+        self.pad_value = pad_value
+        self._local = threading.local()
+
+    def _buffer(self, key, shape, pinned: bool = False):
+        import torch
+
+        buffers = self._local.__dict__.setdefault("buffers", {})
+        buffer = buffers.get(key)
+        if buffer is None or tuple(buffer.shape) != shape or buffer.is_pinned() != pinned:
+            buffer = torch.empty(shape, dtype=torch.uint8)
+            if pinned:
+                buffer = buffer.pin_memory()
+            buffers[key] = buffer
+        return buffer
+
+    def prepare(self, img, imgsz: int, device, stride: int = 32) -> PreparedInput:
+        """Fit img inside imgsz, padding each side only up to a multiple of stride (like ultralytics)"""
+        import cv2
+
+        height, width = img.shape[:2]
+        gain = min(imgsz / height, imgsz / width)
+        new_width, new_height = max(1, round(width * gain)), max(1, round(height * gain))
+        canvas_width = math.ceil(new_width / stride) * stride
+        canvas_height = math.ceil(new_height / stride) * stride
+        left, top = (canvas_width - new_width) // 2, (canvas_height - new_height) // 2
+
+        canvas = self._buffer("canvas", (canvas_height, canvas_width, 3), pinned=device.type == "cuda")
+        host = canvas.numpy()
+        host.fill(self.pad_value)
+        if (new_width, new_height) == (width, height):
+            host[top:top + new_height, left:left + new_width] = img
+        else:
+            resized = self._buffer("resized", (new_height, new_width, 3)).numpy()
+            cv2.resize(img, (new_width, new_height), dst=resized, interpolation=cv2.INTER_LINEAR)
+            host[top:top + new_height, left:left + new_width] = resized
+
+        # One upload, then BGR HWC uint8 -> RGB BCHW float in [0, 1] on the device
+        tensor = canvas.to(device, non_blocking=True)
+        tensor = tensor.permute(2, 0, 1).flip(0).unsqueeze(0).float().div_(255)
+        return PreparedInput(tensor, gain, left, top, width, height)
@@ -0,0 +1,144 @@
+"""
+Analytics log of detector requests, on top of shared.parquet_log.
+
+Every /detect and /analyze call appends one row: thresholds, model version,
+stage timings, the env and COCO detections, and for /analyze the final
+title/category/severity and Claude's recommendation. Rows land as Parquet
+under <REQUEST_LOG_DIR>/requests on the volume, so questions about past
+traffic no longer mean re-running inference over the photos.
+
+Query from a local copy of the volume (needs pyarrow):
+
+    python request_log.py --root ./data/analytics --since 2026-10-01 --by class
+"""
+import argparse
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# backend/shared holds modules used by both the analyzer and detector services
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.parquet_log import read_dataset
+
+DATASET = "requests"
+GROUP_BY = ("class", "model_version", "endpoint", "severity", "category")
+
+
+def request_schema(pa):
+    detection = pa.struct([
+        ("class", pa.string()),
+        ("confidence", pa.float32()),
+        ("box", pa.list_(pa.int32()))
+    ])
+    return pa.schema([
+        ("ts", pa.timestamp("ms", tz="UTC")),
+        ("endpoint", pa.string()),
+        ("model_version", pa.string()),
+        ("conf_env", pa.float32()),
+        ("conf_coco", pa.float32()),
+        ("image_mode", pa.string()),
+        ("pipeline", pa.string()),
+        ("image_width", pa.int32()),
+        ("image_height", pa.int32()),
+        ("tiled", pa.bool_()),
+        ("lat", pa.float64()),
+        ("lon", pa.float64()),
+        ("timings", pa.map_(pa.string(), pa.float64())),
+        ("env_detections", pa.list_(detection)),
+        ("coco_detections", pa.list_(detection)),
+        ("title", pa.string()),
+        ("category", pa.string()),
+        ("severity", pa.string()),
+        ("tags", pa.string()),
+        ("description", pa.string()),
+        ("environmental_task", pa.string()),
+        ("llm_used", pa.bool_())
+    ])
+
+
+def request_record(endpoint: str, result: Dict[str, Any], conf_env: float, conf_coco: float,
+                   analysis: Optional[Dict[str, Any]] = None, **extra) -> Dict[str, Any]:
+    """One log row from a detector result and, for /analyze, the API response sent back"""
+    width, height = (result.get('image_size') or [None, None])[:2]
+    record = {
+        "ts": datetime.now(timezone.utc),
+        "endpoint": endpoint,
+        "model_version": result.get('model_version'),
+        "conf_env": conf_env,
+        "conf_coco": conf_coco,
+        "image_width": width,
+        "image_height": height,
+        "tiled": result.get('tiled'),
+        "timings": list((result.get('timings') or {}).items()),
+        "env_detections": result['detections'].get('env', []),
+        "coco_detections": result['detections'].get('coco', []),
+        **extra
+    }
+    if analysis is not None:
+        record.update({field: analysis.get(field) for field in
+                       ("title", "category", "severity", "tags", "description", "environmental_task")})
+    return record
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def summarize(table, by: str):
+    """Rows of (day, group, count[, mean confidence]); by class it counts detections, otherwise requests"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    day = pc.strftime(table["ts"], format="%Y-%m-%d").combine_chunks()
+    if by == "class":
+        parts = []
+        for column in ("env_detections", "coco_detections"):
+            detections = table[column].combine_chunks()
+            # One row per detection, keeping the day of the request it came from
+            flat = pc.list_flatten(detections)
+            parts.append(pa.table({
+                "day": pc.take(day, pc.list_parent_indices(detections)),
+                "class": pc.struct_field(flat, [0]),
+                "confidence": pc.struct_field(flat, [1])
+            }))
+        counts = pa.concat_tables(parts).group_by(["day", "class"]).aggregate([("class", "count"), ("confidence", "mean")])
+        sort_key = "class_count"
+    else:
+        counts = pa.table({"day": day, by: table[by], "requests": pa.array([1] * table.num_rows)}) \
+            .group_by(["day", by]).aggregate([("requests", "sum")])
+        sort_key = "requests_sum"
+    return counts.sort_by([("day", "ascending"), (sort_key, "descending")]).to_pylist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the detector's request log")
+    parser.add_argument("--root", required=True, help="REQUEST_LOG_DIR, e.g. a local copy of the volume's analytics/")
+    parser.add_argument("--since", default=None, help="ISO date or time, UTC unless it has an offset")
+    parser.add_argument("--until", default=None, help="ISO date or time, exclusive")
+    parser.add_argument("--by", default="class", choices=GROUP_BY)
+    parser.add_argument("--output", default=None, help="Also write the matching rows to this Parquet file")
+    args = parser.parse_args()
+
+    table = read_dataset(args.root, DATASET, since=parse_time(args.since), until=parse_time(args.until))
+    if table is None:
+        raise SystemExit(f"No {DATASET} records under {args.root} in that range")
+    print(f"{table.num_rows} requests")
+    for row in summarize(table, args.by):
+        print("  ".join(f"{value:.3f}" if isinstance(value, float) else str(value) for value in row.values()))
+
+    if args.output:
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, args.output, compression="zstd")
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
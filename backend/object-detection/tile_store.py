@@ -0,0 +1,184 @@
+"""
+Precomputed map-tile aggregates of detections, for the heatmap.
+
+Each analyzed photo with a location adds its detections to per-tile,
+per-class counts. Counts are kept at every zoom level in TILE_ZOOMS (web
+mercator, z/x/y like the map tiles) and for every period in TILE_PERIODS
+(hour and day buckets). Updates gather in memory and are flushed as upserts
+in one transaction, every TILE_FLUSH_EVENTS photos or TILE_FLUSH_SECONDS.
+
+A tile request reads the counts of its sub-tiles at a finer stored zoom and
+returns per-class totals plus a grid of [x, y, count] cells for the heatmap.
+It never touches raw reports.
+
+The database has a single writer: on Modal, inference.TileAggregator (one
+container) owns it and the web containers send it their counts.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from shared.geo import mercator_tile
+from shared.sqlite_util import ThreadLocalConnections
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tile_counts (
+    period TEXT NOT NULL,
+    z INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    class TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    confidence_sum REAL NOT NULL,
+    PRIMARY KEY (period, z, x, y, bucket, class)
+) WITHOUT ROWID;
+"""
+
+PERIOD_SECONDS = {"hour": 3600, "day": 86400}
+
+
+def parse_list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class TileStore:
+    def __init__(self, path: str, zooms: Iterable[int] = (10, 12, 14, 16), periods: Iterable[str] = ("hour", "day"),
+                 flush_events: int = 50, flush_seconds: float = 10.0, on_write: Optional[Callable[[], None]] = None):
+        self.connections = ThreadLocalConnections(path, SCHEMA, on_write)
+        self.zooms = sorted(set(zooms))
+        self.periods = list(periods)
+        unknown = [period for period in self.periods if period not in PERIOD_SECONDS]
+        if unknown:
+            raise ValueError(f"Unknown tile period(s): {', '.join(unknown)} (expected some of {', '.join(PERIOD_SECONDS)})")
+        self.flush_events = flush_events
+        self.flush_seconds = flush_seconds
+        # (period, z, x, y, bucket, class) -> [count, confidence_sum], not yet written
+        self._pending: Dict[Tuple, List[float]] = defaultdict(lambda: [0, 0.0])
+        self._pending_events = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, path: str, on_write: Optional[Callable[[], None]] = None) -> "TileStore":
+        return cls(
+            path,
+            zooms=[int(z) for z in parse_list(os.getenv("TILE_ZOOMS", "10,12,14,16"))],
+            periods=parse_list(os.getenv("TILE_PERIODS", "hour,day")),
+            flush_events=int(os.getenv("TILE_FLUSH_EVENTS", "50")),
+            flush_seconds=float(os.getenv("TILE_FLUSH_SECONDS", "10")),
+            on_write=on_write
+        )
+
+    def add(self, detections: Dict[str, List[Dict[str, Any]]], lat: float, lon: float,
+            timestamp: Optional[float] = None) -> None:
+        """Count one photo's detections at its location; flushes when enough has gathered"""
+        timestamp = timestamp or time.time()
+        tiles = [(z, *mercator_tile(lat, lon, z)) for z in self.zooms]
+        buckets = [(period, int(timestamp // PERIOD_SECONDS[period]) * PERIOD_SECONDS[period]) for period in self.periods]
+        with self._lock:
+            for detection in detections.get("env", []) + detections.get("coco", []):
+                for period, bucket in buckets:
+                    for z, x, y in tiles:
+                        totals = self._pending[(period, z, x, y, bucket, detection["class"])]
+                        totals[0] += 1
+                        totals[1] += detection["confidence"]
+            self._pending_events += 1
+        self.flush_if_due()
+
+    def flush_if_due(self) -> int:
+        with self._lock:
+            due = self._pending_events > 0 and (
+                self._pending_events >= self.flush_events
+                or time.monotonic() - self._last_flush >= self.flush_seconds
+            )
+        return self.flush() if due else 0
+
+    def flush(self) -> int:
+        """Write pending counts in one transaction; returns the number of rows upserted"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: [0, 0.0])
+            self._pending_events = 0
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        conn = self.connections.get()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                """INSERT INTO tile_counts (period, z, x, y, bucket, class, count, confidence_sum)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (period, z, x, y, bucket, class) DO UPDATE SET
+                       count = count + excluded.count,
+                       confidence_sum = confidence_sum + excluded.confidence_sum""",
+                [(*key, int(totals[0]), totals[1]) for key, totals in pending.items()]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.connections.wrote()
+        return len(pending)
+
+    def detail_zoom(self, z: int, detail: int) -> Optional[int]:
+        """Stored zoom closest to z + detail that is not coarser than z"""
+        finer = [zoom for zoom in self.zooms if zoom >= z]
+        if not finer:
+            return None
+        at_most = [zoom for zoom in finer if zoom <= z + detail]
+        return max(at_most) if at_most else min(finer)
+
+    def tile(self, z: int, x: int, y: int, period: str = "day", since: Optional[float] = None,
+             until: Optional[float] = None, classes: Optional[List[str]] = None, detail: int = 2) -> Optional[Dict[str, Any]]:
+        """Per-class totals and heatmap cells for tile z/x/y, or None if no stored zoom is fine enough"""
+        if period not in self.periods:
+            raise ValueError(f"Unknown period: {period} (expected one of {', '.join(self.periods)})")
+        cell_z = self.detail_zoom(z, detail)
+        if cell_z is None:
+            return None
+        # Counts that are due are written first, so a quiet store still shows recent reports
+        self.flush_if_due()
+
+        scale = 2 ** (cell_z - z)
+        clauses = ["period = ?", "z = ?", "x BETWEEN ? AND ?", "y BETWEEN ? AND ?"]
+        params: List[Any] = [period, cell_z, x * scale, (x + 1) * scale - 1, y * scale, (y + 1) * scale - 1]
+        if since is not None:
+            clauses.append("bucket >= ?")
+            params.append(int(since // PERIOD_SECONDS[period]) * PERIOD_SECONDS[period])
+        if until is not None:
+            clauses.append("bucket < ?")
+            params.append(until)
+        if classes:
+            clauses.append(f"class IN ({', '.join('?' for _ in classes)})")
+            params.extend(classes)
+
+        rows = self.connections.get().execute(
+            f"""SELECT x, y, class, SUM(count) AS count, SUM(confidence_sum) AS confidence_sum
+                FROM tile_counts WHERE {' AND '.join(clauses)} GROUP BY x, y, class""",
+            params
+        ).fetchall()
+
+        totals: Dict[str, Dict[str, float]] = {}
+        cells: Dict[Tuple[int, int], int] = defaultdict(int)
+        for row in rows:
+            total = totals.setdefault(row["class"], {"count": 0, "confidence_sum": 0.0})
+            total["count"] += row["count"]
+            total["confidence_sum"] += row["confidence_sum"]
+            cells[(row["x"], row["y"])] += row["count"]
+
+        return {
+            "z": z,
+            "x": x,
+            "y": y,
+            "period": period,
+            "cell_zoom": cell_z,
+            "classes": {
+                name: {"count": total["count"], "mean_confidence": round(total["confidence_sum"] / total["count"], 3)}
+                for name, total in totals.items()
+            },
+            # Compact heatmap: [x, y, count] at cell_zoom
+            "cells": [[cell_x, cell_y, count] for (cell_x, cell_y), count in sorted(cells.items())]
+        }
@@ -1,8 +1,14 @@
 import modal
+import sys
 from pathlib import Path
 from dataclasses import dataclass
 import os
 
+# backend/shared holds modules used by both the analyzer and detector services
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.tracing import percentiles
+
 os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "expandable_segments:True"
 
 image = (
@@ -16,6 +22,7 @@ image = (
     .pip_install(
         "term-image==0.7.1"
     )
+    .add_local_python_source("shared")
 )
 
 volume = modal.Volume.from_name("yolo-finetune", create_if_missing=True)
@@ -212,6 +219,7 @@ def train(
     unified_yaml_path: str,
     model_size="yolov8m.pt",
     quick_check=False,
+    run_name="unified_model",
 ):
     import torch
     import os
@@ -231,7 +239,7 @@ def train(
     volume.reload()  
 
     import shutil
-    model_path = volume_path / "runs" / "unified_model"
+    model_path = volume_path / "runs" / run_name
     if model_path.exists():
         shutil.rmtree(model_path)
     model_path.mkdir(parents=True, exist_ok=True)
@@ -266,7 +274,7 @@ def train(
             save_period=1,
             
             project=f"{volume_path}/runs",
-            name="unified_model",
+            name=run_name,
             exist_ok=True,
             verbose=True,
         )
@@ -276,20 +284,133 @@ def train(
         traceback.print_exc()
         print(f"Training error: {e}")
     
-    best_weights_path = volume_path / "runs" / "unified_model" / "weights" / "best.pt"
+    best_weights_path = volume_path / "runs" / run_name / "weights" / "best.pt"
     
     if best_weights_path.exists():
         print(f"Training complete. Best weights saved to {best_weights_path}")
         return str(best_weights_path)
     else:
             
-        last_weights_path = volume_path / "runs" / "unified_model" / "weights" / "last.pt"
+        last_weights_path = volume_path / "runs" / run_name / "weights" / "last.pt"
         if last_weights_path.exists():
             print(f"Training complete. Last weights saved to {last_weights_path}")
             return str(last_weights_path)
         else:
             raise RuntimeError("No weights found after training!")
 
+# COCO classes the fused model learns alongside the environmental ones: street scene
+# objects that end up in /analyze tags and descriptions
+FUSED_COCO_CLASSES = [
+    "person", "bicycle", "car", "motorcycle", "bus", "truck", "traffic light", "fire hydrant",
+    "stop sign", "parking meter", "bench", "backpack", "handbag", "suitcase", "bottle", "cup",
+    "chair", "couch", "potted plant", "tv"
+]
+
+@app.function(gpu="A10G", timeout=120 * MINUTES)
+def create_fused_dataset(unified_yaml_path: str, coco_classes, teacher_model="yolov8x.pt", conf=0.4):
+    """Copy the unified dataset and add COCO pseudo-labels from a teacher model
+
+    Environmental classes keep ids 0..N-1 and the chosen COCO classes follow,
+    so one network can learn both and replace the env + COCO model pair.
+    """
+    import shutil
+    import torch
+    import yaml
+    from ultralytics import YOLO
+    
+    _original_torch_load = torch.load
+    torch.load = lambda *args, **kwargs: _original_torch_load(*args, weights_only=False, **kwargs)
+    
+    volume.reload()
+    
+    with open(unified_yaml_path, "r") as f:
+        unified_config = yaml.safe_load(f)
+    env_names = [unified_config["names"][i] for i in sorted(unified_config["names"])]
+    class_names = env_names + list(coco_classes)
+    
+    unified_dir = Path(unified_config["path"])
+    fused_dir = volume_path / "fused_dataset"
+    fused_yaml_path = fused_dir / "data.yaml"
+    
+    if fused_yaml_path.exists():
+        with open(fused_yaml_path, "r") as f:
+            existing_names = list(yaml.safe_load(f)["names"].values())
+        if existing_names == class_names:
+            print(f"Fused dataset with these classes already exists at {fused_dir}. Skipping recreation.")
+            return str(fused_yaml_path)
+        print(f"Fused dataset classes changed, recreating {fused_dir}")
+        shutil.rmtree(fused_dir)
+    
+    teacher = YOLO(teacher_model)
+    # Teacher class id -> fused class id
+    fused_ids = {
+        teacher_id: len(env_names) + class_names[len(env_names):].index(name)
+        for teacher_id, name in teacher.names.items()
+        if name in coco_classes
+    }
+    missing = set(coco_classes) - {teacher.names[i] for i in fused_ids}
+    if missing:
+        raise ValueError(f"Teacher model has no classes named: {', '.join(sorted(missing))}")
+    
+    batch_size = 32
+    for split in ["train", "valid", "test"]:
+        src_img_dir = unified_dir / "images" / split
+        src_label_dir = unified_dir / "labels" / split
+        dst_img_dir = fused_dir / "images" / split
+        dst_label_dir = fused_dir / "labels" / split
+        dst_img_dir.mkdir(parents=True, exist_ok=True)
+        dst_label_dir.mkdir(parents=True, exist_ok=True)
+        
+        if not src_img_dir.exists():
+            print(f"Warning: {src_img_dir} doesn't exist, skipping")
+            continue
+        
+        img_files = sorted(p for p in src_img_dir.iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.bmp'))
+        pseudo_labels = 0
+        
+        for i in range(0, len(img_files), batch_size):
+            batch_files = img_files[i:i+batch_size]
+            results = teacher.predict(
+                [str(p) for p in batch_files],
+                conf=conf,
+                classes=list(fused_ids),
+                half=True,
+                verbose=False,
+            )
+            
+            for img_path, result in zip(batch_files, results):
+                shutil.copy(img_path, dst_img_dir / img_path.name)
+                
+                src_label_path = src_label_dir / f"{img_path.stem}.txt"
+                lines = []
+                if src_label_path.exists():
+                    with open(src_label_path, "r") as f:
+                        lines = [line for line in f.readlines() if line.strip()]
+                
+                for cls_id, xywhn in zip(result.boxes.cls.tolist(), result.boxes.xywhn.tolist()):
+                    lines.append(f"{fused_ids[int(cls_id)]} " + " ".join(f"{v:.6f}" for v in xywhn) + "\n")
+                    pseudo_labels += 1
+                
+                if lines:
+                    with open(dst_label_dir / f"{img_path.stem}.txt", "w") as f:
+                        f.writelines(lines)
+        
+        print(f"  {split}: {len(img_files)} images, {pseudo_labels} COCO pseudo-labels")
+    
+    fused_yaml = {
+        "path": str(fused_dir),
+        "train": str(fused_dir / "images" / "train"),
+        "val": str(fused_dir / "images" / "valid"),
+        "test": str(fused_dir / "images" / "test"),
+        "names": {i: name for i, name in enumerate(class_names)},
+        "nc": len(class_names)
+    }
+    with open(fused_yaml_path, "w") as f:
+        yaml.dump(fused_yaml, f, sort_keys=False)
+    
+    print(f"Created fused dataset with {len(class_names)} classes: {', '.join(class_names)}")
+    return str(fused_yaml_path)
+
 @app.function()
 def read_image(image_path: str):
     import cv2
@@ -335,14 +456,17 @@ class Inference:
             os.path.join(batch_dir, f) for f in os.listdir(batch_dir)
         ]
 
+        latencies = []
         completed, start = 0, time.monotonic_ns()
         for image in read_image.map(image_files):
+            predict_start = time.perf_counter()
             results = self.model.predict(
                 image,
                 half=True, #fp16
                 save=False,
                 verbose=False,
             )
+            latencies.append(time.perf_counter() - predict_start)
             completed += 1
             for res in results:
                 for conf in res.boxes.conf:
@@ -358,9 +482,12 @@ class Inference:
             "Inferences per second:",
             round(completed / elapsed_seconds, 2),
         )
+        if latencies:
+            for label, ms in percentiles(latencies, scale=1000).items():
+                print(f"Predict latency {label}: {ms:.1f} ms")
 
 @app.local_entrypoint()
-def main(quick_check: bool = False, inference_only: bool = False):
+def main(quick_check: bool = False, inference_only: bool = False, fused: bool = False, fused_coco_classes: str = ""):
     import os
     
     pothole = DatasetConfig(
@@ -397,6 +524,9 @@ def main(quick_check: bool = False, inference_only: bool = False):
     )
 
     datasets = [pothole, litter, flood, light]
+    
+    # --fused trains one network on the env classes plus COCO pseudo-labels (served with DETECTOR_MODE=fused)
+    run_name = "fused_model" if fused else "unified_model"
 
     if not inference_only:
         print("Downloading datasets...")
@@ -407,10 +537,18 @@ def main(quick_check: bool = False, inference_only: bool = False):
         print("Creating unified dataset...")
         unified_yaml_path = create_unified_dataset.remote(categories)
         
-        print("Training unified model...")
-        best_weights_path = train.remote(unified_yaml_path, quick_check=quick_check)
+        if fused:
+            coco_classes = [c.strip() for c in fused_coco_classes.split(",") if c.strip()] or FUSED_COCO_CLASSES
+            print(f"Pseudo-labelling {len(coco_classes)} COCO classes for the fused dataset...")
+            fused_yaml_path = create_fused_dataset.remote(unified_yaml_path, coco_classes)
+            
+            print("Training fused model...")
+            best_weights_path = train.remote(fused_yaml_path, quick_check=quick_check, run_name=run_name)
+        else:
+            print("Training unified model...")
+            best_weights_path = train.remote(unified_yaml_path, quick_check=quick_check)
     else:
-        best_weights_path = str(volume_path / "runs" / "unified_model" / "weights" / "best.pt")
+        best_weights_path = str(volume_path / "runs" / run_name / "weights" / "best.pt")
     
     inference = Inference(best_weights_path)
     
@@ -426,7 +564,7 @@ def main(quick_check: bool = False, inference_only: bool = False):
             img_path = test_img_dir / img_file
             print(f"Testing image: {img_path}")
             inference.predict.remote(
-                model_id="unified_model",
+                model_id=run_name,
                 image_path=str(img_path),
                 display=(i == 0) 
             )
@@ -0,0 +1,151 @@
+"""
+Priority lanes and admission control for HTTP APIs.
+
+Each lane has its own concurrency limit and a bounded queue. AdmissionMiddleware
+maps request paths to lanes, so a burst on one lane can't starve the others.
+When a lane is saturated, new requests are shed before any work is done:
+
+- 429 when the lane's queue is full
+- 503 when a request waited longer than the lane's max_wait (e.g. a stale preview frame)
+
+Both responses carry a JSON error and a Retry-After estimated from the queue
+length and recent service times. Limits come from LANE_<NAME>_CONCURRENCY,
+LANE_<NAME>_QUEUE and LANE_<NAME>_MAX_WAIT. They apply per process (per
+container on Modal). Queue depth, in-flight requests, waits and outcomes
+per lane are exported on REGISTRY.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from shared.tracing import REGISTRY, record
+
+LANE_QUEUED = REGISTRY.gauge("envolve_lane_queued", "Requests waiting for a slot, per lane", ["lane"])
+LANE_ACTIVE = REGISTRY.gauge("envolve_lane_active", "Requests being served, per lane", ["lane"])
+LANE_REQUESTS = REGISTRY.counter(
+    "envolve_lane_requests_total", "Requests per lane by admission outcome", ["lane", "outcome"]
+)
+LANE_WAIT_SECONDS = REGISTRY.histogram("envolve_lane_wait_seconds", "Time spent queued before admission", ["lane"])
+
+
+@dataclass
+class LaneConfig:
+    concurrency: int
+    queue: int
+    max_wait: float
+
+    @classmethod
+    def from_env(cls, name: str, concurrency: int, queue: int, max_wait: float) -> "LaneConfig":
+        prefix = f"LANE_{name.upper()}_"
+        return cls(
+            concurrency=int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+            queue=int(os.getenv(prefix + "QUEUE", str(queue))),
+            max_wait=float(os.getenv(prefix + "MAX_WAIT", str(max_wait)))
+        )
+
+
+class LaneRejected(Exception):
+    def __init__(self, lane: str, status_code: int, retry_after: int, message: str):
+        super().__init__(message)
+        self.lane = lane
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Lane:
+    def __init__(self, name: str, config: LaneConfig):
+        self.name = name
+        self.config = config
+        self.queued = 0
+        self.active = 0
+        # Moving average of how long an admitted request holds its slot
+        self.service_seconds = 1.0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained, at least 1"""
+        backlog = self.queued + self.active
+        return max(1, math.ceil(backlog * self.service_seconds / max(1, self.config.concurrency)))
+
+    def _reject(self, status_code: int, outcome: str, message: str) -> LaneRejected:
+        LANE_REQUESTS.inc(lane=self.name, outcome=outcome)
+        return LaneRejected(self.name, status_code, self.retry_after(), message)
+
+    async def acquire(self) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.config.concurrency)
+        start = time.perf_counter()
+        if not self._semaphore.locked():
+            # A free slot is taken without suspending, so simultaneous arrivals see it as taken
+            await self._semaphore.acquire()
+        elif self.queued >= self.config.queue:
+            raise self._reject(429, "rejected_full", f"The {self.name} lane is full, retry later")
+        else:
+            self.queued += 1
+            LANE_QUEUED.set(self.queued, lane=self.name)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.config.max_wait)
+            except asyncio.TimeoutError:
+                raise self._reject(503, "rejected_timeout", f"Timed out waiting in the {self.name} lane, retry later")
+            finally:
+                self.queued -= 1
+                LANE_QUEUED.set(self.queued, lane=self.name)
+
+        waited = time.perf_counter() - start
+        LANE_WAIT_SECONDS.observe(waited, lane=self.name)
+        record("queue_wait", waited)
+        LANE_REQUESTS.inc(lane=self.name, outcome="admitted")
+        self.active += 1
+        LANE_ACTIVE.set(self.active, lane=self.name)
+
+    def release(self, service_seconds: float) -> None:
+        self.active -= 1
+        LANE_ACTIVE.set(self.active, lane=self.name)
+        self.service_seconds = 0.8 * self.service_seconds + 0.2 * service_seconds
+        self._semaphore.release()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that admits requests to routes[path]'s lane; other paths pass straight through"""
+
+    def __init__(self, app, lanes: Dict[str, Lane], routes: Dict[str, str]):
+        self.app = app
+        self.lanes = lanes
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        lane_name = self.routes.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if lane_name is None or scope.get("method") == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        lane = self.lanes[lane_name]
+        try:
+            await lane.acquire()
+        except LaneRejected as e:
+            await send_rejection(send, e)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release(time.perf_counter() - start)
+
+
+async def send_rejection(send, rejection: LaneRejected) -> None:
+    body = json.dumps({"error": str(rejection), "lane": rejection.lane}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": rejection.status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"retry-after", str(rejection.retry_after).encode("latin-1"))
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
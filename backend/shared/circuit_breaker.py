@@ -0,0 +1,205 @@
+"""
+Latency-aware circuit breaker for calls to slow or flaky providers (the LLM).
+
+CircuitBreaker.call awaits the wrapped call with a hard timeout. It keeps the
+latency and outcome of the last `window` calls. The breaker opens when, over
+at least min_calls calls, either:
+
+- the error rate (including timeouts) reaches max_error_rate
+- p90 latency is over latency_budget
+
+While open, call() raises CircuitOpenError straight away, so callers can
+return a local heuristic result. A background task probes the provider every
+probe_interval seconds (without a probe function, probe_interval simply
+elapses). A probe only shows the provider is reachable, not how fast it
+generates, so a passing probe moves the breaker to half-open rather than
+closed. Half-open lets up to close_after real calls through at a time; it
+closes once close_after of them in a row succeed within latency_budget, and
+reopens on the first one that fails or runs over.
+
+Settings come from <PREFIX>LATENCY_BUDGET, <PREFIX>TIMEOUT,
+<PREFIX>BREAKER_WINDOW, <PREFIX>BREAKER_MIN_CALLS,
+<PREFIX>BREAKER_ERROR_RATE, <PREFIX>BREAKER_PROBE_INTERVAL and
+<PREFIX>BREAKER_CLOSE_AFTER. State and outcomes per breaker are exported on
+REGISTRY.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Optional, Tuple
+
+from shared.tracing import REGISTRY
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 0.5}
+
+BREAKER_STATE = REGISTRY.gauge(
+    "envolve_circuit_open", "1 while the circuit breaker is open, 0.5 while half-open", ["breaker"]
+)
+BREAKER_CALLS = REGISTRY.counter(
+    "envolve_circuit_calls_total", "Calls through the circuit breaker by outcome", ["breaker", "outcome"]
+)
+BREAKER_TRANSITIONS = REGISTRY.counter(
+    "envolve_circuit_transitions_total", "Circuit breaker state changes", ["breaker", "state"]
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the breaker is open"""
+
+
+@dataclass
+class BreakerConfig:
+    latency_budget: float = 15.0
+    timeout: float = 30.0
+    window: int = 20
+    min_calls: int = 5
+    max_error_rate: float = 0.5
+    probe_interval: float = 15.0
+    close_after: int = 3
+
+    @classmethod
+    def from_env(cls, prefix: str, **defaults) -> "BreakerConfig":
+        config = cls(**defaults)
+        return cls(
+            latency_budget=float(os.getenv(prefix + "LATENCY_BUDGET", str(config.latency_budget))),
+            timeout=float(os.getenv(prefix + "TIMEOUT", str(config.timeout))),
+            window=int(os.getenv(prefix + "BREAKER_WINDOW", str(config.window))),
+            min_calls=int(os.getenv(prefix + "BREAKER_MIN_CALLS", str(config.min_calls))),
+            max_error_rate=float(os.getenv(prefix + "BREAKER_ERROR_RATE", str(config.max_error_rate))),
+            probe_interval=float(os.getenv(prefix + "BREAKER_PROBE_INTERVAL", str(config.probe_interval))),
+            close_after=int(os.getenv(prefix + "BREAKER_CLOSE_AFTER", str(config.close_after)))
+        )
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, config: BreakerConfig, probe: Optional[Callable[[], Awaitable[Any]]] = None):
+        self.name = name
+        self.config = config
+        self.probe = probe
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.reason = ""
+        # (seconds, ok) for recent calls
+        self._calls: Deque[Tuple[float, bool]] = deque(maxlen=config.window)
+        self._probe_task: Optional[asyncio.Task] = None
+        # Half-open bookkeeping: trial calls in flight and consecutive ones within budget
+        self._trials_running = 0
+        self._trial_successes = 0
+        BREAKER_STATE.set(0, breaker=name)
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await fn() within the timeout, or raise CircuitOpenError without calling it"""
+        if self.state == OPEN and self.probe is None:
+            if time.monotonic() - self.opened_at >= self.config.probe_interval:
+                self._half_open()
+        trial = self.state == HALF_OPEN
+        if self.state == OPEN or (trial and self._trials_running >= self.config.close_after):
+            BREAKER_CALLS.inc(breaker=self.name, outcome="rejected")
+            raise CircuitOpenError(f"{self.name} circuit {self.state}: {self.reason}")
+        if trial:
+            self._trials_running += 1
+
+        start = time.perf_counter()
+        outcome = "cancelled"
+        try:
+            result = await asyncio.wait_for(fn(), timeout=self.config.timeout)
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            # Runs for cancellation too (a BaseException), so a trial slot is always given back
+            if trial:
+                self._trials_running -= 1
+            if outcome == "cancelled":
+                # The caller gave up (client disconnect, overlapped pipeline); that says nothing about the provider
+                BREAKER_CALLS.inc(breaker=self.name, outcome=outcome)
+            else:
+                self._record(time.perf_counter() - start, outcome == "ok", outcome, trial)
+        return result
+
+    def _record(self, seconds: float, ok: bool, outcome: str, trial: bool = False) -> None:
+        BREAKER_CALLS.inc(breaker=self.name, outcome=outcome)
+        if trial:
+            if self.state != HALF_OPEN:
+                return
+            if not ok:
+                self._open(f"trial call failed ({outcome})")
+                return
+            if seconds > self.config.latency_budget:
+                self._open(f"trial call took {seconds:.1f}s, over {self.config.latency_budget:.1f}s budget")
+                return
+            self._trial_successes += 1
+            if self._trial_successes >= self.config.close_after:
+                self._close()
+            return
+        if self.state != CLOSED:
+            return
+        self._calls.append((seconds, ok))
+        reason = self._trip_reason()
+        if reason:
+            self._open(reason)
+
+    def _trip_reason(self) -> Optional[str]:
+        if len(self._calls) < self.config.min_calls:
+            return None
+        errors = sum(1 for _, ok in self._calls if not ok)
+        error_rate = errors / len(self._calls)
+        if error_rate >= self.config.max_error_rate:
+            return f"error rate {error_rate:.0%}"
+        latencies = sorted(seconds for seconds, ok in self._calls if ok)
+        if latencies:
+            p90 = latencies[min(len(latencies) - 1, int(0.9 * len(latencies)))]
+            if p90 > self.config.latency_budget:
+                return f"p90 latency {p90:.1f}s over {self.config.latency_budget:.1f}s budget"
+        return None
+
+    def _open(self, reason: str) -> None:
+        self.state = OPEN
+        self.reason = reason
+        self.opened_at = time.monotonic()
+        BREAKER_STATE.set(STATE_VALUES[OPEN], breaker=self.name)
+        BREAKER_TRANSITIONS.inc(breaker=self.name, state=OPEN)
+        print(f"{self.name} circuit opened: {reason}")
+        if self.probe is not None and (self._probe_task is None or self._probe_task.done()):
+            self._probe_task = asyncio.get_running_loop().create_task(self._probe_until_healthy())
+
+    def _half_open(self) -> None:
+        self.state = HALF_OPEN
+        self._trial_successes = 0
+        BREAKER_STATE.set(STATE_VALUES[HALF_OPEN], breaker=self.name)
+        BREAKER_TRANSITIONS.inc(breaker=self.name, state=HALF_OPEN)
+        print(f"{self.name} circuit half-open: closing after {self.config.close_after} calls within budget")
+
+    def _close(self) -> None:
+        self.state = CLOSED
+        self.reason = ""
+        self._calls.clear()
+        BREAKER_STATE.set(STATE_VALUES[CLOSED], breaker=self.name)
+        BREAKER_TRANSITIONS.inc(breaker=self.name, state=CLOSED)
+        print(f"{self.name} circuit closed")
+
+    async def _probe_until_healthy(self) -> None:
+        while self.state == OPEN:
+            await asyncio.sleep(self.config.probe_interval)
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(self.probe(), timeout=self.config.latency_budget)
+            except Exception as e:
+                BREAKER_CALLS.inc(breaker=self.name, outcome="probe_failed")
+                print(f"{self.name} probe failed: {e!r}")
+                continue
+            BREAKER_CALLS.inc(breaker=self.name, outcome="probe_ok")
+            print(f"{self.name} probe succeeded in {time.perf_counter() - start:.1f}s")
+            self._half_open()
+
+    def status(self) -> dict:
+        return {"state": self.state, "reason": self.reason, "recent_calls": len(self._calls)}
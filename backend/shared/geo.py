@@ -0,0 +1,158 @@
+"""
+Geospatial helpers: geohash cells, map tiles, great-circle distance and offline geocoding.
+
+Geohashes name nested lat/lon cells with base-32 strings, so every point in
+a cell shares the cell's prefix. A B-tree index on the hash column then works
+as a spatial grid: covering_cells lists the cells that cover a query box, and
+each cell is one index range scan.
+
+Gazetteer geocodes NYC locations offline, from a CSV of name,lat,lon rows
+(e.g. street intersections exported from NYC Planning's LION/CSCL data). Names
+and queries are normalized the same way: "W 116th Street & Broadway" and
+"Broadway and West 116 St, New York, NY" both become "116 st w & broadway".
+"""
+import csv
+import math
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_M = 6371008.8
+# Web-mercator tiles stop at the latitude where the projection becomes square
+MAX_MERCATOR_LATITUDE = 85.05112878
+# Sorts after every geohash character, so [cell, cell + "{") spans all hashes under cell
+PREFIX_END = "{"
+
+STREET_ABBREVIATIONS = {
+    "west": "w", "east": "e", "north": "n", "south": "s",
+    "street": "st", "str": "st", "avenue": "ave", "av": "ave", "boulevard": "blvd", "road": "rd",
+    "place": "pl", "drive": "dr", "parkway": "pkwy", "lane": "ln", "terrace": "ter", "square": "sq",
+    "highway": "hwy", "expressway": "expy", "saint": "st"
+}
+INTERSECTION_SEPARATORS = re.compile(r"\s*(?:&|/|\band\b|\bat\b|\bcorner of\b)\s*")
+ORDINAL = re.compile(r"\b(\d+)(?:st|nd|rd|th)\b")
+COORDINATES = re.compile(r"^\s*(-?\d{1,2}\.\d+)\s*,\s*(-?\d{1,3}\.\d+)\s*$")
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlambda = phi2 - phi1, math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def geohash_encode(lat: float, lon: float, precision: int = 9) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        target, span = (lon, lon_range) if even else (lat, lat_range)
+        mid = (span[0] + span[1]) / 2
+        value <<= 1
+        if target >= mid:
+            value |= 1
+            span[0] = mid
+        else:
+            span[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(height, width) in degrees of a geohash cell"""
+    lon_bits = math.ceil(5 * precision / 2)
+    lat_bits = 5 * precision - lon_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def bbox_around(lat: float, lon: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) enclosing a circle"""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlon = math.degrees(radius_m / (EARTH_RADIUS_M * max(math.cos(math.radians(lat)), 1e-6)))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def covering_cells(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                   max_cells: int = 16, max_precision: int = 9) -> List[str]:
+    """The finest geohash cells, at most max_cells of them, that together cover the box"""
+    for precision in range(max_precision, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor((max_lat + 90) / height) - math.floor((min_lat + 90) / height) + 1
+        cols = math.floor((max_lon + 180) / width) - math.floor((min_lon + 180) / width) + 1
+        if rows * cols <= max_cells or precision == 1:
+            break
+
+    cells = []
+    lat = (math.floor((min_lat + 90) / height) + 0.5) * height - 90
+    for _ in range(rows):
+        lon = (math.floor((min_lon + 180) / width) + 0.5) * width - 180
+        for _ in range(cols):
+            cells.append(geohash_encode(max(-90.0, min(90.0, lat)), ((lon + 180) % 360) - 180, precision))
+            lon += width
+        lat += height
+    return sorted(set(cells))
+
+
+def mercator_tile(lat: float, lon: float, z: int) -> Tuple[int, int]:
+    """(x, y) of the zoom-z web-mercator map tile containing a point"""
+    lat = max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, lat))
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(n - 1, max(0, x)), min(n - 1, max(0, y))
+
+
+def normalize_street(name: str) -> str:
+    name = ORDINAL.sub(r"\1", name.lower())
+    tokens = re.sub(r"[^a-z0-9 ]", " ", name).split()
+    return " ".join(sorted(STREET_ABBREVIATIONS.get(token, token) for token in tokens))
+
+
+def normalize_location(location: str) -> str:
+    """Order-insensitive key for a place or intersection; city/state after the first comma is dropped"""
+    place = location.split(",")[0]
+    streets = [normalize_street(part) for part in INTERSECTION_SEPARATORS.split(place.lower())]
+    return " & ".join(sorted(street for street in streets if street))
+
+
+def parse_coordinates(location: str) -> Optional[Tuple[float, float]]:
+    match = COORDINATES.match(location)
+    if not match:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
+class Gazetteer:
+    """Normalized place name -> (lat, lon), loaded once from CSV"""
+
+    def __init__(self, entries: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.entries = entries or {}
+
+    @classmethod
+    def from_csv(cls, path: str) -> "Gazetteer":
+        entries: Dict[str, Tuple[float, float]] = {}
+        if not Path(path).exists():
+            print(f"No gazetteer at {path}, only coordinate locations will geocode")
+            return cls(entries)
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                try:
+                    entries[normalize_location(row["name"])] = (float(row["lat"]), float(row["lon"]))
+                except (KeyError, ValueError):
+                    continue
+        print(f"Loaded {len(entries)} gazetteer entries from {path}")
+        return cls(entries)
+
+    def add(self, names: Iterable[str], lat: float, lon: float) -> None:
+        for name in names:
+            self.entries[normalize_location(name)] = (lat, lon)
+
+    def lookup(self, location: str) -> Optional[Tuple[float, float]]:
+        return self.entries.get(normalize_location(location))
@@ -0,0 +1,217 @@
+"""
+Incremental extraction of a JSON object from LLM output.
+
+The extractor makes a single pass over the text (or over a token stream, one
+chunk at a time) and tracks XML-style tags and JSON brace/string state
+together. Text inside skip tags such as <issue_analysis> is captured verbatim
+but never scanned for JSON, so braces in free-form reasoning can't derail
+parsing. When an answer tag such as <answer> is configured, objects found
+inside it take priority over objects found elsewhere.
+
+Candidates are validated against a small schema of {field: type(s)}; the
+first valid object is reported as soon as its closing brace arrives, which
+lets streaming callers stop reading early. If nothing valid turns up outside
+skip tags (say the model never closed <issue_analysis>), result() falls back
+to scanning the text inside them.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Longest tag we try to recognize before treating '<' as plain text
+MAX_TAG_LENGTH = 64
+
+
+class ExtractionError(ValueError):
+    """No valid JSON object could be extracted"""
+
+
+class SchemaError(ValueError):
+    """A JSON object did not match the expected schema"""
+
+
+def validate(obj: Any, schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Check that obj is a dict with every schema field present and of the right type"""
+    if not isinstance(obj, dict):
+        raise SchemaError(f"Expected a JSON object, got {type(obj).__name__}")
+    if not schema:
+        return obj
+    for field, expected in schema.items():
+        if field not in obj:
+            raise SchemaError(f"Missing field: {field}")
+        if not isinstance(obj[field], expected):
+            raise SchemaError(f"Field {field} has type {type(obj[field]).__name__}")
+    return obj
+
+
+class StreamingJSONExtractor:
+    def __init__(
+        self,
+        schema: Optional[Dict[str, Any]] = None,
+        skip_tags: Iterable[str] = (),
+        answer_tag: Optional[str] = None
+    ):
+        self.schema = schema
+        self.skip_tags = set(skip_tags)
+        self.answer_tag = answer_tag
+
+        self._tag_text: Dict[str, List[str]] = {}
+        self._scanned: List[str] = []  # text outside skip tags, kept for the fallback scan
+        self._candidates: List[Tuple[bool, Dict[str, Any]]] = []
+        self._errors: List[str] = []
+
+        self._current_tag: Optional[str] = None
+        self._pending_tag: Optional[List[str]] = None
+        self._reset_json_state()
+
+        self.complete = False
+        self.value: Optional[Dict[str, Any]] = None
+
+    def _reset_json_state(self) -> None:
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer: List[str] = []
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        """Consume a chunk of text; returns the extracted object once it is complete"""
+        for char in chunk:
+            if self._pending_tag is not None:
+                self._pending_tag.append(char)
+                if char == ">":
+                    self._close_pending_tag()
+                elif char == "<" or len(self._pending_tag) > MAX_TAG_LENGTH:
+                    # Not a tag after all; replay it as plain text (minus the new '<')
+                    text = "".join(self._pending_tag[:-1])
+                    self._pending_tag = None
+                    self._consume_text(text)
+                    if char == "<":
+                        self._pending_tag = ["<"]
+                    else:
+                        self._consume_text(char)
+                continue
+
+            if char == "<" and not self._in_string:
+                self._pending_tag = ["<"]
+                continue
+
+            self._consume_char(char)
+
+        return self.value if self.complete else None
+
+    def _close_pending_tag(self) -> None:
+        text = "".join(self._pending_tag)
+        self._pending_tag = None
+        name = text[1:-1].strip()
+        closing = name.startswith("/")
+        name = name.lstrip("/")
+
+        known = name in self.skip_tags or name == self.answer_tag
+        if not known or (closing and name != self._current_tag) or (not closing and self._current_tag in self.skip_tags):
+            self._consume_text(text)
+            return
+
+        self._current_tag = None if closing else name
+        self._tag_text.setdefault(name, [])
+        self._reset_json_state()
+
+    def _consume_text(self, text: str) -> None:
+        for char in text:
+            self._consume_char(char)
+
+    def _consume_char(self, char: str) -> None:
+        if self._current_tag is not None:
+            self._tag_text.setdefault(self._current_tag, []).append(char)
+            if self._current_tag in self.skip_tags:
+                return
+
+        self._scanned.append(char)
+
+        if self._depth == 0:
+            if char == "{":
+                self._depth = 1
+                self._buffer = [char]
+            return
+
+        self._buffer.append(char)
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+        elif char == '"':
+            self._in_string = True
+        elif char == "{":
+            self._depth += 1
+        elif char == "}":
+            self._depth -= 1
+            if self._depth == 0:
+                self._add_candidate("".join(self._buffer))
+                self._reset_json_state()
+
+    def _add_candidate(self, text: str) -> bool:
+        try:
+            obj = validate(json.loads(text), self.schema)
+        except (ValueError, SchemaError) as e:
+            self._errors.append(str(e))
+            return False
+
+        in_answer = self.answer_tag is not None and self._current_tag == self.answer_tag
+        self._candidates.append((in_answer, obj))
+        if not self.complete and (in_answer or self.answer_tag is None):
+            self.complete = True
+            self.value = obj
+        return True
+
+    def tag_text(self, name: str) -> str:
+        """Everything seen inside <name>...</name>, stripped"""
+        return "".join(self._tag_text.get(name, [])).strip()
+
+    def result(self) -> Dict[str, Any]:
+        """Best object seen so far: the first in the answer tag, else the last valid one anywhere"""
+        if self._pending_tag is not None:
+            # A '<' that never became a tag (e.g. "a < b") is plain text, along with everything after it
+            text = "".join(self._pending_tag)
+            self._pending_tag = None
+            self._consume_text(text)
+        if self.complete:
+            return self.value
+        if self._candidates:
+            return self._candidates[-1][1]
+
+        # Unbalanced braces can swallow a real object; retry from every '{' outside skip tags.
+        # A skip tag that never closes swallows the rest of the response, so its text comes next.
+        texts = ["".join(self._scanned)] + ["".join(self._tag_text[tag]) for tag in self.skip_tags if tag in self._tag_text]
+        for text in texts:
+            obj = self._scan(text)
+            if obj is not None:
+                return obj
+
+        detail = self._errors[-1] if self._errors else "no JSON object found"
+        raise ExtractionError(f"Could not extract JSON: {detail}")
+
+    def _scan(self, text: str) -> Optional[Dict[str, Any]]:
+        """First valid object starting at any '{' in text"""
+        decoder = json.JSONDecoder()
+        start = text.find("{")
+        while start >= 0:
+            try:
+                obj, _ = decoder.raw_decode(text, start)
+                return validate(obj, self.schema)
+            except (ValueError, SchemaError) as e:
+                self._errors.append(str(e))
+            start = text.find("{", start + 1)
+        return None
+
+
+def extract_json(
+    text: str,
+    schema: Optional[Dict[str, Any]] = None,
+    skip_tags: Iterable[str] = (),
+    answer_tag: Optional[str] = None
+) -> Dict[str, Any]:
+    """Extract and validate a JSON object from a complete response"""
+    extractor = StreamingJSONExtractor(schema=schema, skip_tags=skip_tags, answer_tag=answer_tag)
+    extractor.feed(text)
+    return extractor.result()
@@ -0,0 +1,244 @@
+"""
+Append-only, batched Parquet logs for analytics.
+
+ParquetLog buffers records in memory and writes them out as new Parquet files.
+append() only adds to the buffer. A daemon writer thread, started on the first
+append, flushes every batch_rows records or flush_seconds, whichever comes
+first, and compacts every compact_seconds, so callers never wait on Parquet
+I/O. close() stops the thread and writes what is left.
+Files are partitioned by the hour of each record's `ts`:
+
+    <root>/<dataset>/date=2026-10-19/hour=14/part-<time>-<writer>-<id>.parquet
+
+Existing files are never modified. Compaction merges the parts this writer
+wrote for a finished hour into one file that names its sources in the Parquet
+metadata. A writer never touches another writer's parts: on a Modal Volume each
+container has its own copy of the files, so no lock can stop two containers
+from merging the same parts and double-counting them. Parts left by a writer
+that stopped before compacting stay as they are. Readers skip
+any file named by a compacted file, so a crash between writing the merge and
+deleting its sources can't double-count. read_dataset is the query helper:
+it prunes partitions by time and returns one pyarrow Table.
+
+pyarrow is imported lazily. Without it the log prints a warning once and
+drops records, so the services still run.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+COMPACTED_FROM_KEY = b"envolve.compacted_from"
+
+
+def load_pyarrow():
+    """(pyarrow, pyarrow.parquet), or None if pyarrow isn't installed"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow, pyarrow.parquet
+
+
+def partition_dir(dataset_dir: Path, ts: float) -> Path:
+    moment = datetime.fromtimestamp(ts, tz=timezone.utc)
+    return dataset_dir / f"date={moment:%Y-%m-%d}" / f"hour={moment:%H}"
+
+
+def partition_start(path: Path) -> Optional[float]:
+    """Start time of an hour partition directory, or None if it isn't one"""
+    try:
+        date = path.parent.name.split("=", 1)[1]
+        hour = int(path.name.split("=", 1)[1])
+        day = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except (IndexError, ValueError):
+        return None
+    return day.timestamp() + hour * 3600
+
+
+def partitions(dataset_dir: Path, since: Optional[float] = None, until: Optional[float] = None) -> List[Path]:
+    """Hour partitions overlapping [since, until), oldest first"""
+    found = []
+    for path in dataset_dir.glob("date=*/hour=*"):
+        start = partition_start(path)
+        if start is None:
+            continue
+        if since is not None and start + 3600 <= since:
+            continue
+        if until is not None and start >= until:
+            continue
+        found.append((start, path))
+    return [path for _, path in sorted(found)]
+
+
+def live_files(partition: Path, parquet, files: Optional[List[Path]] = None) -> List[Path]:
+    """Parquet files in a partition, minus those already merged into a compacted file"""
+    files = files if files is not None else sorted(partition.glob("*.parquet"))
+    replaced: Set[str] = set()
+    for path in files:
+        if path.name.startswith("compacted-"):
+            metadata = parquet.read_schema(path).metadata or {}
+            replaced.update(json.loads(metadata.get(COMPACTED_FROM_KEY, b"[]")))
+    return [path for path in files if path.name not in replaced]
+
+
+class ParquetLog:
+    def __init__(self, root: str, dataset: str, schema: Callable[[Any], Any], batch_rows: int = 500,
+                 flush_seconds: float = 60.0, compact_seconds: float = 3600.0):
+        """schema(pyarrow) builds the dataset's pyarrow schema, which must have a timestamp `ts` column"""
+        self.dataset_dir = Path(root) / dataset
+        self.schema_fn = schema
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self.compact_seconds = compact_seconds
+        # Tags this instance's part files, the only ones its compaction merges
+        self.writer_id = uuid.uuid4().hex[:8]
+        self._rows: List[Dict[str, Any]] = []
+        self._last_compact = time.monotonic()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._arrow = load_pyarrow()
+        self._schema = None
+        if self._arrow is None:
+            print(f"pyarrow is not installed, records for {self.dataset_dir} will be dropped")
+
+    @classmethod
+    def from_env(cls, root: str, dataset: str, schema: Callable[[Any], Any]) -> "ParquetLog":
+        return cls(
+            root,
+            dataset,
+            schema,
+            batch_rows=int(os.getenv("PARQUET_LOG_BATCH_ROWS", "500")),
+            flush_seconds=float(os.getenv("PARQUET_LOG_FLUSH_SECONDS", "60")),
+            compact_seconds=float(os.getenv("PARQUET_LOG_COMPACT_SECONDS", "3600"))
+        )
+
+    @property
+    def schema(self):
+        if self._schema is None:
+            self._schema = self.schema_fn(self._arrow[0])
+        return self._schema
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Buffer one record for the writer thread"""
+        if self._arrow is None or self._stopped.is_set():
+            return
+        with self._lock:
+            self._rows.append(record)
+            full = len(self._rows) >= self.batch_rows
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name=f"parquet-log-{self.dataset_dir.name}",
+                                                daemon=True)
+                self._writer.start()
+        if full:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            # Woken early when a batch fills up, otherwise flushes on the timer
+            self._wake.wait(timeout=self.flush_seconds)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.flush()
+                if time.monotonic() - self._last_compact >= self.compact_seconds:
+                    self._last_compact = time.monotonic()
+                    self.compact()
+            except Exception as e:
+                print(f"Failed to write {self.dataset_dir}: {e}")
+
+    def close(self) -> None:
+        """Stop the writer thread and flush the remaining records"""
+        self._stopped.set()
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join()
+        self.flush()
+
+    def flush(self) -> int:
+        """Write buffered records as one new file per hour partition; returns the number written"""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows or self._arrow is None:
+            return 0
+
+        pyarrow, parquet = self._arrow
+        by_partition: Dict[Path, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_partition.setdefault(partition_dir(self.dataset_dir, row["ts"].timestamp()), []).append(row)
+        for partition, partition_rows in by_partition.items():
+            table = pyarrow.Table.from_pylist(partition_rows, schema=self.schema)
+            self._write(partition, f"part-{int(time.time() * 1000)}-{self.writer_id}-{uuid.uuid4().hex[:8]}.parquet", table)
+        return len(rows)
+
+    def _write(self, partition: Path, name: str, table) -> Path:
+        """Write a file under a temporary name first, so readers never see a partial file"""
+        partition.mkdir(parents=True, exist_ok=True)
+        path = partition / name
+        tmp_path = partition / f".{name}.tmp"
+        self._arrow[1].write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+        return path
+
+    def compact(self, finished_before: Optional[float] = None) -> int:
+        """Merge this writer's parts in each hour partition ending before finished_before; returns how many were merged"""
+        if self._arrow is None:
+            return 0
+        pyarrow, parquet = self._arrow
+        # By default, hours that this writer can no longer have buffered records for
+        finished_before = finished_before if finished_before is not None else time.time() - 2 * self.flush_seconds
+        merged = 0
+        for partition in partitions(self.dataset_dir, until=finished_before - 3600):
+            files = sorted(partition.glob(f"part-*-{self.writer_id}-*.parquet"))
+            if len(files) < 2:
+                continue
+            try:
+                table = pyarrow.concat_tables([
+                    parquet.read_table(path).replace_schema_metadata(None) for path in files
+                ]).sort_by("ts")
+                sources = [path.name for path in files]
+                metadata = {COMPACTED_FROM_KEY: json.dumps(sources).encode("utf-8")}
+                self._write(partition, f"compacted-{int(time.time() * 1000)}-{self.writer_id}.parquet",
+                            table.replace_schema_metadata(metadata))
+                for name in sources:
+                    (partition / name).unlink(missing_ok=True)
+                merged += 1
+            except Exception as e:
+                print(f"Failed to compact {partition}: {e}")
+        return merged
+
+
+def read_dataset(root: str, dataset: str, since: Optional[float] = None, until: Optional[float] = None,
+                 columns: Optional[List[str]] = None):
+    """Records with since <= ts < until as one pyarrow Table (None if there are none)"""
+    arrow = load_pyarrow()
+    if arrow is None:
+        raise RuntimeError("Reading Parquet logs needs pyarrow (pip install pyarrow)")
+    pyarrow, parquet = arrow
+    import pyarrow.compute as pc
+
+    read_columns = None if columns is None else sorted(set(columns) | {"ts"})
+    tables = [
+        parquet.read_table(path, columns=read_columns).replace_schema_metadata(None)
+        for partition in partitions(Path(root) / dataset, since, until)
+        for path in live_files(partition, parquet)
+    ]
+    if not tables:
+        return None
+    table = pyarrow.concat_tables(tables)
+    ts_type = table.schema.field("ts").type
+    if since is not None:
+        since_ts = pyarrow.scalar(datetime.fromtimestamp(since, tz=timezone.utc), type=ts_type)
+        table = table.filter(pc.greater_equal(table["ts"], since_ts))
+    if until is not None:
+        until_ts = pyarrow.scalar(datetime.fromtimestamp(until, tz=timezone.utc), type=ts_type)
+        table = table.filter(pc.less(table["ts"], until_ts))
+    return table.select(columns) if columns is not None else table
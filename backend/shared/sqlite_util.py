@@ -0,0 +1,49 @@
+"""
+SQLite helpers shared by the on-disk stores.
+
+Connections use WAL journaling so readers never block the single writer, a
+busy timeout so concurrent writers from several workers wait instead of
+failing, and one connection per thread since sqlite3 connections must not
+be shared across threads.
+
+Stores call wrote() after each committed write. on_write then publishes the
+file, e.g. VolumeSync.commit for a database on a Modal Volume.
+"""
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+
+def connect(path: str, busy_timeout_ms: int = 5000) -> sqlite3.Connection:
+    if path != ":memory:":
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+    # Autocommit mode; multi-statement updates open their own transactions
+    conn = sqlite3.connect(path, timeout=busy_timeout_ms / 1000, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+    return conn
+
+
+class ThreadLocalConnections:
+    """Hands out one connection per thread for a given database path"""
+
+    def __init__(self, path: str, schema: str = "", on_write: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.on_write = on_write
+        self._local = threading.local()
+        if schema:
+            self.get().executescript(schema)
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def wrote(self) -> None:
+        if self.on_write is not None:
+            self.on_write()
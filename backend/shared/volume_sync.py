@@ -0,0 +1,69 @@
+"""
+Keeping SQLite stores on a Modal Volume durable.
+
+A Volume is not a shared disk. Each container works on its own copy, and
+commit() publishes that container's files, the last commit winning per file.
+A database on a Volume is therefore only consistent with a single writer, so
+functions that own one run with max_containers=1. VolumeSync.commit runs after
+every write, so a replacement container (after a crash, deploy or scale-down)
+starts from the latest state. The owner never needs reload(): no other
+container writes the files, and a reload can't run while the database is open.
+
+Stores used from an event loop pass commit_later instead: the commit (a
+blocking network round trip) then runs on VolumeSync's own thread and never
+holds up the write or the loop.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+
+class VolumeSync:
+    def __init__(self, volume=None):
+        """volume=None (running outside Modal) makes commit a no-op"""
+        self.volume = volume
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._requested = 0
+        self._committed = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def commit(self) -> None:
+        """Commit the Volume, covering every write made before the call; concurrent callers share one commit"""
+        if self.volume is None:
+            return
+        with self._lock:
+            self._requested += 1
+            wanted = self._requested
+        with self._commit_lock:
+            if self._committed >= wanted:
+                # A commit that started after our write already covered it
+                return
+            with self._lock:
+                covered = self._requested
+            self.volume.commit()
+            self._committed = covered
+
+    def commit_later(self) -> None:
+        """Start commit() on a background thread and return at once"""
+        if self.volume is None:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="volume-commit")
+        self._executor.submit(self._commit_logged)
+
+    def _commit_logged(self) -> None:
+        try:
+            self.commit()
+        except Exception as e:
+            # The next write commits again, covering this one
+            print(f"Volume commit failed: {e}")
+
+
+def volume_sync(volume, local: Optional[bool] = None) -> VolumeSync:
+    """A VolumeSync for volume inside a Modal container, a no-op one when run locally (e.g. load tests)"""
+    import modal
+
+    local = modal.is_local() if local is None else local
+    return VolumeSync(None if local else volume)
@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# Services import shared.* from backend/ and their sibling modules by bare name
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+for path in (BACKEND_DIR, BACKEND_DIR / "hume"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
@@ -0,0 +1,35 @@
+import asyncio
+
+from call_scheduler import CallScheduler
+
+
+def test_finished_groups_are_reported_and_can_be_forgotten():
+    async def run():
+        done = []
+        sids = iter(["CA1", "CA2"])
+
+        async def dial(group):
+            return {"call_sid": next(sids)}
+
+        scheduler = CallScheduler(dial, max_concurrent_calls=2, calls_per_second=100, burst=2,
+                                  merge_window=0, on_group_done=done.append)
+        scheduler.start()
+        first = scheduler.submit({"n": 1}, "Pier 39", "311")
+        second = scheduler.submit({"n": 2}, "Ocean Beach", "311")
+        while len(scheduler._active) < 2:
+            await asyncio.sleep(0.01)
+
+        assert scheduler.call_ended("CA1", "completed")
+        assert done == [first]
+        # Still in progress, so forget keeps it
+        scheduler.forget([first.id, second.id])
+        assert list(scheduler.groups) == [second.id]
+
+        scheduler.call_ended("CA2", "no-answer")
+        await scheduler.drain()
+        assert [group.status for group in done] == ["completed", "failed"]
+        scheduler.forget([second.id])
+        assert scheduler.groups == {}
+        await scheduler.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,17 @@
+from call_store import CallStore
+
+
+def test_pages_do_not_skip_calls_sharing_a_timestamp(tmp_path, monkeypatch):
+    store = CallStore(str(tmp_path / "calls.db"))
+    monkeypatch.setattr("call_store.time.time", lambda: 1000.0)
+    for i in range(5):
+        store.insert(f"CA{i}", "queued", {"location": "Pier 39"})
+
+    seen, before = [], None
+    while True:
+        page = store.list(before=before, limit=2)
+        seen += [call["call_sid"] for call in page["calls"]]
+        before = page["next_before"]
+        if before is None:
+            break
+    assert seen == ["CA4", "CA3", "CA2", "CA1", "CA0"]
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from shared.circuit_breaker import CLOSED, HALF_OPEN, OPEN, BreakerConfig, CircuitBreaker, CircuitOpenError
+
+
+def make_breaker(probe=None, **overrides):
+    settings = dict(latency_budget=0.05, timeout=1.0, window=5, min_calls=2, probe_interval=0.05, close_after=2)
+    settings.update(overrides)
+    return CircuitBreaker("test", BreakerConfig(**settings), probe=probe)
+
+
+async def slow():
+    await asyncio.sleep(0.1)
+
+
+async def fast():
+    return "ok"
+
+
+async def failing():
+    raise RuntimeError("provider down")
+
+
+async def trip(breaker):
+    for _ in range(breaker.config.min_calls):
+        with pytest.raises(RuntimeError):
+            await breaker.call(failing)
+    assert breaker.state == OPEN
+
+
+def test_opens_on_error_rate_and_rejects():
+    async def run():
+        breaker = make_breaker()
+        await trip(breaker)
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(fast)
+
+    asyncio.run(run())
+
+
+def test_opens_on_slow_p90():
+    async def run():
+        breaker = make_breaker()
+        for _ in range(2):
+            await breaker.call(slow)
+        assert breaker.state == OPEN
+
+    asyncio.run(run())
+
+
+def test_probe_only_half_opens_and_real_calls_close():
+    async def run():
+        async def probe():
+            return None
+
+        breaker = make_breaker(probe=probe)
+        await trip(breaker)
+        await asyncio.sleep(0.1)
+        assert breaker.state == HALF_OPEN
+        assert await breaker.call(fast) == "ok"
+        assert breaker.state == HALF_OPEN
+        await breaker.call(fast)
+        assert breaker.state == CLOSED
+
+    asyncio.run(run())
+
+
+def test_slow_trial_reopens():
+    async def run():
+        breaker = make_breaker()
+        await trip(breaker)
+        await asyncio.sleep(0.06)
+        await breaker.call(slow)
+        assert breaker.state == OPEN
+
+    asyncio.run(run())
+
+
+def test_half_open_limits_concurrent_trials():
+    async def run():
+        breaker = make_breaker()
+        await trip(breaker)
+        await asyncio.sleep(0.06)
+        results = await asyncio.gather(*(breaker.call(fast) for _ in range(3)), return_exceptions=True)
+        assert [type(r).__name__ for r in results] == ["str", "str", "CircuitOpenError"]
+        assert breaker.state == CLOSED
+
+    asyncio.run(run())
+
+
+def test_cancelled_trials_give_their_slot_back():
+    async def run():
+        breaker = make_breaker()
+        await trip(breaker)
+        await asyncio.sleep(0.06)
+        # More cancelled trials than close_after used to leave the breaker rejecting forever
+        for _ in range(breaker.config.close_after + 1):
+            task = asyncio.create_task(breaker.call(slow))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        assert breaker.state == HALF_OPEN
+        assert breaker._trials_running == 0
+        await breaker.call(fast)
+        await breaker.call(fast)
+        assert breaker.state == CLOSED
+
+    asyncio.run(run())
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from job_queue import JobQueue, JobWorker, RetryableError
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), retry_base_delay=0)
+
+
+def run_until_idle(queue, handler, kind="report"):
+    worker = JobWorker(queue, {kind: handler})
+
+    async def drain():
+        while (job := await asyncio.to_thread(queue.claim, worker.worker_id)) is not None:
+            await worker.run_job(job)
+
+    asyncio.run(drain())
+
+
+def test_stage_that_succeeds_on_last_attempt_leaves_next_stage_its_retries(queue):
+    job, _ = queue.enqueue("report", {}, "analyze", max_attempts=2)
+    runs = []
+
+    async def handler(job, q):
+        if job["stage"] == "analyze":
+            runs.append(("analyze", job["attempts"]))
+            if job["attempts"] < 2:
+                raise RetryableError("analysis timed out")
+            await asyncio.to_thread(q.save_stage, job, "call", {"analysis": "ok"})
+        # Like the real handler, the call stage runs in the same claim as a successful analyze
+        runs.append(("call", job["attempts"]))
+        raise RetryableError("line busy")
+
+    run_until_idle(queue, handler)
+    assert runs == [("analyze", 1), ("analyze", 2), ("call", 1), ("call", 2)]
+    job = queue.get(job["id"])
+    assert (job["stage"], job["status"], job["result"]) == ("call", "failed", {"analysis": "ok"})
+
+
+def test_repeated_idempotency_key_returns_existing_job(queue):
+    job, created = queue.enqueue("report", {"n": 1}, "analyze", idempotency_key="issue-1")
+    again, created_again = queue.enqueue("report", {"n": 2}, "analyze", idempotency_key="issue-1")
+    assert (created, created_again) == (True, False)
+    assert again["id"] == job["id"] and again["payload"] == {"n": 1}
+
+
+def test_retryable_failures_back_off_until_attempts_run_out(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), retry_base_delay=10)
+    job, _ = queue.enqueue("report", {}, "analyze", max_attempts=2)
+    job = queue.claim("w1")
+    queue.fail(job, "timeout")
+    job = queue.get(job["id"])
+    assert job["status"] == "queued" and job["next_run_at"] >= job["updated_at"] + 10
+    assert queue.claim("w1") is None
+
+    queue.connections.get().execute("UPDATE jobs SET next_run_at = 0")
+    job = queue.claim("w1")
+    assert job["attempts"] == 2
+    queue.fail(job, "timeout")
+    assert queue.get(job["id"])["status"] == "failed"
+
+
+def test_non_retryable_failure_is_final(queue):
+    job, _ = queue.enqueue("report", {}, "analyze", max_attempts=3)
+    queue.fail(queue.claim("w1"), "bad payload", retryable=False)
+    job = queue.get(job["id"])
+    assert (job["status"], job["error"]) == ("failed", "bad payload")
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), lease_seconds=-1)
+    job, _ = queue.enqueue("report", {}, "analyze")
+    assert queue.claim("crashed")["id"] == job["id"]
+    reclaimed = queue.claim("w2")
+    assert (reclaimed["id"], reclaimed["worker_id"], reclaimed["attempts"]) == (job["id"], "w2", 2)
+
+
+def test_defer_does_not_use_an_attempt(queue):
+    job, _ = queue.enqueue("report", {}, "collect", max_attempts=1)
+    for _ in range(3):
+        job = queue.claim("w1")
+        assert job["attempts"] == 1
+        queue.defer(job, 0, {"polls": job["result"].get("polls", 0) + 1})
+    assert queue.get(job["id"])["result"] == {"polls": 3}
+
+
+def test_saved_items_keep_their_first_result(queue):
+    job, _ = queue.enqueue("analyze_batch", {}, "collect")
+    queue.save_items(job["id"], [(0, "succeeded", {"a": 1}), (1, "failed", {"error": "x"})])
+    queue.save_items(job["id"], [(1, "succeeded", {"a": 2}), (2, "succeeded", {"a": 3})])
+    assert queue.item_indexes(job["id"]) == {0, 1, 2}
+    assert queue.item_counts(job["id"]) == {"succeeded": 2, "failed": 1}
+    assert queue.items(job["id"], offset=1, limit=1) == {1: ("failed", {"error": "x"})}
+
+
+def test_batch_job_dispatches_chunks_and_collects_every_item(queue):
+    from batch_jobs import InlineDispatcher, LocalBackend, make_analyze_batch_handler
+
+    issues = [
+        {"title": title, "description": "", "severity": "low", "tags": "", "location": "Pier 39"}
+        for title in ["Pothole", "Illegal dumping", "Blocked drain", "Graffiti", "Broken street light"]
+    ]
+    dispatcher = InlineDispatcher(lambda backend, items: LocalBackend(latency=0.01).run(items))
+    # One attempt only: waiting on chunks must not use it up
+    job, _ = queue.enqueue("analyze_batch", {"backend": "local", "issues": issues}, "dispatch", max_attempts=1)
+    handler = make_analyze_batch_handler(dispatcher, chunk_size=2, poll_interval=0)
+
+    run_until_idle(queue, handler, kind="analyze_batch")
+    job = queue.get(job["id"])
+    assert (job["status"], len(job["result"]["calls"])) == ("completed", 3)
+    items = queue.items(job["id"])
+    assert sorted(items) == [0, 1, 2, 3, 4]
+    organizations = [items[i][1]["recommendation"]["selectedOrganization"] for i in range(5)]
+    assert organizations == [
+        "NYC Department of Transportation", "NYC Department of Sanitation",
+        "NYC Department of Environmental Protection", "NYC 311 Service", "NYC Department of Transportation"
+    ]
@@ -0,0 +1,48 @@
+import pytest
+
+from shared.llm_json import ExtractionError, StreamingJSONExtractor, extract_json
+
+SCHEMA = {"a": int}
+
+
+def test_object_after_unclosed_angle_bracket():
+    assert extract_json('a < b and {"a":1}', SCHEMA) == {"a": 1}
+
+
+def test_unclosed_angle_bracket_streamed():
+    extractor = StreamingJSONExtractor(schema=SCHEMA)
+    for chunk in ['score < 5 ', 'so {"a"', ': 2}']:
+        extractor.feed(chunk)
+    assert extractor.result() == {"a": 2}
+
+
+def test_braces_in_skip_tag_are_ignored():
+    text = '<issue_analysis>{not json} {"a": 5}</issue_analysis>{"a": 1}'
+    assert extract_json(text, SCHEMA, skip_tags=["issue_analysis"]) == {"a": 1}
+
+
+def test_unclosed_skip_tag_falls_back_to_its_text():
+    text = '<issue_analysis>reasoning {x} then {"a": 3}'
+    assert extract_json(text, SCHEMA, skip_tags=["issue_analysis"]) == {"a": 3}
+
+
+def test_answer_tag_wins_over_earlier_objects():
+    text = '{"a": 1} <answer>{"a": 2}</answer>'
+    assert extract_json(text, SCHEMA, answer_tag="answer") == {"a": 2}
+
+
+def test_stream_completes_when_answer_closes():
+    extractor = StreamingJSONExtractor(schema=SCHEMA, answer_tag="answer")
+    assert extractor.feed('<answer>{"a": ') is None
+    assert extractor.feed('7}') == {"a": 7}
+    assert extractor.complete
+
+
+def test_schema_mismatch_raises():
+    with pytest.raises(ExtractionError):
+        extract_json('{"a": "text"}', SCHEMA)
+
+
+def test_no_object_raises():
+    with pytest.raises(ExtractionError):
+        extract_json("<issue_analysis>nothing here", SCHEMA, skip_tags=["issue_analysis"])
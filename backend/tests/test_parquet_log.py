@@ -0,0 +1,49 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from shared.parquet_log import COMPACTED_FROM_KEY, ParquetLog, read_dataset
+
+
+def schema(pyarrow):
+    return pyarrow.schema([("ts", pyarrow.timestamp("ms", tz="UTC")), ("n", pyarrow.int64())])
+
+
+def write_parts(log, ts, values):
+    for n in values:
+        log.append({"ts": ts, "n": n})
+        log.flush()
+
+
+def test_writers_compact_only_their_own_parts(tmp_path):
+    ts = datetime.now(timezone.utc) - timedelta(hours=3)
+    # Two containers logging into the same hour partition
+    first = ParquetLog(str(tmp_path), "requests", schema)
+    second = ParquetLog(str(tmp_path), "requests", schema)
+    write_parts(first, ts, [1, 2])
+    write_parts(second, ts, [3, 4])
+
+    assert first.compact() == 1
+    assert second.compact() == 1
+    assert first.compact() == 0
+
+    table = read_dataset(str(tmp_path), "requests")
+    assert sorted(table["n"].to_pylist()) == [1, 2, 3, 4]
+
+    import pyarrow.parquet as parquet
+    compacted = sorted(tmp_path.glob("requests/date=*/hour=*/compacted-*.parquet"))
+    assert len(compacted) == 2
+    for path in compacted:
+        writer = path.stem.rsplit("-", 1)[1]
+        sources = json.loads(parquet.read_schema(path).metadata[COMPACTED_FROM_KEY])
+        assert len(sources) == 2 and all(f"-{writer}-" in name for name in sources)
+
+
+def test_compact_leaves_current_hour_alone(tmp_path):
+    log = ParquetLog(str(tmp_path), "requests", schema)
+    write_parts(log, datetime.now(timezone.utc), [1, 2])
+    assert log.compact() == 0
+    assert sorted(read_dataset(str(tmp_path), "requests")["n"].to_pylist()) == [1, 2]
@@ -90,6 +90,8 @@ export function ImageCaptureDialog() {
   const lastDetectionTime = useRef<number>(0);
   const [latestDetections, setLatestDetections] = useState(null);
   const videoReadyRef = useRef(false); // Track if video is really ready
+  // Lets the detection API skip frames identical to this session's previous one
+  const [clientId] = useState(() => crypto.randomUUID());
 
   // Reset state when dialog closes
   const handleOpenChange = (open: boolean) => {
@@ -324,7 +326,7 @@ export function ImageCaptureDialog() {
       // Use Modal API
       if (DETECTION_API_URL) {
         const response = await fetch(
-          `${DETECTION_API_URL}/detect?conf_env=${CONFIDENCE_THRESHOLD}&conf_coco=${CONFIDENCE_THRESHOLD}`,
+          `${DETECTION_API_URL}/detect?conf_env=${CONFIDENCE_THRESHOLD}&conf_coco=${CONFIDENCE_THRESHOLD}&client_id=${clientId}`,
           {
             method: "POST",
             body: frameDataUrl,
@@ -366,7 +368,7 @@ export function ImageCaptureDialog() {
     } finally {
       setIsDetecting(false);
     }
-  }, [cameraActive, captureFrame, detectionEnabled, isDetecting]);
+  }, [cameraActive, captureFrame, clientId, detectionEnabled, isDetecting]);
 
   const scheduleNextDetection = useCallback(() => {
     if (detectionTimeoutRef.current) {